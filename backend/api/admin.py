@@ -1,7 +1,7 @@
 from django.contrib import admin
 from .models import (
     ConversationSession, Message, EmotionalState,
-    CBTContent, CBTProgress, Analytics, CrisisResource
+    CBTContent, CBTProgress, Analytics, CrisisResource, PlatformMetricsSnapshot, MessageArchive
 )
 
 
@@ -46,11 +46,25 @@ class CBTProgressAdmin(admin.ModelAdmin):
 
 @admin.register(Analytics)
 class AnalyticsAdmin(admin.ModelAdmin):
-    list_display = ['id', 'user', 'date', 'total_sessions', 'total_messages', 'risk_events']
+    list_display = ['id', 'user', 'date', 'total_sessions', 'total_messages', 'mood_entries', 'risk_events', 'updated_at']
     list_filter = ['date']
     search_fields = ['user__username']
 
 
+@admin.register(PlatformMetricsSnapshot)
+class PlatformMetricsSnapshotAdmin(admin.ModelAdmin):
+    list_display = ['date', 'sessions_started', 'messages', 'high_risk_messages', 'mood_entries', 'updated_at']
+    date_hierarchy = 'date'
+
+
+@admin.register(MessageArchive)
+class MessageArchiveAdmin(admin.ModelAdmin):
+    list_display = ['session', 'user', 'message_count', 'last_message_at', 'archived_at', 'rehydrated_at']
+    list_filter = ['archived_at']
+    search_fields = ['user__username']
+    exclude = ['data']
+
+
 @admin.register(CrisisResource)
 class CrisisResourceAdmin(admin.ModelAdmin):
     list_display = ['id', 'title', 'is_emergency', 'order', 'is_active']
@@ -0,0 +1,309 @@
+"""
+Platform-wide metrics for the admin dashboard
+
+Daily totals are kept in PlatformMetricsSnapshot rows, refreshed
+incrementally by a periodic task (refresh_platform_snapshots). The
+dashboard reads the stored rows and computes only the last few days live,
+so its cost does not grow with platform volume. Any range of days is
+computed with one grouped query per table. Distinct users (active, crisis)
+are counted exactly per day and merged across days with HyperLogLog
+sketches (about 1.6% standard error; exact_distinct_users for audits).
+The engagement leaderboard ranks users by their per-user daily rollups
+(Analytics).
+"""
+import base64
+import json
+from collections import Counter, defaultdict
+from datetime import date, datetime, time, timedelta
+from typing import Dict, List, Optional, Tuple
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Max, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from .archive import archived_rows
+from .hyperloglog import HyperLogLog
+from .models import Analytics, ConversationSession, EmotionalState, Message, PlatformMetricsSnapshot
+from .rollups import day_bounds
+
+# Leaderboard sort keys (period totals of the per-user daily rollups)
+LEADERBOARD_SORTS = ('sessions', 'messages', 'risk_events')
+
+# Recent days still change (sessions end, late writes), so they are always
+# recomputed, both by the refresh task and live by the dashboard
+SETTLE_DAYS = 2
+
+SNAPSHOT_FIELDS = (
+    'sessions_started', 'sessions_completed', 'session_duration_sum', 'active_users',
+    'active_users_sketch', 'new_users', 'messages', 'sentiment_sum', 'sentiment_count',
+    'high_risk_messages', 'crisis_users', 'crisis_users_sketch', 'mood_entries',
+    'intensity_sum', 'mood_counts',
+)
+
+
+def _empty_day() -> Dict:
+    return {
+        'sessions_started': 0, 'sessions_completed': 0, 'session_duration_sum': 0.0,
+        'new_users': 0, 'messages': 0, 'sentiment_sum': 0.0, 'sentiment_count': 0,
+        'high_risk_messages': 0, 'mood_entries': 0, 'intensity_sum': 0, 'mood_counts': {},
+    }
+
+
+def compute_days(first_day: date, last_day: date) -> Dict[date, Dict]:
+    """Snapshot field values for every local day in [first_day, last_day] from raw rows (not saved)"""
+    days = {
+        first_day + timedelta(days=offset): _empty_day()
+        for offset in range((last_day - first_day).days + 1)
+    }
+    start, end = day_bounds(first_day, last_day)
+
+    sessions = ConversationSession.objects.filter(
+        started_at__gte=start, started_at__lt=end
+    ).annotate(day=TruncDate('started_at'))
+    completed = Q(ended_at__isnull=False)
+    for row in sessions.values('day').annotate(
+        started=Count('id'),
+        completed=Count('id', filter=completed),
+        duration=Sum(ExpressionWrapper(F('ended_at') - F('started_at'), output_field=DurationField()),
+                     filter=completed),
+    ).order_by():
+        day = days[row['day']]
+        day['sessions_started'] = row['started']
+        day['sessions_completed'] = row['completed']
+        day['session_duration_sum'] = row['duration'].total_seconds() if row['duration'] else 0.0
+    active_users = defaultdict(list)
+    for day, user_id in sessions.values_list('day', 'user_id').distinct().order_by():
+        active_users[day].append(user_id)
+
+    messages = Message.objects.filter(
+        created_at__gte=start, created_at__lt=end
+    ).annotate(day=TruncDate('created_at'))
+    user_only = Q(sender='user')
+    for row in messages.values('day').annotate(
+        total=Count('id'),
+        sentiment_sum=Sum('sentiment_score', filter=user_only),
+        sentiment_count=Count('sentiment_score', filter=user_only),
+        high_risk=Count('id', filter=Q(risk_level__gte=7)),
+    ).order_by():
+        day = days[row['day']]
+        day['messages'] = row['total']
+        day['sentiment_sum'] = row['sentiment_sum'] or 0.0
+        day['sentiment_count'] = row['sentiment_count']
+        day['high_risk_messages'] = row['high_risk']
+    crisis_users = defaultdict(set)
+    for day, user_id in messages.filter(risk_level__gte=7, user__isnull=False).values_list('day', 'user_id').distinct().order_by():
+        crisis_users[day].add(user_id)
+    # Messages of archived sessions count without being moved back
+    for row in archived_rows(start, end):
+        local_day = timezone.localdate(row['created_at'])
+        day = days[local_day]
+        day['messages'] += 1
+        if row['sender'] == 'user' and row['sentiment_score'] is not None:
+            day['sentiment_sum'] += row['sentiment_score']
+            day['sentiment_count'] += 1
+        if row['risk_level'] >= 7:
+            day['high_risk_messages'] += 1
+            crisis_users[local_day].add(row['user_id'])
+
+    for day, mood, count, intensity_sum in EmotionalState.objects.filter(
+        recorded_at__gte=start, recorded_at__lt=end
+    ).annotate(day=TruncDate('recorded_at')).values('day', 'mood').annotate(
+        count=Count('id'), intensity_sum=Sum('intensity')
+    ).order_by().values_list('day', 'mood', 'count', 'intensity_sum'):
+        row = days[day]
+        row['mood_counts'][mood] = count
+        row['mood_entries'] += count
+        row['intensity_sum'] += intensity_sum
+
+    for day, count in User.objects.filter(
+        date_joined__gte=start, date_joined__lt=end
+    ).annotate(day=TruncDate('date_joined')).values('day').annotate(
+        count=Count('id')
+    ).order_by().values_list('day', 'count'):
+        days[day]['new_users'] = count
+
+    # Exact distinct users per day, plus sketches to merge across days
+    for day, row in days.items():
+        row['active_users'] = len(active_users[day])
+        row['active_users_sketch'] = HyperLogLog.of(active_users[day]).to_bytes()
+        row['crisis_users'] = len(crisis_users[day])
+        row['crisis_users_sketch'] = HyperLogLog.of(crisis_users[day]).to_bytes()
+    return days
+
+
+def refresh_snapshots(first_day: Optional[date] = None, last_day: Optional[date] = None) -> int:
+    """
+    Recompute and store daily snapshots, returns the number of days written
+
+    By default continues from the settling days before the latest stored
+    snapshot (or the first session, on an empty table) up to yesterday, but
+    never further back than ANALYTICS_MAX_DAYS, the longest dashboard period.
+    """
+    today = timezone.localdate()
+    last_day = last_day or today - timedelta(days=1)
+    if first_day is None:
+        latest = PlatformMetricsSnapshot.objects.aggregate(latest=Max('date'))['latest']
+        if latest is not None:
+            first_day = latest - timedelta(days=SETTLE_DAYS - 1)
+        else:
+            first_started = ConversationSession.objects.order_by('started_at').values_list('started_at', flat=True).first()
+            first_day = timezone.localdate(first_started) if first_started else last_day
+        first_day = max(first_day, today - timedelta(days=settings.ANALYTICS_MAX_DAYS))
+    if first_day > last_day:
+        return 0
+
+    for day, values in compute_days(first_day, last_day).items():
+        PlatformMetricsSnapshot.objects.update_or_create(date=day, defaults=values)
+    return (last_day - first_day).days + 1
+
+
+def snapshot_rows(first_day: date, today: date, fresh: bool = False) -> List[Dict]:
+    """
+    One row per day from first_day to today, oldest first
+
+    Settled days come from stored snapshots; the last SETTLE_DAYS days and
+    any days without a snapshot are computed live, one run of consecutive
+    missing days at a time. With fresh set every day is computed live.
+    """
+    rows = {}
+    if not fresh:
+        rows = {
+            row['date']: row
+            for row in PlatformMetricsSnapshot.objects.filter(
+                date__gte=first_day,
+                date__lt=today - timedelta(days=SETTLE_DAYS - 1)
+            ).values('date', *SNAPSHOT_FIELDS)
+        }
+
+    all_days = [first_day + timedelta(days=offset) for offset in range((today - first_day).days + 1)]
+    missing = [day for day in all_days if day not in rows]
+    run_start = None
+    for i, day in enumerate(missing):
+        run_start = run_start or day
+        if i + 1 == len(missing) or missing[i + 1] != day + timedelta(days=1):
+            for live_day, values in compute_days(run_start, day).items():
+                rows[live_day] = {'date': live_day, **values}
+            run_start = None
+    return [rows[day] for day in all_days]
+
+
+def distinct_users(rows: List[Dict], field: str) -> int:
+    """Approximate distinct users over daily rows by merging their sketches (exact for one day)"""
+    if len(rows) == 1:
+        return rows[0][field]
+    return HyperLogLog.union(HyperLogLog.from_bytes(row[f'{field}_sketch']) for row in rows).count()
+
+
+def exact_distinct_users(first_day: date, last_day: date) -> Dict:
+    """Exact active and crisis user counts over a range from raw rows (audits)"""
+    start, end = day_bounds(first_day, last_day)
+    crisis_users = set(Message.objects.filter(
+        created_at__gte=start, created_at__lt=end, risk_level__gte=7, user__isnull=False
+    ).values_list('user_id', flat=True).distinct().order_by())
+    crisis_users.update(row['user_id'] for row in archived_rows(start, end) if row['risk_level'] >= 7)
+    return {
+        'active_users': ConversationSession.objects.filter(
+            started_at__gte=start, started_at__lt=end
+        ).values('user_id').distinct().count(),
+        'crisis_users': len(crisis_users),
+    }
+
+
+def active_user_windows(rows: List[Dict], exact: bool = False) -> Dict:
+    """DAU, WAU and MAU ending with the last row (rows must cover 30 days)"""
+    windows = {'dau': 1, 'wau': 7, 'mau': 30}
+    if exact:
+        last_day = rows[-1]['date']
+        return {
+            name: exact_distinct_users(last_day - timedelta(days=length - 1), last_day)['active_users']
+            for name, length in windows.items()
+        }
+    return {name: distinct_users(rows[-length:], 'active_users') for name, length in windows.items()}
+
+
+def platform_metrics(rows: List[Dict]) -> Dict:
+    """Period totals over daily rows (distinct user counts approximate, see hyperloglog.py)"""
+    sessions_completed = sum(row['sessions_completed'] for row in rows)
+    duration_sum = sum(row['session_duration_sum'] for row in rows)
+    sentiment_count = sum(row['sentiment_count'] for row in rows)
+    mood_entries = sum(row['mood_entries'] for row in rows)
+    mood_counts = Counter()
+    for row in rows:
+        mood_counts.update(row['mood_counts'])
+
+    return {
+        'active_users': distinct_users(rows, 'active_users'),
+        'new_users': sum(row['new_users'] for row in rows),
+        'total_sessions': sum(row['sessions_started'] for row in rows),
+        'avg_duration_seconds': duration_sum / sessions_completed if sessions_completed else None,
+        'total_messages': sum(row['messages'] for row in rows),
+        'avg_sentiment': sum(row['sentiment_sum'] for row in rows) / sentiment_count if sentiment_count else None,
+        'high_risk_messages': sum(row['high_risk_messages'] for row in rows),
+        'crisis_users': distinct_users(rows, 'crisis_users'),
+        'mood_distribution': [{'mood': mood, 'count': count} for mood, count in mood_counts.most_common()],
+        'avg_intensity': sum(row['intensity_sum'] for row in rows) / mood_entries if mood_entries else None,
+        'total_mood_entries': mood_entries,
+    }
+
+
+def daily_activity(rows: List[Dict]) -> List[Dict]:
+    """Sessions, messages and distinct active users per local day"""
+    return [
+        {
+            'date': timezone.make_aware(datetime.combine(row['date'], time.min)).isoformat(),
+            'sessions': row['sessions_started'],
+            'messages': row['messages'],
+            'users': row['active_users'],
+        }
+        for row in rows
+    ]
+
+
+def encode_cursor(value: int, user_id: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps([value, user_id]).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[int, int]:
+    """(sort value, user id) of the last row of the previous page; ValueError if malformed"""
+    try:
+        value, user_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return int(value), int(user_id)
+    except (TypeError, ValueError, json.JSONDecodeError, UnicodeDecodeError) as e:
+        raise ValueError(f'Invalid cursor: {e}')
+
+
+def engagement_leaderboard(first_day: date, last_day: date, sort: str = 'messages', limit: int = 10,
+                           after: Optional[Tuple[int, int]] = None) -> Tuple[List[Dict], Optional[str]]:
+    """
+    Users ranked by period totals from the per-user daily rollups
+
+    One grouped query over the Analytics rows of the period; pages continue
+    after the (sort value, user id) of the previous page's last row (keyset),
+    so deep pages cost the same as the first. Returns rows and the next
+    page's cursor (None on the last page).
+    """
+    ranked = Analytics.objects.filter(
+        date__gte=first_day,
+        date__lte=last_day
+    ).values('user_id', 'user__username', 'user__email').annotate(
+        sessions=Sum('total_sessions'),
+        messages=Sum('total_messages'),
+        risk_events=Sum('risk_events'),
+    )
+    if after is not None:
+        value, user_id = after
+        ranked = ranked.filter(Q(**{f'{sort}__lt': value}) | Q(**{sort: value, 'user_id__lt': user_id}))
+    rows = list(ranked.order_by(f'-{sort}', '-user_id')[:limit + 1])
+
+    next_cursor = encode_cursor(rows[limit - 1][sort], rows[limit - 1]['user_id']) if len(rows) > limit else None
+    return [
+        {
+            'user_id': row['user_id'],
+            'username': row['user__username'],
+            'email': row['user__email'],
+            'sessions': row['sessions'],
+            'messages': row['messages'],
+            'risk_events': row['risk_events'],
+        }
+        for row in rows[:limit]
+    ], next_cursor
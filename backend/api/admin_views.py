@@ -7,7 +7,8 @@ from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from django.contrib.auth.models import User
 from django.utils import timezone
 from datetime import timedelta
-from django.db.models import Count, Avg, Q
+from statistics import median
+from django.db.models import Count, Q
 from .models import (
     ConversationSession, Message, EmotionalState,
     CBTContent, CBTProgress, Analytics, CrisisResource
@@ -15,6 +16,15 @@ from .models import (
 from .serializers import (
     CBTContentSerializer, CrisisResourceSerializer
 )
+from .admin_metrics import (
+    LEADERBOARD_SORTS, active_user_windows, daily_activity, decode_cursor,
+    engagement_leaderboard, exact_distinct_users, platform_metrics, snapshot_rows
+)
+from .hyperloglog import RELATIVE_ERROR as HYPERLOGLOG_ERROR
+from .analytics_frame import cohort_wellness
+from .archive import archived_rows
+from .response_orchestrator import response_orchestrator
+from .views import period_days
 from typing import Dict, List
 
 
@@ -22,134 +32,114 @@ from typing import Dict, List
 @permission_classes([IsAdminUser])
 def admin_dashboard(request):
     """Admin dashboard with comprehensive analytics"""
-    days = int(request.query_params.get('days', 30))
+    days = period_days(request)
     start_date = timezone.now() - timedelta(days=days)
+    today = timezone.localdate()
     
-    # User statistics
-    total_users = User.objects.count()
-    active_users = User.objects.filter(
-        sessions__started_at__gte=start_date
-    ).distinct().count()
-    new_users = User.objects.filter(date_joined__gte=start_date).count()
+    # Platform totals from the daily snapshots plus the last days live
+    # (?fresh=1 computes the whole period from raw rows). At least 30 days
+    # are loaded for the DAU/WAU/MAU windows.
+    fresh = request.query_params.get('fresh', '').lower() in ('1', 'true', 'yes')
+    window_rows = snapshot_rows(today - timedelta(days=max(days, 30) - 1), today, fresh=fresh)
+    rows = window_rows[-days:]
+    platform = platform_metrics(rows)
     
-    # Session statistics
-    total_sessions = ConversationSession.objects.filter(started_at__gte=start_date).count()
+    # Distinct users are merged from per-day sketches (approximate);
+    # ?exact=1 counts them from raw rows instead, for audits
+    exact = request.query_params.get('exact', '').lower() in ('1', 'true', 'yes')
+    if exact:
+        platform.update(exact_distinct_users(today - timedelta(days=days - 1), today))
+    active_windows = active_user_windows(window_rows, exact=exact)
+    
+    total_users = User.objects.count()
     active_sessions = ConversationSession.objects.filter(is_active=True).count()
     
-    # Calculate average session duration
-    completed_sessions = ConversationSession.objects.filter(
-        started_at__gte=start_date,
-        ended_at__isnull=False
+    # CBT progress (last_accessed moves with every visit, so it is not snapshotted)
+    cbt_progress = CBTProgress.objects.filter(last_accessed__gte=start_date).aggregate(
+        total=Count('id'),
+        completed=Count('id', filter=Q(completed=True))
     )
-    avg_duration_seconds = None
-    if completed_sessions.exists():
-        durations = []
-        for session in completed_sessions:
-            if session.ended_at:
-                duration = (session.ended_at - session.started_at).total_seconds()
-                durations.append(duration)
-        if durations:
-            avg_duration_seconds = sum(durations) / len(durations)
     
-    # Message statistics
-    total_messages = Message.objects.filter(created_at__gte=start_date).count()
-    user_messages = Message.objects.filter(
-        created_at__gte=start_date,
-        sender='user'
+    # Wellness of users active in the period, scored together from the daily rollups
+    wellness_scores = sorted(
+        score for score in cohort_wellness(days, today).values() if score is not None
     )
-    avg_sentiment = user_messages.aggregate(
-        avg=Avg('sentiment_score')
-    )['avg'] or 0
     
-    # Risk detection
-    high_risk_messages = Message.objects.filter(
-        created_at__gte=start_date,
-        risk_level__gte=7
-    ).count()
-    crisis_users = User.objects.filter(
-        messages__risk_level__gte=7,
-        messages__created_at__gte=start_date
-    ).distinct().count()
-    
-    # Emotional state statistics
-    emotional_states = EmotionalState.objects.filter(recorded_at__gte=start_date)
-    mood_distribution = emotional_states.values('mood').annotate(
-        count=Count('id')
-    ).order_by('-count')
-    avg_intensity = emotional_states.aggregate(avg=Avg('intensity'))['avg'] or 0
-    
-    # CBT progress
-    cbt_progress = CBTProgress.objects.filter(last_accessed__gte=start_date)
-    completed_lessons = cbt_progress.filter(completed=True).count()
-    total_progress = cbt_progress.count()
-    
-    # Daily activity (last 7 days)
-    daily_activity = []
-    for i in range(7):
-        date = timezone.now() - timedelta(days=i)
-        day_start = date.replace(hour=0, minute=0, second=0, microsecond=0)
-        day_end = day_start + timedelta(days=1)
-        
-        daily_activity.append({
-            'date': day_start.isoformat(),
-            'sessions': ConversationSession.objects.filter(
-                started_at__gte=day_start,
-                started_at__lt=day_end
-            ).count(),
-            'messages': Message.objects.filter(
-                created_at__gte=day_start,
-                created_at__lt=day_end
-            ).count(),
-            'users': User.objects.filter(
-                sessions__started_at__gte=day_start,
-                sessions__started_at__lt=day_end
-            ).distinct().count(),
-        })
-    
-    daily_activity.reverse()  # Oldest to newest
-    
-    # User engagement ranking
-    top_users = User.objects.annotate(
-        session_count=Count('sessions', filter=Q(sessions__started_at__gte=start_date)),
-        message_count=Count('messages', filter=Q(messages__created_at__gte=start_date)),
-    ).order_by('-message_count')[:10]
-    
-    user_engagement = [
-        {
-            'username': user.username,
-            'sessions': user.session_count,
-            'messages': user.message_count,
-            'email': user.email,
-        }
-        for user in top_users
-    ]
+    # Top users by messages (first page of the leaderboard)
+    user_engagement, _ = engagement_leaderboard(today - timedelta(days=days - 1), today, 'messages', 10)
     
     return Response({
         'overview': {
             'total_users': total_users,
-            'active_users': active_users,
-            'new_users': new_users,
-            'total_sessions': total_sessions,
+            'active_users': platform['active_users'],
+            'dau': active_windows['dau'],
+            'wau': active_windows['wau'],
+            'mau': active_windows['mau'],
+            'new_users': platform['new_users'],
+            'total_sessions': platform['total_sessions'],
             'active_sessions': active_sessions,
-            'avg_session_duration_minutes': round(avg_duration_seconds / 60, 1) if avg_duration_seconds else None,
-            'total_messages': total_messages,
-            'avg_sentiment': round(avg_sentiment, 3) if avg_sentiment else 0,
+            'avg_session_duration_minutes': round(platform['avg_duration_seconds'] / 60, 1) if platform['avg_duration_seconds'] else None,
+            'total_messages': platform['total_messages'],
+            'avg_sentiment': round(platform['avg_sentiment'], 3) if platform['avg_sentiment'] else 0,
         },
         'risk_metrics': {
-            'high_risk_messages': high_risk_messages,
-            'crisis_users': crisis_users,
+            'high_risk_messages': platform['high_risk_messages'],
+            'crisis_users': platform['crisis_users'],
         },
         'emotional_metrics': {
-            'mood_distribution': list(mood_distribution),
-            'avg_intensity': avg_intensity,
-            'total_entries': emotional_states.count(),
+            'mood_distribution': platform['mood_distribution'],
+            'avg_intensity': platform['avg_intensity'] or 0,
+            'total_entries': platform['total_mood_entries'],
         },
         'cbt_metrics': {
-            'completed_lessons': completed_lessons,
-            'total_progress': total_progress,
+            'completed_lessons': cbt_progress['completed'],
+            'total_progress': cbt_progress['total'],
+        },
+        'wellness_metrics': {
+            'scored_users': len(wellness_scores),
+            'avg_wellness_score': round(sum(wellness_scores) / len(wellness_scores), 1) if wellness_scores else None,
+            'median_wellness_score': round(median(wellness_scores), 1) if wellness_scores else None,
+            'low_wellness_users': sum(1 for score in wellness_scores if score < 40),
         },
-        'daily_activity': daily_activity,
+        'daily_activity': daily_activity(rows),
         'user_engagement': user_engagement,
+        # LLM vs rule-based hedge outcomes across all workers (tune RESPONSE_BUDGET_SECONDS)
+        'response_hedging': response_orchestrator.stats(),
+        'period_days': days,
+        'fresh': fresh,
+        'distinct_counts': {
+            'mode': 'exact' if exact else 'approximate',
+            'relative_error': 0 if exact else round(HYPERLOGLOG_ERROR, 4),
+        },
+    })
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def admin_leaderboard(request):
+    """Engagement leaderboard over the period, sorted by sessions, messages or risk_events (keyset-paginated)"""
+    days = period_days(request)
+    sort = request.query_params.get('sort', 'messages')
+    if sort not in LEADERBOARD_SORTS:
+        return Response({'error': f'sort must be one of: {", ".join(LEADERBOARD_SORTS)}'}, status=400)
+    try:
+        limit = min(max(int(request.query_params.get('limit', 20)), 1), 100)
+    except ValueError:
+        return Response({'error': 'limit must be an integer'}, status=400)
+    
+    after = None
+    if request.query_params.get('cursor'):
+        try:
+            after = decode_cursor(request.query_params['cursor'])
+        except ValueError:
+            return Response({'error': 'Invalid cursor'}, status=400)
+    
+    today = timezone.localdate()
+    results, next_cursor = engagement_leaderboard(today - timedelta(days=days - 1), today, sort, limit, after)
+    return Response({
+        'results': results,
+        'next_cursor': next_cursor,
+        'sort': sort,
         'period_days': days,
     })
 
@@ -163,7 +153,7 @@ def admin_user_analytics(request, user_id):
     except User.DoesNotExist:
         return Response({'error': 'User not found'}, status=404)
     
-    days = int(request.query_params.get('days', 30))
+    days = period_days(request)
     start_date = timezone.now() - timedelta(days=days)
     
     # User sessions
@@ -174,7 +164,7 @@ def admin_user_analytics(request, user_id):
     
     # Messages
     messages = Message.objects.filter(
-        session__user=user,
+        user=user,
         created_at__gte=start_date
     )
     
@@ -184,12 +174,23 @@ def admin_user_analytics(request, user_id):
         recorded_at__gte=start_date
     )
     
+    # Messages of archived sessions, read without moving them back
+    archived = archived_rows(start_date, user_id=user.id)
+    
     # Risk analysis
     high_risk_messages = messages.filter(risk_level__gte=7)
+    archived_high_risk = [row for row in archived if row['risk_level'] >= 7]
+    risk_messages = list(
+        high_risk_messages.order_by('-created_at').values('id', 'content', 'risk_level', 'created_at')[:10]
+    )
+    risk_messages = sorted(risk_messages + archived_high_risk, key=lambda m: m['created_at'], reverse=True)[:10]
     
     # Sentiment analysis
     user_messages = messages.filter(sender='user')
     sentiment_scores = [m.sentiment_score for m in user_messages if m.sentiment_score is not None]
+    sentiment_scores += [
+        row['sentiment_score'] for row in archived if row['sender'] == 'user' and row['sentiment_score'] is not None
+    ]
     avg_sentiment = sum(sentiment_scores) / len(sentiment_scores) if sentiment_scores else 0
     
     # Timeline
@@ -210,20 +211,20 @@ def admin_user_analytics(request, user_id):
         },
         'statistics': {
             'total_sessions': sessions.count(),
-            'total_messages': messages.count(),
+            'total_messages': messages.count() + len(archived),
             'total_emotional_states': emotional_states.count(),
             'avg_sentiment': avg_sentiment,
-            'high_risk_count': high_risk_messages.count(),
+            'high_risk_count': high_risk_messages.count() + len(archived_high_risk),
         },
         'timeline': timeline,
         'risk_messages': [
             {
-                'id': m.id,
-                'content': m.content[:100],
-                'risk_level': m.risk_level,
-                'created_at': m.created_at.isoformat(),
+                'id': m['id'],
+                'content': m['content'][:100],
+                'risk_level': m['risk_level'],
+                'created_at': m['created_at'].isoformat(),
             }
-            for m in high_risk_messages.order_by('-created_at')[:10]
+            for m in risk_messages
         ],
     })
 
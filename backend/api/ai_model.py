@@ -20,11 +20,15 @@ except ImportError:
             variance = sum((x - mean_val) ** 2 for x in arr) / len(arr)
             return variance ** 0.5
 
+import logging
 from typing import Dict, List, Optional, Tuple
 from collections import defaultdict
 from datetime import datetime, timedelta
 import math
 import random
+from .keyword_matcher import match_keywords
+
+logger = logging.getLogger('api')
 
 
 class AIModel:
@@ -67,15 +71,20 @@ class AIModel:
                                 mood_history: List[Dict],
                                 sentiment_scores: List[float],
                                 risk_levels: List[int],
-                                engagement_score: float) -> float:
+                                engagement_score: float,
+                                cbt_completed: int = 0) -> float:
         """
         Calculate comprehensive wellness score (0-100)
         
+        Uses the same formula as the analytics dashboard
+        (analytics_frame.wellness_scores).
+        
         Args:
             mood_history: List of mood entries with mood and intensity
             sentiment_scores: List of sentiment scores from messages
-            risk_levels: List of risk levels
-            engagement_score: Score based on session frequency
+            risk_levels: List of risk levels (7+ counts as a high-risk event)
+            engagement_score: Engagement points (capped at 20)
+            cbt_completed: Number of completed CBT lessons
         
         Returns:
             Wellness score from 0 to 100
@@ -83,43 +92,21 @@ class AIModel:
         if not mood_history and not sentiment_scores:
             return 50.0  # Neutral baseline
         
-        components = []
+        from .analytics_frame import MOOD_SCORES, wellness_scores
         
-        # Mood component (0-40 points)
+        # Mood component (0-40 points): mood score weighted by intensity
+        mood_component = math.nan
         if mood_history:
-            mood_component = 0
-            for entry in mood_history:
-                mood = entry.get('mood', 'neutral')
-                intensity = entry.get('intensity', 5)
-                base_score = self.mood_weights.get(mood, 0) * 10
-                weighted_score = base_score * (intensity / 10)
-                mood_component += weighted_score
-            
-            mood_component = (mood_component / len(mood_history)) * 4  # Scale to 0-40
-            mood_component = max(0, min(40, mood_component + 20))  # Shift to 0-40 range
-            components.append(mood_component)
-        
-        # Sentiment component (0-30 points)
-        if sentiment_scores:
-            avg_sentiment = np.mean(sentiment_scores)
-            sentiment_component = ((avg_sentiment + 1) / 2) * 30  # Convert -1 to 1 range to 0-30
-            components.append(max(0, min(30, sentiment_component)))
+            weighted = sum(
+                MOOD_SCORES.get(entry.get('mood', 'neutral'), 5) * entry.get('intensity', 5) / 10
+                for entry in mood_history
+            )
+            mood_component = weighted / len(mood_history) * 4
         
-        # Engagement component (0-20 points)
-        components.append(max(0, min(20, engagement_score)))
+        avg_sentiment = float(np.mean(sentiment_scores)) if sentiment_scores else math.nan
+        risk_events = sum(1 for level in risk_levels if level >= 7)
         
-        # Risk penalty
-        if risk_levels:
-            max_risk = max(risk_levels)
-            risk_penalty = (max_risk / 10) * 20  # Up to 20 point penalty
-        else:
-            risk_penalty = 0
-        
-        # Progress component (0-10 points) - calculated separately
-        progress_component = 10  # Placeholder, should be calculated from CBT progress
-        
-        total_score = sum(components) + progress_component - risk_penalty
-        return max(0, min(100, total_score))
+        return float(wellness_scores(mood_component, avg_sentiment, engagement_score, cbt_completed, risk_events))
     
     def analyze_sentiment_trend(self, sentiment_scores: List[float], window_size: int = 5) -> Dict:
         """
@@ -185,27 +172,14 @@ class AIModel:
         risk_score = 0
         risk_factors = []
         
-        # Analyze message content for risk indicators
+        # Analyze message content for risk indicators (one scan per message)
         for msg in messages:
-            content = msg.get('content', '').lower()
-            risk_level = msg.get('risk_level', 0)
+            hits = match_keywords(msg.get('content', '')).get('model_risk', {})
             
-            # Check for specific risk keywords
             for indicator, weight in self.risk_indicators.items():
-                keywords = {
-                    'suicide': ['суицид', 'покончить', 'убить себя', 'не хочу жить'],
-                    'self_harm': ['навредить себе', 'порежу', 'самоповреждение'],
-                    'hopelessness': ['безнадежно', 'нет смысла', 'все кончено'],
-                    'isolation': ['одинок', 'никто не понимает', 'все отвернулись'],
-                    'extreme_anxiety': ['паника', 'не могу дышать', 'сердце выпрыгивает'],
-                    'depression': ['депрессия', 'нет сил', 'ничего не хочу'],
-                }
-                
-                for keyword in keywords.get(indicator, []):
-                    if keyword in content:
-                        risk_score += weight
-                        risk_factors.append(indicator)
-                        break
+                if hits.get(indicator):
+                    risk_score += weight
+                    risk_factors.append(indicator)
         
         # Analyze mood trends
         if len(mood_history) >= 3:
@@ -257,25 +231,14 @@ class AIModel:
         topic_scores = defaultdict(float)
         
         for msg in messages:
-            content = msg.get('content', '').lower()
             sentiment = msg.get('sentiment_score', 0)
+            hits = match_keywords(msg.get('content', '')).get('model_topic', {})
             
             # Weight recent messages more
             weight = 1.0
             
             for topic in topics:
-                # This is simplified - in real AI, would use embeddings
-                topic_keywords = {
-                    'work': ['работа', 'начальник', 'коллеги', 'проект', 'задача'],
-                    'relationships': ['друг', 'семья', 'партнер', 'отношения'],
-                    'health': ['здоров', 'болезн', 'боль', 'симптом'],
-                    'anxiety': ['тревож', 'беспоко', 'страх', 'паник'],
-                    'depression': ['груст', 'подавлен', 'нет сил', 'апати'],
-                    'sleep': ['сон', 'сплю', 'бессонниц'],
-                }
-                
-                keywords = topic_keywords.get(topic, [])
-                matches = sum(1 for kw in keywords if kw in content)
+                matches = hits.get(topic, 0)
                 
                 if matches > 0:
                     # Relevance = matches * sentiment_weight * importance_weight
@@ -311,12 +274,12 @@ class AIModel:
             if trend.get('trend') == 'declining':
                 needs.append('intervention')
         
-        # Sleep issues
-        if any('сон' in m.get('content', '').lower() or 'sleep' in m.get('content', '').lower() for m in messages):
+        # Sleep issues and anxiety patterns (one scan per message)
+        needs_hits = [match_keywords(m.get('content', '')).get('needs', {}) for m in messages]
+        if any(hits.get('sleep') for hits in needs_hits):
             needs.append('sleep_guidance')
         
-        # Anxiety patterns
-        anxiety_mentions = sum(1 for m in messages if any(kw in m.get('content', '').lower() for kw in ['тревож', 'беспоко', 'страх']))
+        anxiety_mentions = sum(1 for hits in needs_hits if hits.get('anxiety'))
         if anxiety_mentions >= 3:
             needs.append('anxiety_techniques')
         
@@ -398,7 +361,7 @@ class AIModelResponseGenerator(AIModel):
             
             return base_response
         except Exception as e:
-            print(f"Error in generate_contextual_response: {e}")
+            logger.warning(f'Error in generate_contextual_response: {e}')
             return "Расскажи мне больше о том, что происходит. Я здесь, чтобы помочь."
     
     def _get_topic_guidance(self, topic: str) -> Optional[str]:
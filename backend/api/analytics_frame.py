@@ -0,0 +1,215 @@
+"""
+Columnar analytics over the daily rollups
+
+AnalyticsFrame holds the Analytics rows of one or many users as NumPy
+columns (one entry per user-day, moods as per-code count and intensity
+matrices) and computes every dashboard metric with vectorized per-user
+reductions. wellness_scores is the single wellness formula, used by the
+dashboard, admin cohorts and AIModel.calculate_wellness_score.
+"""
+from collections import Counter
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional
+import numpy as np
+from .models import Analytics, EmotionalState
+
+MOODS = tuple(code for code, _ in EmotionalState.MOOD_CHOICES)
+
+# Mood scores used by the wellness score (0-10)
+MOOD_SCORES = {
+    'very_happy': 10, 'happy': 8, 'calm': 7,
+    'neutral': 5, 'sad': 3, 'anxious': 2,
+    'angry': 2, 'very_sad': 1
+}
+MOOD_SCORE_VECTOR = np.array([MOOD_SCORES.get(mood, 5) for mood in MOODS], dtype=float)
+
+# Additive numeric rollup columns
+COLUMNS = (
+    'total_sessions', 'total_messages', 'user_messages', 'risk_events',
+    'sentiment_sum', 'sentiment_count', 'mood_entries', 'intensity_sum', 'cbt_completed',
+)
+ROLLUP_FIELDS = COLUMNS + ('mood_counts', 'mood_intensity_sums', 'theme_counts')
+
+
+def _ratio(numerator: np.ndarray, denominator: np.ndarray) -> np.ndarray:
+    """Elementwise numerator / denominator, NaN where the denominator is 0"""
+    out = np.full(np.broadcast(numerator, denominator).shape, np.nan)
+    return np.divide(numerator, denominator, out=out, where=denominator > 0)
+
+
+def _optional(value) -> Optional[float]:
+    return None if np.isnan(value) else float(value)
+
+
+def wellness_scores(mood_component: np.ndarray, avg_sentiment: np.ndarray, engagement: np.ndarray,
+                    cbt_completed: np.ndarray, risk_events: np.ndarray) -> np.ndarray:
+    """
+    Comprehensive wellness score (0-100) per element
+
+    Mood component (0-40, NaN if no moods), sentiment (0-30, NaN if none),
+    engagement points (capped at 20) and CBT progress (0-10), minus up to 20
+    points for high-risk events.
+    """
+    components = (
+        np.nan_to_num(mood_component)
+        + np.where(np.isnan(avg_sentiment), 0, (np.nan_to_num(avg_sentiment) + 1) / 2 * 30)
+        + np.minimum(engagement, 20)
+        + np.minimum(cbt_completed * 2, 10)
+    )
+    risk_penalty = np.minimum(risk_events * 5, 20)
+    return np.clip(components - risk_penalty, 0, 100)
+
+
+class AnalyticsFrame:
+    """Daily rollups of several users as NumPy columns"""
+
+    def __init__(self, user_ids: Iterable[int], rows: List[Dict]):
+        self.user_ids = list(user_ids)
+        index = {user_id: i for i, user_id in enumerate(self.user_ids)}
+        mood_index = {mood: j for j, mood in enumerate(MOODS)}
+        n = len(rows)
+
+        self.user = np.fromiter((index[row['user_id']] for row in rows), dtype=np.intp, count=n)
+        self.day = np.fromiter((row['date'].toordinal() for row in rows), dtype=np.int64, count=n)
+        self.columns = {
+            name: np.fromiter((row[name] for row in rows), dtype=float, count=n)
+            for name in COLUMNS
+        }
+        self.mood_counts = np.zeros((n, len(MOODS)))
+        self.mood_intensity = np.zeros((n, len(MOODS)))
+        for i, row in enumerate(rows):
+            for mood, count in row['mood_counts'].items():
+                if mood in mood_index:
+                    self.mood_counts[i, mood_index[mood]] = count
+                    self.mood_intensity[i, mood_index[mood]] = row['mood_intensity_sums'].get(mood, 0)
+        self.dates = [row['date'] for row in rows]
+        self.theme_counts = [row['theme_counts'] for row in rows]
+
+    @classmethod
+    def load(cls, first_day: date, last_day: date, user_ids: Optional[List[int]] = None) -> 'AnalyticsFrame':
+        """Stored rollups from first_day to last_day (inclusive) in one query, all users if none given"""
+        queryset = Analytics.objects.filter(date__gte=first_day, date__lte=last_day)
+        if user_ids is not None:
+            queryset = queryset.filter(user_id__in=user_ids)
+        rows = list(queryset.order_by('user_id', 'date').values('user_id', 'date', *ROLLUP_FIELDS))
+        if user_ids is None:
+            user_ids = sorted({row['user_id'] for row in rows})
+        return cls(user_ids, rows)
+
+    def _sum(self, values: np.ndarray, mask: Optional[np.ndarray] = None) -> np.ndarray:
+        """Per-user sum of a column (optionally over masked rows only)"""
+        weights = values if mask is None else np.where(mask, values, 0)
+        return np.bincount(self.user, weights=weights, minlength=len(self.user_ids))
+
+    def _sum_matrix(self, matrix: np.ndarray) -> np.ndarray:
+        out = np.zeros((len(self.user_ids), matrix.shape[1]))
+        np.add.at(out, self.user, matrix)
+        return out
+
+    def _daily_pairs(self):
+        """Days with both moods and sentiment: mask, mood intensity and sentiment per row"""
+        c = self.columns
+        mask = (c['mood_entries'] > 0) & (c['sentiment_count'] > 0)
+        return mask, _ratio(c['intensity_sum'], c['mood_entries']), _ratio(c['sentiment_sum'], c['sentiment_count'])
+
+    def correlations(self) -> np.ndarray:
+        """Pearson correlation of daily mood intensity and sentiment per user (NaN if undefined)"""
+        mask, x, y = self._daily_pairs()
+        x, y = np.where(mask, x, 0), np.where(mask, y, 0)
+        n = self._sum(mask.astype(float))
+        sx, sy = self._sum(x), self._sum(y)
+        cov = n * self._sum(x * y) - sx * sy
+        var = (n * self._sum(x * x) - sx ** 2) * (n * self._sum(y * y) - sy ** 2)
+        with np.errstate(invalid='ignore'):
+            r = _ratio(cov, np.sqrt(np.maximum(var, 0)))
+        return np.where((n >= 2) & (var > 1e-12), np.clip(r, -1, 1), np.nan)
+
+    def metrics(self, days: int, today: date, detailed: bool = True) -> List[Dict]:
+        """All dashboard aggregates per user for the last `days` calendar days up to today"""
+        c = self.columns
+        first_day = today - timedelta(days=max(days, 1) - 1)
+        recent = self.day >= (today - timedelta(days=6)).toordinal()
+        late = self.day >= (first_day + timedelta(days=days // 2)).toordinal()
+
+        totals = {name: self._sum(c[name]) for name in COLUMNS}
+        avg_sentiment = _ratio(totals['sentiment_sum'], totals['sentiment_count'])
+        recent_count = self._sum(c['sentiment_count'], recent)
+        sentiment_trend = np.where(
+            recent_count > 0, _ratio(self._sum(c['sentiment_sum'], recent), recent_count) - avg_sentiment, 0
+        )
+        sentiment_trend[np.isnan(avg_sentiment)] = np.nan
+
+        # Mood trend: first half vs second half of the period, by day
+        early_avg = _ratio(self._sum(c['intensity_sum'], ~late), self._sum(c['mood_entries'], ~late))
+        late_avg = _ratio(self._sum(c['intensity_sum'], late), self._sum(c['mood_entries'], late))
+        mood_trend = np.where(np.isnan(early_avg) | np.isnan(late_avg), 0, late_avg - early_avg)
+
+        mood_counts = self._sum_matrix(self.mood_counts)
+        mood_intensity = self._sum_matrix(self.mood_intensity)
+        # Ties go to the mood recorded most recently
+        last_seen = np.full(mood_counts.shape, -1, dtype=np.int64)
+        np.maximum.at(last_seen, self.user, np.where(self.mood_counts > 0, self.day[:, None], -1))
+        most_common = np.argmax(mood_counts * 1e7 + last_seen, axis=1)
+
+        # Mood component (0-40): mood score weighted by intensity
+        total_moods = totals['mood_entries']
+        mood_component = _ratio(mood_intensity @ MOOD_SCORE_VECTOR / 10, total_moods) * 4
+        wellness = wellness_scores(
+            mood_component, avg_sentiment,
+            totals['total_sessions'] * 2 + totals['total_messages'] * 0.5,
+            totals['cbt_completed'], totals['risk_events'],
+        )
+        has_data = (total_moods > 0) | (totals['user_messages'] > 0)
+        correlations = self.correlations() if detailed else None
+        pairs = self._daily_pairs() if detailed else None
+
+        results = []
+        for k in range(len(self.user_ids)):
+            has_moods = total_moods[k] > 0
+            present = np.flatnonzero(mood_counts[k])
+            results.append({
+                'total_sessions': int(totals['total_sessions'][k]),
+                'total_cbt_completed': int(totals['cbt_completed'][k]),
+                'total_messages': int(totals['total_messages'][k]),
+                'user_messages': int(totals['user_messages'][k]),
+                'risk_events': int(totals['risk_events'][k]),
+                'avg_sentiment': _optional(avg_sentiment[k]),
+                'sentiment_trend': _optional(sentiment_trend[k]),
+                'total_mood_entries': int(total_moods[k]),
+                'avg_mood_intensity': float(totals['intensity_sum'][k] / total_moods[k]) if has_moods else None,
+                'mood_counts': {MOODS[j]: int(mood_counts[k, j]) for j in present},
+                'mood_avg_intensity': {MOODS[j]: float(mood_intensity[k, j] / mood_counts[k, j]) for j in present},
+                'most_common_mood': MOODS[most_common[k]] if has_moods else None,
+                'mood_trend': float(mood_trend[k]) if has_moods else None,
+                'mood_component': _optional(mood_component[k]),
+                'wellness_score': float(wellness[k]) if has_data[k] else None,
+                'mood_sentiment_correlation': _optional(correlations[k]) if detailed else None,
+                'correlation_data': self.correlation_data(k, pairs) if detailed else [],
+                'dominant_themes': self.dominant_themes(k) if detailed else [],
+            })
+        return results
+
+    def correlation_data(self, k: int, pairs=None) -> List[Dict]:
+        """Daily average mood intensity vs sentiment of user k for days that have both"""
+        mask, intensity, sentiment = pairs or self._daily_pairs()
+        return [
+            {'date': self.dates[i].isoformat(), 'mood_intensity': float(intensity[i]), 'sentiment': float(sentiment[i])}
+            for i in np.flatnonzero(mask & (self.user == k))
+        ]
+
+    def dominant_themes(self, k: int, limit: int = 5) -> List[Dict]:
+        """Most frequent themes of user k over the period"""
+        theme_counts = Counter()
+        for i in np.flatnonzero(self.user == k):
+            theme_counts.update(self.theme_counts[i])
+        return [{'theme': theme, 'count': count} for theme, count in theme_counts.most_common(limit)]
+
+
+def cohort_wellness(days: int, today: date, user_ids: Optional[List[int]] = None) -> Dict[int, Optional[float]]:
+    """Wellness score per user from stored rollups (one query for any number of users)"""
+    first_day = today - timedelta(days=max(days, 1) - 1)
+    frame = AnalyticsFrame.load(first_day, today, user_ids)
+    return {
+        user_id: metrics['wellness_score']
+        for user_id, metrics in zip(frame.user_ids, frame.metrics(days, today, detailed=False))
+    }
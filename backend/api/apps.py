@@ -1,7 +1,32 @@
+import os
+import sys
 from django.apps import AppConfig
+from django.conf import settings
+
+# Management commands that serve requests; every other command (migrate,
+# check, makemigrations, shell, ...) builds the engines lazily on first use
+SERVING_COMMANDS = {'runserver', 'runworker'}
+
+
+def serving_process() -> bool:
+    """True in web servers and task workers (gunicorn, daphne, celery worker, runserver)"""
+    program = os.path.basename(sys.argv[0]) if sys.argv else ''
+    if program in ('manage.py', 'django-admin', 'django-admin.py'):
+        return len(sys.argv) > 1 and sys.argv[1] in SERVING_COMMANDS
+    if program == 'celery':
+        return 'worker' in sys.argv
+    return True
 
 
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
 
+    def ready(self):
+        # Daily Analytics rollups follow writes to the rows they summarize
+        from . import signals  # noqa: F401
+
+        # Build NLP engines once per worker instead of on every request
+        if getattr(settings, 'NLP_ENGINE_PRELOAD', True) and serving_process():
+            from . import engines
+            engines.preload()
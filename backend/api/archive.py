@@ -0,0 +1,198 @@
+"""
+Cold storage for the messages of long-ended sessions
+
+The archive job moves the messages of sessions that ended, and last received
+a message, more than MESSAGE_ARCHIVE_MONTHS ago into one zlib-compressed
+MessageArchive row per session and deletes them from Message. Archived
+sessions stay readable through the API: session endpoints decode the
+archive in memory (archived_messages, decoded_messages), and reads over a time range
+(rollups, timelines, admin metrics) merge the overlapping archives' rows
+decoded read-only (archived_rows). Only opening an archived conversation
+moves its messages back (rehydrate); rehydrated sessions are not archived
+again for REHYDRATED_GRACE.
+"""
+import json
+import zlib
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+from operator import itemgetter
+from typing import Dict, Iterable, List, Optional, Tuple
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import Case, Exists, OuterRef, Value, When
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .models import ConversationSession, Message, MessageArchive
+
+MESSAGE_FIELDS = (
+    'id', 'user_id', 'sender', 'content', 'sentiment_score', 'sentiment_label', 'risk_level', 'created_at',
+)
+REHYDRATED_GRACE = timedelta(days=30)
+
+_archiving = ContextVar('archiving_messages', default=False)
+
+
+def archiving_in_progress() -> bool:
+    """True while the archive job deletes moved messages (analytics must not react)"""
+    return _archiving.get()
+
+
+def _encode(rows: List[Dict]) -> bytes:
+    # isoformat keeps microseconds (DjangoJSONEncoder would round to milliseconds)
+    rows = [{**row, 'created_at': row['created_at'].isoformat()} for row in rows]
+    return zlib.compress(json.dumps(rows, ensure_ascii=False).encode(), 9)
+
+
+def _decode(data) -> List[Dict]:
+    rows = json.loads(zlib.decompress(bytes(data)))
+    for row in rows:
+        row['created_at'] = parse_datetime(row['created_at'])
+    return rows
+
+
+def archive_cutoff(months: Optional[int] = None) -> datetime:
+    """Sessions ended before this moment may be archived (months of 30 days)"""
+    months = settings.MESSAGE_ARCHIVE_MONTHS if months is None else months
+    return timezone.now() - timedelta(days=30 * months)
+
+
+def archivable_sessions(cutoff: datetime):
+    """Ended sessions with messages, none of them newer than cutoff, not recently rehydrated"""
+    messages = Message.objects.filter(session_id=OuterRef('pk'))
+    return ConversationSession.objects.filter(
+        is_active=False, ended_at__lt=cutoff
+    ).filter(
+        Exists(messages)
+    ).exclude(
+        Exists(messages.filter(created_at__gte=cutoff))
+    ).exclude(
+        message_archive__rehydrated_at__gte=timezone.now() - REHYDRATED_GRACE
+    )
+
+
+def archive_session(session_id: int, user_id: int) -> int:
+    """Move one session's messages into its archive row, returns the number moved"""
+    with transaction.atomic():
+        rows = list(
+            Message.objects.filter(session_id=session_id).order_by('created_at', 'id').values(*MESSAGE_FIELDS)
+        )
+        if not rows:
+            return 0
+        for row in rows:
+            row['user_id'] = row['user_id'] or user_id
+        MessageArchive.objects.update_or_create(session_id=session_id, defaults={
+            'user_id': user_id,
+            'message_count': len(rows),
+            'first_message_at': rows[0]['created_at'],
+            'last_message_at': rows[-1]['created_at'],
+            'data': _encode(rows),
+            'archived_at': timezone.now(),
+            'rehydrated_at': None,
+        })
+        token = _archiving.set(True)
+        try:
+            Message.objects.filter(id__in=[row['id'] for row in rows]).delete()
+        finally:
+            _archiving.reset(token)
+    return len(rows)
+
+
+def archive_sessions(cutoff: Optional[datetime] = None, batch_size: int = 100,
+                     limit: Optional[int] = None) -> Tuple[int, int]:
+    """Archive every archivable session in id order, returns (sessions, messages) moved"""
+    cutoff = cutoff or archive_cutoff()
+    sessions = messages = 0
+    last_id = 0
+    while limit is None or sessions < limit:
+        size = batch_size if limit is None else min(batch_size, limit - sessions)
+        batch = list(
+            archivable_sessions(cutoff).filter(pk__gt=last_id).order_by('pk').values_list('pk', 'user_id')[:size]
+        )
+        if not batch:
+            break
+        for session_id, user_id in batch:
+            messages += archive_session(session_id, user_id)
+        sessions += len(batch)
+        last_id = batch[-1][0]
+    return sessions, messages
+
+
+def decoded_messages(archive: Optional[MessageArchive]) -> List[Message]:
+    """Unsaved Message instances of an already loaded archive ([] if none or rehydrated)"""
+    if archive is None or archive.rehydrated_at is not None:
+        return []
+    return [Message(session_id=archive.session_id, **row) for row in _decode(archive.data)]
+
+
+def archived_messages(session_id: int) -> List[Message]:
+    """Unsaved Message instances decoded from the session's archive ([] if not archived)"""
+    archive = MessageArchive.objects.filter(
+        session_id=session_id, rehydrated_at__isnull=True
+    ).only('session_id', 'data', 'rehydrated_at').first()
+    return decoded_messages(archive)
+
+
+def archived_rows(start: datetime, end: Optional[datetime] = None, user_id: Optional[int] = None,
+                  session_ids: Optional[Iterable[int]] = None) -> List[Dict]:
+    """
+    Rows of archived messages created in [start, end), oldest first (read-only)
+
+    Each row holds MESSAGE_FIELDS plus session_id. One indexed lookup of the
+    overlapping archives; nothing is decoded when none overlap, which holds
+    for any range newer than the archive cutoff.
+    """
+    archives = MessageArchive.objects.filter(rehydrated_at__isnull=True, last_message_at__gte=start)
+    if end is not None:
+        archives = archives.filter(first_message_at__lt=end)
+    if user_id is not None:
+        archives = archives.filter(user_id=user_id)
+    if session_ids is not None:
+        archives = archives.filter(session_id__in=session_ids)
+    rows = []
+    for session_id, data in archives.values_list('session_id', 'data'):
+        for row in _decode(data):
+            if row['created_at'] >= start and (end is None or row['created_at'] < end):
+                row['session_id'] = session_id
+                rows.append(row)
+    return sorted(rows, key=itemgetter('created_at', 'id'))
+
+
+def rehydrate(session_ids: Iterable[int], user_id: Optional[int] = None) -> int:
+    """Move archived sessions' messages (of one user if given) back into Message, returns the number restored"""
+    restored = 0
+    for session_id in session_ids:
+        with transaction.atomic():
+            archives = MessageArchive.objects.select_for_update().filter(
+                session_id=session_id, rehydrated_at__isnull=True
+            )
+            if user_id is not None:
+                archives = archives.filter(user_id=user_id)
+            archive = archives.first()
+            if archive is None:
+                continue
+            rows = _decode(archive.data)
+            Message.objects.bulk_create([Message(session_id=session_id, **row) for row in rows])
+            # bulk_create stamps created_at (auto_now_add); put the original times back
+            Message.objects.filter(id__in=[row['id'] for row in rows]).update(created_at=Case(
+                *[When(id=row['id'], then=Value(row['created_at'])) for row in rows],
+                output_field=models.DateTimeField(),
+            ))
+            archive.data = b''
+            archive.rehydrated_at = timezone.now()
+            archive.save(update_fields=['data', 'rehydrated_at'])
+            restored += len(rows)
+    return restored
+
+
+def rehydrate_range(user_id: Optional[int] = None, start: Optional[datetime] = None,
+                    end: Optional[datetime] = None) -> int:
+    """Rehydrate every archive with messages in [start, end) (of one user if given)"""
+    archives = MessageArchive.objects.filter(rehydrated_at__isnull=True)
+    if user_id is not None:
+        archives = archives.filter(user_id=user_id)
+    if start is not None:
+        archives = archives.filter(last_message_at__gte=start)
+    if end is not None:
+        archives = archives.filter(first_message_at__lt=end)
+    session_ids = list(archives.values_list('session_id', flat=True))
+    return rehydrate(session_ids) if session_ids else 0
@@ -0,0 +1,81 @@
+"""
+WebSocket consumers for real-time conversation turns
+"""
+import logging
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from .conversation_utils import (
+    resolve_session, session_limit_payload, prepare_turn,
+    fallback_reply, persist_turn, turn_payload
+)
+from .engines import get_response_generator
+from .serializers import VoiceInputSerializer
+
+logger = logging.getLogger('api')
+
+
+class ConversationConsumer(AsyncJsonWebsocketConsumer):
+    """
+    Conversation turns over WebSocket with token streaming
+
+    Client sends {"text": ..., "session_id": ...}; server replies with
+    {"type": "start"} (analysis), a {"type": "token"} frame per reply chunk and
+    {"type": "done"} with the persisted messages, same shape as voice/process.
+    """
+
+    async def connect(self):
+        user = self.scope.get('user')
+        if not user or not user.is_authenticated:
+            await self.close(code=4401)
+            return
+        await self.accept()
+
+    async def receive_json(self, content, **kwargs):
+        serializer = VoiceInputSerializer(data=content)
+        if not serializer.is_valid():
+            await self.send_json({'type': 'error', 'errors': serializer.errors})
+            return
+
+        user = self.scope['user']
+        text = serializer.validated_data['text']
+        session_id = serializer.validated_data.get('session_id')
+
+        session = await database_sync_to_async(resolve_session)(user, session_id)
+        if session is None:
+            payload = await database_sync_to_async(session_limit_payload)(user)
+            await self.send_json({'type': 'error', **payload})
+            return
+
+        turn = await database_sync_to_async(prepare_turn)(session, text)
+        analysis = turn['analysis']
+        await self.send_json({
+            'type': 'start',
+            'session_id': session.id,
+            'analysis': analysis,
+            'risk_detected': analysis['risk_level'] >= 7,
+        })
+
+        # Forward each chunk as soon as the generator produces it
+        parts = []
+        try:
+            async for chunk in get_response_generator().astream_response(
+                text,
+                analysis['sentiment_label'],
+                analysis['risk_level'],
+                conversation_history=turn['conversation_history'],
+                is_assessment=turn['is_assessment'],
+                conversation_state=turn['state']
+            ):
+                parts.append(chunk)
+                await self.send_json({'type': 'token', 'token': chunk})
+            therapist_response = ''.join(parts).strip() or fallback_reply(analysis)
+        except Exception as e:
+            logger.error(f"Error streaming therapist response: {e}", exc_info=True)
+            therapist_response = ''.join(parts).strip() or fallback_reply(analysis, failed=True)
+
+        # Persist only once the stream has completed
+        therapist_message = await database_sync_to_async(persist_turn)(
+            user, session, turn['user_message'], therapist_response, turn['state']
+        )
+        payload = turn_payload(session, turn['user_message'], therapist_message, analysis)
+        await self.send_json({'type': 'done', **payload})
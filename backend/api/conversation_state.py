@@ -0,0 +1,169 @@
+"""
+Incremental per-session conversation state
+
+Sentiment, risk and topic statistics are folded in one user message at a time
+(running mean, Welford variance, EWMA trend, decayed risk score, topic counters),
+so each turn costs O(1) regardless of session length and nothing before the
+last few messages is forgotten. Stored as JSON on ConversationSession.state.
+"""
+import math
+from typing import Dict, Iterable, Optional
+from .keyword_matcher import match_keywords
+
+STATE_VERSION = 1
+
+# Smoothing factor of the sentiment EWMA (higher reacts faster to recent messages)
+EWMA_ALPHA = 0.3
+# Per-message decay of the keyword risk score (~5 user messages of memory)
+RISK_DECAY = 0.8
+# Risk indicators count as current if seen within this many user messages
+RISK_FACTOR_WINDOW = 5
+
+
+class ConversationState:
+    """Rolling statistics of the user's side of one conversation session"""
+
+    def __init__(self, data: Optional[Dict] = None):
+        data = data if data and data.get('version') == STATE_VERSION else {}
+        self.turns = data.get('turns', 0)
+        self.sentiment_count = data.get('sentiment_count', 0)
+        self.sentiment_mean = data.get('sentiment_mean', 0.0)
+        self.sentiment_m2 = data.get('sentiment_m2', 0.0)
+        self.sentiment_ewma = data.get('sentiment_ewma')
+        self.risk_max = data.get('risk_max', 0)
+        self.risk_last = data.get('risk_last', 0)
+        self.risk_score = data.get('risk_score', 0.0)
+        self.risk_factors = dict(data.get('risk_factors', {}))  # indicator -> turn last seen
+        self.topic_counts = dict(data.get('topic_counts', {}))  # dominant topic per message
+        self.topic_relevance = dict(data.get('topic_relevance', {}))  # weighted keyword matches
+
+    @property
+    def is_empty(self) -> bool:
+        return self.turns == 0
+
+    def to_dict(self) -> Dict:
+        return {
+            'version': STATE_VERSION,
+            'turns': self.turns,
+            'sentiment_count': self.sentiment_count,
+            'sentiment_mean': self.sentiment_mean,
+            'sentiment_m2': self.sentiment_m2,
+            'sentiment_ewma': self.sentiment_ewma,
+            'risk_max': self.risk_max,
+            'risk_last': self.risk_last,
+            'risk_score': self.risk_score,
+            'risk_factors': self.risk_factors,
+            'topic_counts': self.topic_counts,
+            'topic_relevance': self.topic_relevance,
+        }
+
+    def add_message(self, message: Dict, model) -> None:
+        """
+        Fold one user message into the state
+
+        message needs content, sentiment_score and risk_level; model supplies
+        the risk indicator weights and topic importance (AIModel).
+        """
+        self.turns += 1
+        hits = match_keywords(message.get('content') or '')
+
+        score = message.get('sentiment_score')
+        if score is not None:
+            # Welford's online mean/variance
+            self.sentiment_count += 1
+            delta = score - self.sentiment_mean
+            self.sentiment_mean += delta / self.sentiment_count
+            self.sentiment_m2 += delta * (score - self.sentiment_mean)
+            if self.sentiment_ewma is None:
+                self.sentiment_ewma = score
+            else:
+                self.sentiment_ewma += EWMA_ALPHA * (score - self.sentiment_ewma)
+
+        risk_level = message.get('risk_level') or 0
+        self.risk_last = risk_level
+        self.risk_max = max(self.risk_max, risk_level)
+
+        model_risk = hits.get('model_risk', {})
+        message_risk = 0
+        for indicator, weight in model.risk_indicators.items():
+            if model_risk.get(indicator):
+                message_risk += weight
+                self.risk_factors[indicator] = self.turns
+        self.risk_score = self.risk_score * RISK_DECAY + message_risk
+
+        topic_scores = hits.get('topic')
+        if topic_scores:
+            topic = max(topic_scores.items(), key=lambda x: x[1])[0]
+            self.topic_counts[topic] = self.topic_counts.get(topic, 0) + 1
+
+        sentiment_weight = 1 + abs(score or 0)
+        for topic, matches in hits.get('model_topic', {}).items():
+            relevance = matches * sentiment_weight * model.topic_importance.get(topic, 0.1)
+            self.topic_relevance[topic] = self.topic_relevance.get(topic, 0.0) + relevance
+
+    @classmethod
+    def from_messages(cls, messages: Iterable[Dict], model) -> 'ConversationState':
+        """Build the state from stored history (used once for pre-existing sessions)"""
+        state = cls()
+        for message in messages:
+            if message.get('sender', 'user') == 'user':
+                state.add_message(message, model)
+        return state
+
+    def sentiment_trend(self) -> Dict:
+        """Trend in the shape of AIModel.analyze_sentiment_trend (EWMA vs session mean)"""
+        if self.sentiment_count < 2:
+            prediction = self.sentiment_ewma if self.sentiment_ewma is not None else 0
+            return {'trend': 'stable', 'slope': 0, 'volatility': 0, 'prediction': prediction}
+
+        slope = self.sentiment_ewma - self.sentiment_mean
+        if slope > 0.1:
+            trend = 'improving'
+        elif slope < -0.1:
+            trend = 'declining'
+        else:
+            trend = 'stable'
+
+        return {
+            'trend': trend,
+            'slope': float(slope),
+            'volatility': math.sqrt(self.sentiment_m2 / self.sentiment_count),
+            'prediction': max(-1, min(1, self.sentiment_ewma + slope * 0.5)),
+            'recent_avg': float(self.sentiment_ewma),
+            'older_avg': float(self.sentiment_mean),
+        }
+
+    def risk_analysis(self) -> Dict:
+        """Risk in the shape of AIModel.detect_risk_patterns"""
+        normalized_risk = min(10, self.risk_score / 10)
+        return {
+            'risk_level': normalized_risk,
+            'risk_factors': [
+                indicator for indicator, seen in self.risk_factors.items()
+                if self.turns - seen < RISK_FACTOR_WINDOW
+            ],
+            'requires_attention': normalized_risk >= 7,
+            'severity': 'high' if normalized_risk >= 8 else 'medium' if normalized_risk >= 5 else 'low',
+            'max_risk_level': self.risk_max,
+        }
+
+    def normalized_topic_relevance(self) -> Dict[str, float]:
+        """Topic relevance scaled to the strongest topic (as calculate_topic_relevance)"""
+        max_score = max(self.topic_relevance.values(), default=0)
+        if max_score <= 0:
+            return {}
+        return {topic: score / max_score for topic, score in self.topic_relevance.items()}
+
+    def history_context(self) -> Dict:
+        """History context for the response generator, without rescanning messages"""
+        dominant_topics = sorted(self.topic_counts.items(), key=lambda x: x[1], reverse=True)[:3]
+        return {
+            'avg_sentiment': self.sentiment_mean,
+            'sentiment_trend': self.sentiment_trend(),
+            'dominant_topics': [t[0] for t in dominant_topics],
+            'conversation_length': self.turns,
+            'last_risk_level': self.risk_last,
+            'max_risk_level': self.risk_max,
+            'risk_analysis': self.risk_analysis(),
+            'topic_relevance': self.normalized_topic_relevance(),
+        }
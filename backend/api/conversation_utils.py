@@ -0,0 +1,301 @@
+"""
+Conversation turn pipeline shared by the HTTP voice endpoint and the
+WebSocket conversation consumer
+"""
+from typing import Dict, List, Optional
+from django.db import transaction
+from django.db.models import Avg, Count, IntegerField, Max, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Left
+from django.utils import timezone
+from .archive import decoded_messages, rehydrate
+from .conversation_state import ConversationState
+from .engines import get_sentiment_analyzer, get_response_generator
+from .models import ConversationSession, Message, MessageArchive
+from .response_cache import bump_version
+from .serializers import MessageSerializer
+from .subscription_utils import get_premium_feature_limits
+from .tasks import enqueue, link_emotional_state, refresh_daily_analytics, review_session_risk
+
+# Message fields passed to the response generator as conversation history
+HISTORY_FIELDS = ('sender', 'content', 'sentiment_score', 'sentiment_label', 'risk_level')
+
+ASSESSMENT_KEYWORDS = ['тестирование', 'прохожу тест', 'мои ответы', 'вот мои ответы']
+DISTRESS_KEYWORDS = ['плохо', 'трудно', 'сложно', 'беспокоит', 'тревож', 'грустн', 'плохое']
+
+# Characters of the last message shown in the session list
+PREVIEW_LENGTH = 120
+
+# Lesson category suggested when the reply points to the practices section
+TOPIC_CATEGORY_MAP = {
+    'anxiety': 'conditions',
+    'depression': 'conditions',
+    'work': 'techniques',
+    'sleep': 'conditions',
+}
+
+
+def session_limit_reached(user) -> bool:
+    """Check monthly session limit for free users (counts only when needed)"""
+    if user.is_staff:
+        return False
+    limits = get_premium_feature_limits(user)
+    if limits['max_sessions_per_month'] is None:
+        return False
+    now = timezone.now()
+    start_of_month = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    sessions_this_month = ConversationSession.objects.filter(
+        user=user,
+        started_at__gte=start_of_month
+    ).count()
+    return sessions_this_month >= limits['max_sessions_per_month']
+
+
+def with_message_stats(queryset):
+    """
+    Annotate sessions with message_count, last_message_at, last_message_preview,
+    last_message_sender, avg_sentiment (user messages) and max_risk_level
+
+    Correlated subqueries on the (session, created_at) index rather than a
+    JOIN + GROUP BY, so a page of sessions costs one query and only the rows
+    on the page are aggregated. Archived sessions take their count and last
+    message time from the archive row; add_archived_stats fills in the rest
+    for the sessions of a page.
+    """
+    messages = Message.objects.filter(session=OuterRef('pk')).order_by()
+    per_session = messages.values('session')
+    last = messages.order_by('-created_at', '-id')
+    archive = MessageArchive.objects.filter(session=OuterRef('pk'), rehydrated_at__isnull=True)
+    return queryset.annotate(
+        message_count=Coalesce(
+            Subquery(per_session.annotate(n=Count('id')).values('n')),
+            Subquery(archive.values('message_count')),
+            Value(0), output_field=IntegerField(),
+        ),
+        last_message_at=Coalesce(
+            Subquery(last.values('created_at')[:1]),
+            Subquery(archive.values('last_message_at')),
+        ),
+        last_message_preview=Subquery(last.values(preview=Left('content', PREVIEW_LENGTH))[:1]),
+        last_message_sender=Subquery(last.values('sender')[:1]),
+        avg_sentiment=Subquery(
+            per_session.filter(sender='user').annotate(avg=Avg('sentiment_score')).values('avg')
+        ),
+        max_risk_level=Subquery(per_session.annotate(top=Max('risk_level')).values('top')),
+    )
+
+
+def add_archived_stats(sessions) -> None:
+    """
+    Set the with_message_stats fields of archived sessions from their archives
+
+    The annotations only see live messages, so archived sessions come back
+    with a count but no preview, sender, average or risk. The archives of
+    those sessions are loaded in one query and decoded in memory.
+    """
+    archived = {session.pk: session for session in sessions
+                if session.message_count and session.last_message_sender is None}
+    if not archived:
+        return
+    archives = MessageArchive.objects.filter(session_id__in=archived, rehydrated_at__isnull=True)
+    for archive in archives.only('session_id', 'data', 'rehydrated_at'):
+        messages = decoded_messages(archive)
+        if not messages:
+            continue
+        session = archived[archive.session_id]
+        last = messages[-1]
+        scores = [m.sentiment_score for m in messages if m.sender == 'user' and m.sentiment_score is not None]
+        risks = [m.risk_level for m in messages if m.risk_level is not None]
+        session.last_message_preview = last.content[:PREVIEW_LENGTH]
+        session.last_message_sender = last.sender
+        session.avg_sentiment = sum(scores) / len(scores) if scores else None
+        session.max_risk_level = max(risks) if risks else None
+
+
+def session_limit_payload(user) -> Dict:
+    """Error body returned when a free user has used all monthly sessions"""
+    limits = get_premium_feature_limits(user)
+    return {
+        'error': 'Лимит сессий достигнут',
+        'message': f'Вы использовали все доступные сессии ({limits["max_sessions_per_month"]} в месяц). Обновитесь до Премиум для неограниченного количества сессий.',
+        'upgrade_url': '/subscription',
+        'limit_reached': True
+    }
+
+
+def resolve_session(user, session_id: Optional[int] = None) -> Optional[ConversationSession]:
+    """
+    Get the requested (or active) session, creating one if needed
+
+    Returns None if a new session is needed but the monthly limit is reached.
+    """
+    if session_id:
+        session = ConversationSession.objects.filter(id=session_id, user=user).first()
+        if session and not session.is_active:
+            # Resuming an ended session: bring archived messages back for the history
+            rehydrate([session.id])
+    else:
+        session = ConversationSession.objects.filter(user=user, is_active=True).first()
+    if not session:
+        if session_limit_reached(user):
+            return None
+        session = ConversationSession.objects.create(user=user)
+    return session
+
+
+def apply_assessment_risk(text: str, analysis: Dict) -> bool:
+    """
+    Whether the text is an assessment answer (contains assessment keywords)
+
+    Assessments with distress indicators might indicate higher need for
+    support, so their risk level in `analysis` is raised by one.
+    """
+    text_lower = text.lower()
+    is_assessment = any(keyword in text_lower for keyword in ASSESSMENT_KEYWORDS)
+    if is_assessment and any(keyword in text_lower for keyword in DISTRESS_KEYWORDS):
+        analysis['risk_level'] = min(analysis['risk_level'] + 1, 10)
+    return is_assessment
+
+
+def prepare_turn(session: ConversationSession, text: str) -> Dict:
+    """
+    Analyze the user's text and build the unsaved user message and history
+
+    Returns dict with analysis, is_assessment, user_message (unsaved),
+    conversation_history (previous 9 messages plus the new one, chronological)
+    and state (session statistics including the new message, unsaved).
+    """
+    analysis = get_sentiment_analyzer().analyze(text)
+    is_assessment = apply_assessment_risk(text, analysis)
+
+    user_message = Message(
+        session=session,
+        user_id=session.user_id,
+        sender='user',
+        content=text,
+        sentiment_score=analysis['sentiment_score'],
+        sentiment_label=analysis['sentiment_label'],
+        risk_level=analysis['risk_level']
+    )
+
+    # The new user message is appended in memory instead of being re-queried
+    previous_messages = Message.objects.filter(
+        session=session
+    ).order_by('-created_at', '-id').values(*HISTORY_FIELDS)[:9]
+    conversation_history = list(reversed(previous_messages))
+    new_message = {field: getattr(user_message, field) for field in HISTORY_FIELDS}
+
+    state = load_state(session, conversation_history)
+    state.add_message(new_message, get_response_generator())
+    conversation_history.append(new_message)
+
+    return {
+        'analysis': analysis,
+        'is_assessment': is_assessment,
+        'user_message': user_message,
+        'conversation_history': conversation_history,
+        'state': state,
+    }
+
+
+def load_state(session: ConversationSession, recent_history: List[Dict]) -> ConversationState:
+    """
+    Session statistics, rebuilt once from stored messages for older sessions
+
+    recent_history is the already fetched tail of the session; when it is
+    shorter than the fetch window it is the whole session and no query is made.
+    """
+    state = ConversationState(session.state)
+    if state.is_empty and recent_history:
+        if len(recent_history) < 9:
+            messages = recent_history
+        else:
+            messages = Message.objects.filter(
+                session=session, sender='user'
+            ).order_by('created_at', 'id').values(*HISTORY_FIELDS).iterator()
+        state = ConversationState.from_messages(messages, get_response_generator())
+    return state
+
+
+def fallback_reply(analysis: Dict, failed: bool = False) -> str:
+    """Short reply used when generation returned nothing (or raised, if failed)"""
+    if failed:
+        if analysis['risk_level'] >= 7:
+            return "Я понимаю, что тебе сейчас трудно. Я здесь, чтобы помочь."
+        elif analysis['sentiment_label'] == 'positive':
+            return "Это замечательно! Расскажи мне больше."
+        elif analysis['sentiment_label'] == 'negative':
+            return "Понимаю тебя. Расскажи мне больше."
+        return "Расскажи мне больше о том, что происходит."
+
+    if analysis['risk_level'] >= 7:
+        return "Я понимаю, что тебе сейчас трудно. Я здесь, чтобы помочь. Хочешь поговорить о том, что тебя беспокоит?"
+    elif analysis['sentiment_label'] == 'positive':
+        return "Это замечательно! Расскажи мне больше об этом."
+    elif analysis['sentiment_label'] == 'negative':
+        return "Понимаю тебя. Это важно обсудить. Расскажи мне больше."
+    return "Расскажи мне больше о том, что происходит."
+
+
+def persist_turn(user, session: ConversationSession, user_message: Message, therapist_text: str,
+                 state: Optional[ConversationState] = None) -> Message:
+    """
+    Save both messages of a turn and queue the follow-up work
+
+    One INSERT for both messages and, if given, one UPDATE of the session
+    statistics, inside a single transaction. The session row is locked
+    first, so concurrent turns of a session (two tabs, HTTP and WebSocket)
+    each fold their message into the state the other one stored instead of
+    overwriting it. Linking the latest mood,
+    reviewing high-risk sessions and refreshing today's rollup run as
+    background tasks after commit. bulk_create sends no signals, so the
+    rollup refresh and cache invalidation are queued here.
+    """
+    therapist_message = Message(
+        session=session,
+        user_id=session.user_id,
+        sender='therapist',
+        content=therapist_text
+    )
+    with transaction.atomic():
+        if state is not None:
+            stored = ConversationSession.objects.select_for_update().filter(
+                pk=session.pk
+            ).values_list('state', flat=True).first()
+            # `state` is session.state as read by prepare_turn plus this message
+            if stored and stored != session.state:
+                state = ConversationState(stored)
+                state.add_message({field: getattr(user_message, field) for field in HISTORY_FIELDS},
+                                  get_response_generator())
+        Message.objects.bulk_create([user_message, therapist_message])
+        if state is not None:
+            session.state = state.to_dict()
+            ConversationSession.objects.filter(pk=session.pk).update(state=session.state)
+        enqueue(link_emotional_state, user.id, session.id, timezone.now().isoformat())
+        enqueue(refresh_daily_analytics, user.id, timezone.localdate().isoformat(),
+                [user_message.id] if user_message.id else None)
+        bump_version(user.id)
+        if user_message.risk_level >= 7:
+            enqueue(review_session_risk, session.id)
+    return therapist_message
+
+
+def turn_payload(session: ConversationSession, user_message: Message,
+                 therapist_message: Message, analysis: Dict) -> Dict:
+    """Response body for a completed turn"""
+    serialized = MessageSerializer([user_message, therapist_message], many=True).data
+    payload = {
+        'session_id': session.id,
+        'user_message': serialized[0],
+        'therapist_message': serialized[1],
+        'analysis': analysis,
+        'risk_detected': analysis['risk_level'] >= 7,
+    }
+
+    # Check if response contains lesson recommendation
+    if 'практики' in therapist_message.content.lower():
+        topic = get_response_generator()._analyze_topic(user_message.content)
+        recommended_category = TOPIC_CATEGORY_MAP.get(topic)
+        if recommended_category:
+            payload['recommended_category'] = recommended_category
+
+    return payload
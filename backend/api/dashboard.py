@@ -0,0 +1,53 @@
+"""
+Dashboard metrics from daily rollups
+
+Past days are read from the Analytics rollups (one query for any range);
+only today is aggregated from raw rows, so the number of queries and the
+memory used do not grow with the user's history. The metrics themselves
+are computed by AnalyticsFrame; the correlation series is downsampled to
+the point budget.
+"""
+from datetime import date, timedelta
+from operator import itemgetter
+from typing import Dict, List
+from django.conf import settings
+from .analytics_frame import ROLLUP_FIELDS, AnalyticsFrame
+from .downsampling import downsample
+from .models import Analytics
+from .rollups import compute_day
+
+
+def daily_rollups(user, first_day: date, today: date) -> List[Dict]:
+    """Stored rollups from first_day up to yesterday plus today's computed from raw rows"""
+    rows = list(Analytics.objects.filter(
+        user=user,
+        date__gte=first_day,
+        date__lt=today
+    ).order_by('date').values('user_id', 'date', *ROLLUP_FIELDS))
+    rows.append({'user_id': user.id, 'date': today, **compute_day(user.id, today)})
+    return rows
+
+
+def dashboard_metrics(user, days: int, today: date, detailed: bool = True) -> Dict:
+    """
+    All dashboard aggregates for the last `days` calendar days including today
+
+    Correlation and themes are only computed when detailed (premium) is set.
+    """
+    first_day = today - timedelta(days=max(days, 1) - 1)
+    frame = AnalyticsFrame([user.id], daily_rollups(user, first_day, today))
+    metrics = frame.metrics(days, today, detailed)[0]
+    metrics['correlation_data'], metrics['correlation_resolution'] = downsample(
+        metrics['correlation_data'], settings.ANALYTICS_POINT_BUDGET,
+        lambda point: date.fromisoformat(point['date']), itemgetter('sentiment'), _merge_days
+    )
+    return metrics
+
+
+def _merge_days(start: date, points: List[Dict]) -> Dict:
+    """One correlation point averaging the days of a bucket"""
+    return {
+        'date': start.isoformat(),
+        'mood_intensity': sum(p['mood_intensity'] for p in points) / len(points),
+        'sentiment': sum(p['sentiment'] for p in points) / len(points),
+    }
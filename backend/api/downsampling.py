@@ -0,0 +1,109 @@
+"""
+Bounded-size time series for long-range analytics payloads
+
+Series longer than the point budget are first aggregated into time buckets
+(hour, day or week, the finest that fits the budget over the series' range)
+and, if still too long, reduced with largest-triangle-three-buckets (LTTB),
+which keeps the points that shape the curve.
+"""
+from datetime import date, datetime, timedelta
+from typing import Callable, List, Sequence, Tuple, TypeVar, Union
+import numpy as np
+from django.utils import timezone
+
+T = TypeVar('T')
+Moment = Union[datetime, date]
+
+BUCKETS = (('hour', timedelta(hours=1)), ('day', timedelta(days=1)), ('week', timedelta(weeks=1)))
+
+
+def _seconds(moment: Moment) -> float:
+    if isinstance(moment, datetime):
+        return moment.timestamp()
+    return moment.toordinal() * 86400.0
+
+
+def choose_bucket(first: Moment, last: Moment, budget: int) -> str:
+    """Finest bucket size giving at most `budget` buckets over [first, last]"""
+    span = _seconds(last) - _seconds(first)
+    for name, size in BUCKETS:
+        if span / size.total_seconds() < budget:
+            return name
+    return BUCKETS[-1][0]
+
+
+def bucket_start(moment: Moment, bucket: str) -> Moment:
+    """Start of the local hour, day or week (Monday) containing moment"""
+    if isinstance(moment, datetime):
+        moment = timezone.localtime(moment)
+        if bucket == 'hour':
+            return moment.replace(minute=0, second=0, microsecond=0)
+        moment = moment.date()
+    if bucket == 'week':
+        return moment - timedelta(days=moment.weekday())
+    return moment
+
+
+def aggregate_buckets(points: Sequence[T], time_of: Callable[[T], Moment], bucket: str,
+                      combine: Callable[[Moment, List[T]], T]) -> List[T]:
+    """Merge time-sorted points sharing a bucket into one point each via combine(start, group)"""
+    result, group, current = [], [], None
+    for point in points:
+        start = bucket_start(time_of(point), bucket)
+        if group and start != current:
+            result.append(combine(current, group))
+            group = []
+        current = start
+        group.append(point)
+    if group:
+        result.append(combine(current, group))
+    return result
+
+
+def lttb(points: Sequence[T], budget: int, time_of: Callable[[T], Moment],
+         value_of: Callable[[T], float]) -> List[T]:
+    """
+    Largest-triangle-three-buckets selection of at most `budget` time-sorted points
+
+    Keeps the first and last point and, from each of budget - 2 equal buckets
+    in between, the point forming the largest triangle with the previously
+    kept point and the average of the next bucket.
+    """
+    n = len(points)
+    if budget >= n:
+        return list(points)
+    if budget < 3:
+        return [points[0], points[-1]][:budget]
+
+    xs = np.array([_seconds(time_of(point)) for point in points])
+    ys = np.array([value_of(point) for point in points], dtype=float)
+    edges = np.linspace(1, n - 1, budget - 1).astype(int)
+
+    selected = [0]
+    for i in range(budget - 2):
+        lo, hi = edges[i], max(edges[i + 1], edges[i] + 1)
+        next_lo, next_hi = edges[i + 1], edges[i + 2] if i + 2 < len(edges) else n
+        next_x = xs[next_lo:next_hi].mean() if next_hi > next_lo else xs[-1]
+        next_y = ys[next_lo:next_hi].mean() if next_hi > next_lo else ys[-1]
+        a = selected[-1]
+        areas = np.abs(
+            (xs[a] - next_x) * (ys[lo:hi] - ys[a]) - (xs[a] - xs[lo:hi]) * (next_y - ys[a])
+        )
+        selected.append(lo + int(np.argmax(areas)))
+    selected.append(n - 1)
+    return [points[i] for i in selected]
+
+
+def downsample(points: Sequence[T], budget: int, time_of: Callable[[T], Moment],
+               value_of: Callable[[T], float], combine: Callable[[Moment, List[T]], T]) -> Tuple[List[T], str]:
+    """
+    Time-sorted points reduced to at most `budget`
+
+    Returns the points and their resolution: 'raw' if they already fit,
+    else the bucket size used.
+    """
+    if len(points) <= budget:
+        return list(points), 'raw'
+    bucket = choose_bucket(time_of(points[0]), time_of(points[-1]), budget)
+    bucketed = aggregate_buckets(points, time_of, bucket, combine)
+    return lttb(bucketed, budget, time_of, value_of), bucket
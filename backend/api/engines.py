@@ -0,0 +1,58 @@
+"""
+Process-wide registry of preloaded NLP engines
+
+SentimentAnalyzer parses the whole VADER lexicon on construction and
+TherapistResponseGenerator rebuilds all templates and keyword dicts, so both
+are built once per worker process and shared read-only between requests.
+"""
+import logging
+import threading
+
+logger = logging.getLogger('api')
+
+_lock = threading.Lock()
+_engines = {}
+
+
+def _build(name: str):
+    from .services import SentimentAnalyzer, TherapistResponseGenerator
+    factories = {
+        'sentiment_analyzer': SentimentAnalyzer,
+        'response_generator': TherapistResponseGenerator,
+    }
+    return factories[name]()
+
+
+def _get(name: str):
+    engine = _engines.get(name)
+    if engine is None:
+        with _lock:
+            # Double-checked: another thread may have built it while we waited
+            engine = _engines.get(name)
+            if engine is None:
+                engine = _build(name)
+                _engines[name] = engine
+    return engine
+
+
+def get_sentiment_analyzer():
+    """Shared SentimentAnalyzer instance (do not mutate)"""
+    return _get('sentiment_analyzer')
+
+
+def get_response_generator():
+    """Shared TherapistResponseGenerator instance (do not mutate)"""
+    return _get('response_generator')
+
+
+def preload():
+    """Build all engines now (AppConfig.ready / gunicorn post_fork)"""
+    get_sentiment_analyzer()
+    get_response_generator()
+    logger.info('NLP engines preloaded')
+
+
+def reset():
+    """Drop cached engines so the next access rebuilds them"""
+    with _lock:
+        _engines.clear()
@@ -0,0 +1,109 @@
+"""
+Mergeable HyperLogLog sketches for approximate distinct counts
+
+A sketch is 2**PRECISION one-byte registers (4 KB). It estimates the number
+of distinct values added to it with a relative standard error of
+1.04 / sqrt(2**PRECISION) ≈ 1.6% (about ±3.3% at 95% confidence) at every
+cardinality, using Ertl's improved estimator ("New cardinality estimation
+algorithms for HyperLogLog sketches", 2017), which needs neither bias tables
+nor the switch to linear counting whose bias around 2.5 * 2**PRECISION
+values doubles the error of the classic estimator. Sketches merge by taking
+the register-wise maximum, so per-day sketches answer distinct counts for
+any range of days, overlaps included.
+"""
+import hashlib
+import math
+from typing import Iterable
+import numpy as np
+
+PRECISION = 12
+REGISTERS = 1 << PRECISION
+RELATIVE_ERROR = 1.04 / math.sqrt(REGISTERS)
+
+_ALPHA_INF = 1 / (2 * math.log(2))
+_REST_BITS = 64 - PRECISION
+
+
+def _sigma(x: float) -> float:
+    """x + sum of x**(2**k) * 2**(k-1) for k >= 1 (share of empty registers term)"""
+    if x == 1:
+        return math.inf
+    y, z = 1.0, x
+    while True:
+        x *= x
+        previous, z = z, z + x * y
+        y += y
+        if z == previous:
+            return z
+
+
+def _tau(x: float) -> float:
+    """(1 - x - sum of (1 - x**(2**-k))**2 * 2**-k for k >= 1) / 3 (share of saturated registers term)"""
+    if x == 0 or x == 1:
+        return 0.0
+    y, z = 1.0, 1 - x
+    while True:
+        x = math.sqrt(x)
+        y *= 0.5
+        previous, z = z, z - (1 - x) ** 2 * y
+        if z == previous:
+            return z / 3
+
+
+class HyperLogLog:
+    """Distinct-count sketch over 64-bit hashes of the added values"""
+
+    def __init__(self, registers: np.ndarray = None):
+        self.registers = registers if registers is not None else np.zeros(REGISTERS, dtype=np.uint8)
+
+    @classmethod
+    def of(cls, values: Iterable) -> 'HyperLogLog':
+        sketch = cls()
+        for value in values:
+            sketch.add(value)
+        return sketch
+
+    @classmethod
+    def union(cls, sketches: Iterable['HyperLogLog']) -> 'HyperLogLog':
+        registers = np.zeros(REGISTERS, dtype=np.uint8)
+        for sketch in sketches:
+            np.maximum(registers, sketch.registers, out=registers)
+        return cls(registers)
+
+    @classmethod
+    def from_bytes(cls, data) -> 'HyperLogLog':
+        """Sketch stored by to_bytes (an empty value is an empty sketch)"""
+        data = bytes(data or b'')
+        if not data:
+            return cls()
+        if len(data) != REGISTERS:
+            raise ValueError(f'Expected {REGISTERS} sketch bytes, got {len(data)}')
+        return cls(np.frombuffer(data, dtype=np.uint8).copy())
+
+    def to_bytes(self) -> bytes:
+        """Register bytes, or b'' for an empty sketch"""
+        return self.registers.tobytes() if self.registers.any() else b''
+
+    def add(self, value) -> None:
+        hashed = int.from_bytes(hashlib.blake2b(str(value).encode(), digest_size=8).digest(), 'big')
+        index = hashed >> _REST_BITS
+        # Position of the leftmost 1 bit in the remaining bits
+        rank = _REST_BITS - (hashed & ((1 << _REST_BITS) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: 'HyperLogLog') -> 'HyperLogLog':
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def count(self) -> int:
+        """Estimated number of distinct values added"""
+        # Registers hold 0 (empty) up to _REST_BITS + 1 (all remaining bits zero)
+        histogram = np.bincount(self.registers, minlength=_REST_BITS + 2).tolist()
+        if histogram[0] == REGISTERS:
+            return 0
+        z = REGISTERS * _tau(1 - histogram[_REST_BITS + 1] / REGISTERS)
+        for rank in range(_REST_BITS, 0, -1):
+            z = 0.5 * (z + histogram[rank])
+        z += REGISTERS * _sigma(histogram[0] / REGISTERS)
+        return int(round(_ALPHA_INF * REGISTERS ** 2 / z))
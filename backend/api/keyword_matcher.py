@@ -0,0 +1,166 @@
+"""
+Single-pass multi-keyword matcher for risk, topic and theme detection
+
+All keyword vocabularies used by the analyzers live here and are compiled
+once into an Aho–Corasick automaton. One scan over the lowercased text
+returns every hit for every vocabulary, preserving the substring semantics
+of the previous `keyword in text.lower()` checks.
+"""
+from collections import deque
+from typing import Dict, List, Set, Tuple
+
+
+# Risk phrases used by SentimentAnalyzer (each distinct phrase adds risk)
+RISK_KEYWORDS = [
+    # English
+    'suicide', 'kill myself', 'end my life', 'want to die',
+    'hurt myself', 'self harm', 'no reason to live',
+    'better off dead', 'give up', 'hopeless',
+    # Russian
+    'суицид', 'покончить', 'убить себя', 'не хочу жить',
+    'лучше умереть', 'нет смысла', 'безнадежно',
+    'навредить себе', 'все кончено', 'все безнадежно',
+    'сдаюсь', 'не выдержу', 'больше не могу'
+]
+
+# Intensity words that raise risk by one point each
+INTENSITY_WORDS = ['very', 'extremely', 'completely', 'totally', 'absolutely']
+
+# Topic detection for TherapistResponseGenerator
+TOPIC_KEYWORDS = {
+    'work': ['работа', 'работе', 'начальник', 'коллеги', 'проект', 'задача', 'дедлайн', 'офис'],
+    'relationships': ['друг', 'друзья', 'семья', 'родители', 'партнер', 'отношения', 'любовь', 'расставание'],
+    'anxiety': ['тревож', 'беспоко', 'страх', 'паник', 'волную', 'нервнича', 'боюсь'],
+    'depression': ['груст', 'подавлен', 'плохо', 'нет сил', 'ничего не хочу', 'устал', 'апати'],
+    'health': ['здоров', 'болезн', 'боль', 'симптом', 'врач', 'лечени'],
+    'sleep': ['сон', 'сплю', 'бессонниц', 'не могу уснуть', 'усталость'],
+    'self_esteem': ['неуверен', 'не нравлюсь', 'недостоин', 'ничего не получается', 'неудач'],
+}
+
+# Risk indicators for AIModel.detect_risk_patterns
+MODEL_RISK_KEYWORDS = {
+    'suicide': ['суицид', 'покончить', 'убить себя', 'не хочу жить'],
+    'self_harm': ['навредить себе', 'порежу', 'самоповреждение'],
+    'hopelessness': ['безнадежно', 'нет смысла', 'все кончено'],
+    'isolation': ['одинок', 'никто не понимает', 'все отвернулись'],
+    'extreme_anxiety': ['паника', 'не могу дышать', 'сердце выпрыгивает'],
+    'depression': ['депрессия', 'нет сил', 'ничего не хочу'],
+}
+
+# Topics for AIModel.calculate_topic_relevance
+MODEL_TOPIC_KEYWORDS = {
+    'work': ['работа', 'начальник', 'коллеги', 'проект', 'задача'],
+    'relationships': ['друг', 'семья', 'партнер', 'отношения'],
+    'health': ['здоров', 'болезн', 'боль', 'симптом'],
+    'anxiety': ['тревож', 'беспоко', 'страх', 'паник'],
+    'depression': ['груст', 'подавлен', 'нет сил', 'апати'],
+    'sleep': ['сон', 'сплю', 'бессонниц'],
+}
+
+# Signals for AIModel.predict_user_needs
+NEEDS_KEYWORDS = {
+    'sleep': ['сон', 'sleep'],
+    'anxiety': ['тревож', 'беспоко', 'страх'],
+}
+
+# Dashboard dominant themes
+THEME_KEYWORDS = {
+    'тревога': ['тревож', 'беспоко', 'волную', 'страх', 'паник'],
+    'грусть': ['груст', 'печал', 'плохо', 'подавлен'],
+    'радость': ['рад', 'счастлив', 'хорошо', 'отлично', 'замечательно'],
+    'гнев': ['зло', 'злой', 'раздражен', 'злюсь'],
+    'спокойствие': ['спокоен', 'умиротворен', 'расслаблен'],
+    'работа': ['работа', 'проект', 'задача', 'дедлайн'],
+    'отношения': ['друг', 'семья', 'любов', 'отношен'],
+    'здоровье': ['здоров', 'болезн', 'боль', 'симптом']
+}
+
+VOCABULARIES = {
+    'risk': {'risk': RISK_KEYWORDS},
+    'intensity': {'intensity': INTENSITY_WORDS},
+    'topic': TOPIC_KEYWORDS,
+    'model_risk': MODEL_RISK_KEYWORDS,
+    'model_topic': MODEL_TOPIC_KEYWORDS,
+    'needs': NEEDS_KEYWORDS,
+    'theme': THEME_KEYWORDS,
+}
+
+
+class KeywordMatcher:
+    """Aho–Corasick automaton over a set of namespaced keyword vocabularies"""
+
+    def __init__(self, vocabularies: Dict[str, Dict[str, List[str]]]):
+        # keyword -> [(rank, namespace, category)]; rank keeps vocabulary order
+        self._tags: Dict[str, List[Tuple[int, str, str]]] = {}
+        rank = 0
+        for namespace, categories in vocabularies.items():
+            for category, keywords in categories.items():
+                for keyword in keywords:
+                    self._tags.setdefault(keyword.lower(), []).append((rank, namespace, category))
+                rank += 1
+
+        # Trie: per-node transition dict, failure link and output keywords
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[str]] = [[]]
+        for keyword in self._tags:
+            node = 0
+            for char in keyword:
+                nxt = self._goto[node].get(char)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][char] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                node = nxt
+            self._out[node].append(keyword)
+
+        # Breadth-first failure links; outputs are merged along the fail chain
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    def find(self, text: str) -> Set[str]:
+        """Return the distinct keywords that occur in text (case-insensitive)"""
+        found = set()
+        goto, fail, out = self._goto, self._fail, self._out
+        node = 0
+        for char in text.lower():
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if out[node]:
+                found.update(out[node])
+        return found
+
+    def match(self, text: str) -> Dict[str, Dict[str, int]]:
+        """
+        Scan text once and return hits for every vocabulary
+
+        Returns:
+            {namespace: {category: number of distinct keywords found}},
+            categories ordered as declared in the vocabulary
+        """
+        tags = sorted(tag for keyword in self.find(text) for tag in self._tags[keyword])
+        hits: Dict[str, Dict[str, int]] = {}
+        for _, namespace, category in tags:
+            categories = hits.setdefault(namespace, {})
+            categories[category] = categories.get(category, 0) + 1
+        return hits
+
+
+# Compiled once per process and shared read-only
+matcher = KeywordMatcher(VOCABULARIES)
+
+
+def match_keywords(text: str) -> Dict[str, Dict[str, int]]:
+    """Return all risk, topic and theme hits for text from a single pass"""
+    return matcher.match(text or '')
@@ -0,0 +1,37 @@
+"""
+Management command to move messages of long-ended sessions to cold storage
+(compressed MessageArchive rows), like the nightly archive job, or to bring
+archived sessions back. Archived sessions stay readable through the API.
+Usage: python manage.py archive_messages --months 13 --limit 1000
+"""
+from django.core.management.base import BaseCommand
+from api.archive import archivable_sessions, archive_cutoff, archive_sessions, rehydrate, rehydrate_range
+
+
+class Command(BaseCommand):
+    help = 'Archive messages of sessions ended over N months ago, or rehydrate archived sessions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months', type=int, default=None,
+                            help='Archive sessions ended this many 30-day months ago (default: MESSAGE_ARCHIVE_MONTHS)')
+        parser.add_argument('--batch-size', type=int, default=100, help='Sessions per batch (default: 100)')
+        parser.add_argument('--limit', type=int, default=None, help='Archive at most this many sessions')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the sessions that would be archived')
+        parser.add_argument('--rehydrate', type=int, nargs='*', default=None, metavar='SESSION_ID',
+                            help='Move these sessions (all archived sessions if none given) back to Message')
+
+    def handle(self, *args, **options):
+        if options['rehydrate'] is not None:
+            ids = options['rehydrate']
+            restored = rehydrate(ids) if ids else rehydrate_range()
+            self.stdout.write(self.style.SUCCESS(f'✓ Rehydrated {restored} message(s)'))
+            return
+
+        cutoff = archive_cutoff(options['months'])
+        if options['dry_run']:
+            count = archivable_sessions(cutoff).count()
+            self.stdout.write(self.style.SUCCESS(f'✓ {count} session(s) ended before {cutoff:%Y-%m-%d} would be archived'))
+            return
+
+        sessions, messages = archive_sessions(cutoff, options['batch_size'], options['limit'])
+        self.stdout.write(self.style.SUCCESS(f'✓ Archived {messages} message(s) of {sessions} session(s)'))
@@ -0,0 +1,60 @@
+"""
+Management command to fill Message.user from the message's session for rows
+written before the column existed. Walks message ids in order and updates one
+short batch per transaction, so the table is never locked for long; safe to
+stop and rerun (only rows still missing a user are touched, and the
+checkpointed id is the resume point). Run once after migrating: until it
+finishes, older messages are missing from user-scoped queries.
+Usage: python manage.py backfill_message_users --batch-size 5000 --sleep 0.1
+"""
+import time
+from pathlib import Path
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+from api.models import ConversationSession, Message
+
+
+class Command(BaseCommand):
+    help = 'Backfill the denormalized Message.user column in resumable batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Messages updated per transaction (default: 5000)')
+        parser.add_argument('--sleep', type=float, default=0.0,
+                            help='Seconds to pause between batches to limit load (default: 0)')
+        parser.add_argument('--start-id', type=int, default=None,
+                            help='Resume after this message id (overrides the checkpoint file)')
+        parser.add_argument('--checkpoint-file', default=None,
+                            help='File storing the last processed id; read on start, updated per batch')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        checkpoint = Path(options['checkpoint_file']) if options['checkpoint_file'] else None
+
+        last_id = options['start_id']
+        if last_id is None and checkpoint and checkpoint.exists():
+            last_id = int(checkpoint.read_text().strip() or 0)
+            self.stdout.write(f'Resuming after message id {last_id} (from {checkpoint})')
+        last_id = last_id or 0
+
+        session_user = ConversationSession.objects.filter(pk=OuterRef('session_id')).values('user_id')[:1]
+        updated = 0
+        while True:
+            ids = list(
+                Message.objects.filter(user__isnull=True, id__gt=last_id)
+                .order_by('id').values_list('id', flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            with transaction.atomic():
+                updated += Message.objects.filter(id__in=ids).update(user_id=Subquery(session_user))
+            last_id = ids[-1]
+            if checkpoint:
+                checkpoint.write_text(str(last_id))
+            self.stdout.write(f'  ... {updated} updated (last id {last_id})')
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        remaining = Message.objects.filter(user__isnull=True).count()
+        self.stdout.write(self.style.SUCCESS(f'✓ Backfilled {updated} message(s), {remaining} without a user left'))
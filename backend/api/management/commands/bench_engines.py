@@ -0,0 +1,58 @@
+"""
+Management command to benchmark per-turn NLP engine cost.
+Compares constructing SentimentAnalyzer/TherapistResponseGenerator per request
+against the shared instances from the engine registry.
+Usage: python manage.py bench_engines --turns 50
+"""
+import time
+import tracemalloc
+from django.core.management.base import BaseCommand
+from api import engines
+from api.services import SentimentAnalyzer, TherapistResponseGenerator
+
+
+SAMPLE_TEXTS = [
+    'Мне сегодня очень плохо, работа давит и я не могу уснуть',
+    'Сегодня отличный день, я рад и спокоен',
+    'Я тревожусь из-за отношений в семье',
+    'I feel hopeless and tired of everything',
+]
+
+
+class Command(BaseCommand):
+    help = 'Benchmark per-turn latency and allocations: fresh engines vs shared registry'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--turns', type=int, default=50, help='Number of simulated turns')
+
+    def _turn(self, analyzer, generator, text):
+        analysis = analyzer.analyze(text)
+        generator.generate_response(text, analysis['sentiment_label'], analysis['risk_level'])
+
+    def _run(self, turns, shared):
+        tracemalloc.start()
+        started = time.perf_counter()
+        for i in range(turns):
+            text = SAMPLE_TEXTS[i % len(SAMPLE_TEXTS)]
+            if shared:
+                analyzer, generator = engines.get_sentiment_analyzer(), engines.get_response_generator()
+            else:
+                analyzer, generator = SentimentAnalyzer(), TherapistResponseGenerator()
+            self._turn(analyzer, generator, text)
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return elapsed / turns * 1000, peak / 1024
+
+    def handle(self, *args, **options):
+        turns = options['turns']
+        engines.preload()
+
+        fresh_ms, fresh_kb = self._run(turns, shared=False)
+        shared_ms, shared_kb = self._run(turns, shared=True)
+
+        self.stdout.write(f'Turns: {turns}')
+        self.stdout.write(f'  Per-request engines: {fresh_ms:.2f} ms/turn, peak {fresh_kb:.0f} KiB')
+        self.stdout.write(f'  Shared registry:     {shared_ms:.2f} ms/turn, peak {shared_kb:.0f} KiB')
+        if shared_ms > 0:
+            self.stdout.write(self.style.SUCCESS(f'✓ Speedup: {fresh_ms / shared_ms:.1f}x'))
@@ -0,0 +1,86 @@
+"""
+Management command to benchmark the OpenAI client against a local mock server.
+Compares a new connection per request (plain requests.post) with the pooled
+keep-alive session and the async stream under concurrency.
+Usage: python manage.py bench_openai --requests 100 --concurrency 10
+"""
+import asyncio
+import statistics
+import threading
+import time
+from http.server import ThreadingHTTPServer
+import requests
+from django.core.management.base import BaseCommand
+from api.openai_service import OpenAIService, HTTPX_AVAILABLE
+from api.management.commands.openai_stub import make_handler, DEFAULT_REPLY
+
+
+HISTORY = [{'sender': 'user', 'content': 'Привет'}, {'sender': 'therapist', 'content': 'Здравствуй!'}]
+
+
+class Command(BaseCommand):
+    help = 'Benchmark unpooled vs pooled vs async streamed OpenAI calls against a local mock server'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=100, help='Calls per scenario')
+        parser.add_argument('--concurrency', type=int, default=10, help='Concurrent calls in the async scenario')
+        parser.add_argument('--latency', type=float, default=0.0, help='Mock model latency in seconds')
+
+    def _report(self, name, timings, wall):
+        timings = sorted(timings)
+        p95 = timings[max(0, int(len(timings) * 0.95) - 1)]
+        self.stdout.write(
+            f'  {name:<22} mean {statistics.mean(timings) * 1000:7.2f} ms  '
+            f'p95 {p95 * 1000:7.2f} ms  total {wall:6.2f} s'
+        )
+
+    def handle(self, *args, **options):
+        count = options['requests']
+        server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(DEFAULT_REPLY, options['latency'], 0))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f'http://127.0.0.1:{server.server_port}/v1/chat/completions'
+
+        service = OpenAIService()
+        service.api_key, service.enabled, service.base_url = 'stub', True, base_url
+        service.session.headers.update(service._headers())
+        payload = service._payload(service._build_messages('Мне тревожно', HISTORY, 'negative', 3))
+
+        self.stdout.write(f'Mock server: {base_url}, {count} calls per scenario')
+
+        # Baseline: new connection for every call
+        timings, started = [], time.perf_counter()
+        for _ in range(count):
+            t0 = time.perf_counter()
+            requests.post(base_url, headers=service._headers(), json=payload, timeout=10).json()
+            timings.append(time.perf_counter() - t0)
+        self._report('requests.post', timings, time.perf_counter() - started)
+
+        # Pooled keep-alive session
+        timings, started = [], time.perf_counter()
+        for _ in range(count):
+            t0 = time.perf_counter()
+            service.generate_response('Мне тревожно', HISTORY, 'negative', 3)
+            timings.append(time.perf_counter() - t0)
+        self._report('pooled session', timings, time.perf_counter() - started)
+
+        # Async client with bounded concurrency
+        async def run_async():
+            semaphore = asyncio.Semaphore(options['concurrency'])
+            timings = []
+
+            async def one():
+                async with semaphore:
+                    t0 = time.perf_counter()
+                    async for _ in service.astream_response('Мне тревожно', HISTORY, 'negative', 3):
+                        pass
+                    timings.append(time.perf_counter() - t0)
+
+            started = time.perf_counter()
+            await asyncio.gather(*(one() for _ in range(count)))
+            return timings, time.perf_counter() - started
+
+        timings, wall = asyncio.run(run_async())
+        label = 'async (httpx)' if HTTPX_AVAILABLE else 'async (thread)'
+        self._report(f'{label} x{options["concurrency"]}', timings, wall)
+
+        server.shutdown()
@@ -57,9 +57,9 @@ class Command(BaseCommand):
             session_count = sessions.count()
             deleted_data['sessions'] += session_count
             
-            messages_count = Message.objects.filter(session__user=user).count()
+            messages_count = Message.objects.filter(user=user).count()
             deleted_data['messages'] += messages_count
-            Message.objects.filter(session__user=user).delete()
+            Message.objects.filter(user=user).delete()
             sessions.delete()
             
             deleted_data['emotional_states'] += EmotionalState.objects.filter(user=user).delete()[0]
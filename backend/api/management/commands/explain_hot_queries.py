@@ -0,0 +1,240 @@
+"""
+Management command to check that hot queries use indexes.
+Runs the real hot code paths (rollups, admin snapshots, timeline, session
+lookups, leaderboard), captures their SELECTs and EXPLAINs each one; fails
+if any plan falls back to a sequential scan of a large table. By default it
+seeds a realistic dataset inside a transaction that is rolled back;
+--no-seed explains against the current data instead.
+Usage: python manage.py explain_hot_queries --users 300 --days 180
+"""
+import random
+import re
+from contextlib import contextmanager
+from datetime import timedelta
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from api import admin_metrics, rollups, timeline
+from api.analytics_frame import AnalyticsFrame
+from api.conversation_utils import resolve_session, session_limit_reached, with_message_stats
+from api.models import (
+    Analytics, CBTContent, CBTProgress, ConversationSession, EmotionalState, Message
+)
+from api.pagination import MessagePagination, SessionPagination, keyset_after
+
+# Tables that must never be scanned in full by a hot query
+WATCHED_TABLES = tuple(model._meta.db_table for model in (
+    Analytics, CBTProgress, ConversationSession, EmotionalState, Message
+))
+
+# SQLite: "SCAN api_message" (no index); PostgreSQL: "Seq Scan on api_message"
+SQLITE_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)(?: AS \w+)?$')
+POSTGRES_SCAN = re.compile(r'Seq Scan on (\w+)')
+
+MOODS = [code for code, _ in EmotionalState.MOOD_CHOICES]
+
+
+class Command(BaseCommand):
+    help = 'EXPLAIN the hot queries and fail on sequential scans of large tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=300, help='Users to seed')
+        parser.add_argument('--days', type=int, default=180, help='Days of history to seed')
+        parser.add_argument('--no-seed', action='store_true', help='Explain against the current data')
+        parser.add_argument('--verbose-plans', action='store_true', help='Print every plan')
+
+    def handle(self, *args, **options):
+        if options['no_seed']:
+            failures = self._check(options['verbose_plans'])
+        else:
+            with transaction.atomic():
+                self._seed(options['users'], options['days'])
+                self._analyze()
+                failures = self._check(options['verbose_plans'])
+                transaction.set_rollback(True)
+
+        if failures:
+            for name, sql, plan in failures:
+                self.stdout.write(self.style.ERROR(f'✗ {name}: sequential scan'))
+                self.stdout.write(f'  {sql}')
+                self.stdout.write('  ' + '\n  '.join(plan))
+            raise CommandError(f'{len(failures)} hot query plan(s) use a sequential scan')
+        self.stdout.write(self.style.SUCCESS('✓ All hot queries use indexes'))
+
+    # ------------------------------------------------------------------
+    # Hot paths
+    # ------------------------------------------------------------------
+
+    def _hot_paths(self):
+        """(name, callable) pairs; each callable runs one hot code path"""
+        session = ConversationSession.objects.filter(is_active=True).order_by('-id').first()
+        user = session.user if session else User.objects.order_by('-id').first()
+        today = timezone.localdate()
+        now = timezone.now()
+        return [
+            ('rollups.compute_day', lambda: rollups.compute_day(user.id, today)),
+            ('admin_metrics.compute_days (live days)', lambda: admin_metrics.compute_days(
+                today - timedelta(days=admin_metrics.SETTLE_DAYS - 1), today)),
+            ('admin_metrics.exact_distinct_users (week)', lambda: admin_metrics.exact_distinct_users(
+                today - timedelta(days=6), today)),
+            ('admin_metrics.engagement_leaderboard', lambda: admin_metrics.engagement_leaderboard(
+                today - timedelta(days=29), today, 'messages', 10)),
+            ('admin dashboard: active sessions', lambda: ConversationSession.objects.filter(
+                is_active=True).count()),
+            ('admin dashboard: CBT progress', lambda: CBTProgress.objects.filter(
+                last_accessed__gte=now - timedelta(days=7)).count()),
+            ('AnalyticsFrame.load (user)', lambda: AnalyticsFrame.load(
+                today - timedelta(days=29), today, [user.id])),
+            ('timeline.dashboard_timeline', lambda: timeline.dashboard_timeline(
+                user, now - timedelta(days=30))),
+            ('timeline.session_timeline', lambda: timeline.session_timeline(
+                user, now - timedelta(days=30))),
+            ('conversation_utils.session_limit_reached', lambda: session_limit_reached(user)),
+            ('conversation_utils.resolve_session (active)', lambda: resolve_session(user)),
+            ('session history tail', lambda: list(Message.objects.filter(
+                session=session).order_by('-created_at', '-id').values('id')[:9])),
+            ('session messages', lambda: list(Message.objects.filter(
+                session=session).order_by('created_at').values('id'))),
+            ('user sessions', lambda: list(ConversationSession.objects.filter(
+                user=user).values('id')[:20])),
+            ('message page (keyset)', lambda: list(Message.objects.filter(
+                session=session).filter(keyset_after(MessagePagination().fields, (now - timedelta(days=1), 0)))
+                .order_by(*MessagePagination.ordering).values('id')[:21])),
+            ('user message delta (keyset)', lambda: list(Message.objects.filter(
+                user=user).filter(keyset_after(MessagePagination().fields, (now - timedelta(hours=1), 0)))
+                .order_by(*MessagePagination.ordering).values('id')[:21])),
+            ('session page (keyset)', lambda: list(ConversationSession.objects.filter(
+                user=user).filter(keyset_after(SessionPagination().fields, (now - timedelta(days=30), 0), True))
+                .order_by(*SessionPagination.ordering).values('id')[:21])),
+            ('session list with message stats', lambda: list(with_message_stats(ConversationSession.objects.filter(
+                user=user)).order_by(*SessionPagination.ordering).values('id', 'message_count')[:21])),
+            ('user mood history', lambda: list(EmotionalState.objects.filter(
+                user=user).order_by('-recorded_at').values('mood')[:3])),
+            ('user CBT progress', lambda: list(CBTProgress.objects.filter(
+                user=user).order_by('-last_accessed').values('id'))),
+        ]
+
+    def _check(self, verbose):
+        failures = []
+        prefix = connection.ops.explain_query_prefix()
+        for name, run in self._hot_paths():
+            with CaptureQueriesContext(connection) as queries:
+                run()
+            for query in queries.captured_queries:
+                sql = query['sql']
+                if not sql.lstrip().upper().startswith('SELECT'):
+                    continue
+                with connection.cursor() as cursor:
+                    cursor.execute(f'{prefix} {sql}')
+                    plan = [str(row[-1]) for row in cursor.fetchall()]
+                if verbose:
+                    self.stdout.write(f'{name}\n  ' + '\n  '.join(plan))
+                if self._scanned_tables(plan, sql):
+                    failures.append((name, sql, plan))
+        return failures
+
+    def _scanned_tables(self, plan, sql):
+        """Watched tables the plan reads in full"""
+        if connection.vendor == 'postgresql':
+            names = [match.group(1) for line in plan for match in POSTGRES_SCAN.finditer(line)]
+        else:
+            names = [match.group(1) for line in plan if (match := SQLITE_SCAN.match(line.strip()))]
+        # Subquery aliases (U0, ...) stand for a watched table when it is queried under that alias
+        scanned = set()
+        for name in names:
+            if name in WATCHED_TABLES:
+                scanned.add(name)
+            else:
+                aliased = re.search(rf'"?(\w+)"? {name}\b', sql)
+                if aliased and aliased.group(1) in WATCHED_TABLES:
+                    scanned.add(aliased.group(1))
+        return scanned
+
+    # ------------------------------------------------------------------
+    # Seeding
+    # ------------------------------------------------------------------
+
+    def _analyze(self):
+        with connection.cursor() as cursor:
+            for table in WATCHED_TABLES + (User._meta.db_table,):
+                cursor.execute(f'ANALYZE {table}')
+
+    @contextmanager
+    def _explicit_timestamps(self):
+        """Let bulk_create keep the seeded auto_now/auto_now_add values"""
+        fields = [
+            field for model in (ConversationSession, Message, EmotionalState, CBTProgress)
+            for field in model._meta.fields if getattr(field, 'auto_now_add', False) or getattr(field, 'auto_now', False)
+        ]
+        saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+        for field in fields:
+            field.auto_now = field.auto_now_add = False
+        try:
+            yield
+        finally:
+            for field, auto_now, auto_now_add in saved:
+                field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+    def _seed(self, users, days):
+        """About one session every three days per user, six messages each, daily moods and rollups"""
+        rng = random.Random(42)
+        now = timezone.now()
+        self.stdout.write(f'Seeding {users} users over {days} days (rolled back afterwards)...')
+
+        User.objects.bulk_create(
+            [User(username=f'explain-{i}', email=f'explain-{i}@example.com') for i in range(users)],
+            batch_size=1000,
+        )
+        user_ids = list(User.objects.filter(username__startswith='explain-').values_list('id', flat=True))
+        contents = CBTContent.objects.bulk_create(
+            [CBTContent(title=f'Explain {i}', category='techniques', content='-', order=i) for i in range(20)]
+        )
+
+        with self._explicit_timestamps():
+            sessions = []
+            for user_id in user_ids:
+                for day in rng.sample(range(days), max(days // 3, 1)):
+                    started = now - timedelta(days=day, minutes=rng.randint(0, 1400))
+                    sessions.append(ConversationSession(
+                        user_id=user_id, started_at=started, ended_at=started + timedelta(minutes=20),
+                        is_active=False,
+                    ))
+                sessions[-1].is_active, sessions[-1].ended_at = True, None
+            ConversationSession.objects.bulk_create(sessions, batch_size=2000)
+
+            messages = []
+            seeded = ConversationSession.objects.filter(user_id__in=user_ids).values('id', 'user_id', 'started_at')
+            for session in seeded.iterator():
+                for turn in range(6):
+                    messages.append(Message(
+                        session_id=session['id'], user_id=session['user_id'],
+                        sender='user' if turn % 2 == 0 else 'therapist', content='-',
+                        sentiment_score=rng.uniform(-1, 1), risk_level=8 if rng.random() < 0.01 else rng.randint(0, 4),
+                        created_at=session['started_at'] + timedelta(minutes=turn * 3),
+                    ))
+            Message.objects.bulk_create(messages, batch_size=5000)
+
+            EmotionalState.objects.bulk_create([
+                EmotionalState(
+                    user_id=user_id, mood=rng.choice(MOODS), intensity=rng.randint(1, 10),
+                    recorded_at=now - timedelta(days=day, minutes=rng.randint(0, 1400)),
+                )
+                for user_id in user_ids for day in rng.sample(range(days), days // 2)
+            ], batch_size=5000)
+
+            CBTProgress.objects.bulk_create([
+                CBTProgress(
+                    user_id=user_id, content=content, completed=rng.random() < 0.5, progress_percentage=50,
+                    last_accessed=now - timedelta(days=rng.randint(0, days)),
+                    completed_at=now - timedelta(days=rng.randint(0, days)),
+                )
+                for user_id in user_ids for content in rng.sample(contents, 5)
+            ], batch_size=5000)
+
+        Analytics.objects.bulk_create([
+            Analytics(user_id=user_id, date=timezone.localdate() - timedelta(days=day), total_sessions=1,
+                      total_messages=rng.randint(1, 20))
+            for user_id in user_ids for day in rng.sample(range(days), days // 3)
+        ], batch_size=5000)
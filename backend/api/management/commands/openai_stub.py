@@ -0,0 +1,102 @@
+"""
+Management command to run a local OpenAI-compatible chat completions stub.
+Serves both regular and streaming (server-sent events) responses so the
+OpenAI integration can be exercised without network access or an API key.
+Usage: python manage.py openai_stub --port 8765
+       OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=stub python manage.py runserver
+"""
+import json
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from django.core.management.base import BaseCommand
+
+
+DEFAULT_REPLY = 'Я слышу тебя. Расскажи, пожалуйста, что сейчас беспокоит тебя больше всего?'
+
+
+def make_handler(reply, latency, token_delay):
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        # Headers and body are separate writes; avoid Nagle stalls on keep-alive connections
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_POST(self):
+            if not self.path.rstrip('/').endswith('/chat/completions'):
+                self.send_error(404)
+                return
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length) or b'{}')
+            time.sleep(latency)
+            if request.get('stream'):
+                self._stream(request)
+            else:
+                self._complete(request)
+
+        def _complete(self, request):
+            body = json.dumps({
+                'id': 'chatcmpl-stub',
+                'object': 'chat.completion',
+                'model': request.get('model', 'stub'),
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': reply}, 'finish_reason': 'stop'}],
+            }).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _stream(self, request):
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            # One token per word, keeping the separating spaces
+            words = reply.split(' ')
+            tokens = [word + (' ' if i < len(words) - 1 else '') for i, word in enumerate(words)]
+            for token in tokens:
+                chunk = {
+                    'id': 'chatcmpl-stub',
+                    'object': 'chat.completion.chunk',
+                    'model': request.get('model', 'stub'),
+                    'choices': [{'index': 0, 'delta': {'content': token}, 'finish_reason': None}],
+                }
+                self._write_chunk(f'data: {json.dumps(chunk)}\n\n')
+                time.sleep(token_delay)
+            self._write_chunk('data: [DONE]\n\n')
+            self.wfile.write(b'0\r\n\r\n')
+
+        def _write_chunk(self, text):
+            data = text.encode()
+            self.wfile.write(f'{len(data):X}\r\n'.encode() + data + b'\r\n')
+            self.wfile.flush()
+
+    return StubHandler
+
+
+class Command(BaseCommand):
+    help = 'Run a local OpenAI-compatible chat completions stub (supports stream=true)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--reply', default=DEFAULT_REPLY, help='Assistant reply to return')
+        parser.add_argument('--latency', type=float, default=0.0,
+                            help='Seconds to wait before responding (simulates model latency)')
+        parser.add_argument('--token-delay', type=float, default=0.02,
+                            help='Seconds between streamed tokens')
+
+    def handle(self, *args, **options):
+        handler = make_handler(options['reply'], options['latency'], options['token_delay'])
+        server = ThreadingHTTPServer((options['host'], options['port']), handler)
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ OpenAI stub listening on http://{options["host"]}:{options["port"]}/v1'
+        ))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,50 @@
+"""
+Management command for monthly range partitioning of the Message table
+(PostgreSQL only). --convert replaces the table with a partitioned copy
+online (once; pause the archive job, rescore_messages and
+backfill_message_users meanwhile). Without it, creates the coming months'
+partitions like the daily beat task. --drop-empty drops old monthly
+partitions emptied by the archive job.
+Usage: python manage.py partition_messages --convert --batch-size 50000
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from api import partitions
+from api.archive import archive_cutoff
+
+
+class Command(BaseCommand):
+    help = 'Partition the Message table by month (PostgreSQL) and maintain its partitions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--convert', action='store_true',
+                            help='Convert the existing table to a partitioned one (online copy, then swap)')
+        parser.add_argument('--batch-size', type=int, default=50000,
+                            help='Rows copied per transaction by --convert (default: 50000)')
+        parser.add_argument('--ahead', type=int, default=3,
+                            help='Months of partitions to create ahead of the current one (default: 3)')
+        parser.add_argument('--drop-empty', action='store_true',
+                            help='Drop empty monthly partitions older than the archive cutoff')
+
+    def handle(self, *args, **options):
+        if not partitions.supported():
+            raise CommandError('Message partitioning requires PostgreSQL (DB_ENGINE=django.db.backends.postgresql)')
+
+        if options['convert']:
+            try:
+                copied = partitions.convert(options['batch_size'], options['ahead'], log=self.stdout.write)
+            except RuntimeError as e:
+                raise CommandError(str(e))
+            self.stdout.write(self.style.SUCCESS(
+                f'✓ Copied {copied} message(s) into the partitioned table; '
+                f'drop {partitions.OLD_TABLE} once verified'
+            ))
+        elif not partitions.is_partitioned():
+            raise CommandError(f'{partitions.TABLE} is not partitioned yet, run with --convert first')
+
+        created = partitions.ensure_partitions(options['ahead'])
+        self.stdout.write(self.style.SUCCESS(f'✓ Created {len(created)} partition(s)'))
+
+        if options['drop_empty']:
+            dropped = partitions.drop_empty_partitions(timezone.localdate(archive_cutoff()))
+            self.stdout.write(self.style.SUCCESS(f'✓ Dropped {len(dropped)} empty partition(s)'))
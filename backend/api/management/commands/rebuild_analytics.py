@@ -0,0 +1,72 @@
+"""
+Management command to rebuild the daily Analytics rollups from raw rows.
+Needed once after deploying the rollup fields and after bulk rewrites that
+send no signals. Days whose activity is gone lose their stored row.
+Usage: python manage.py rebuild_analytics --since 2026-01-01 --user alice
+"""
+from collections import defaultdict
+from datetime import datetime
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth.models import User
+from api.models import Analytics, CBTProgress, ConversationSession, EmotionalState, Message
+from api.rollups import refresh_day
+
+
+class Command(BaseCommand):
+    help = 'Recompute daily per-user Analytics rollups'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', default=None, help='Only days on/after YYYY-MM-DD')
+        parser.add_argument('--until', default=None, help='Only days before YYYY-MM-DD')
+        parser.add_argument('--user', default=None, help='Only this user (id or username)')
+
+    def _parse_date(self, value, name):
+        try:
+            return datetime.strptime(value, '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError(f'--{name} must be in YYYY-MM-DD format')
+
+    def _resolve_user(self, value):
+        lookup = {'id': int(value)} if value.isdigit() else {'username': value}
+        try:
+            return User.objects.get(**lookup)
+        except User.DoesNotExist:
+            raise CommandError(f'User not found: {value}')
+
+    def handle(self, *args, **options):
+        since = self._parse_date(options['since'], 'since') if options['since'] else None
+        until = self._parse_date(options['until'], 'until') if options['until'] else None
+        user = self._resolve_user(options['user']) if options['user'] else None
+
+        # Every (user, local day) with activity, plus stored rows that may now be stale
+        sources = (
+            (Message.objects.filter(user__isnull=False), 'user_id', 'created_at'),
+            (ConversationSession.objects, 'user_id', 'started_at'),
+            (EmotionalState.objects.filter(user__isnull=False), 'user_id', 'recorded_at'),
+            (CBTProgress.objects.filter(completed=True), 'user_id', 'completed_at'),
+            (Analytics.objects, 'user_id', 'date'),
+        )
+        days_by_user = defaultdict(set)
+        for queryset, user_field, date_field in sources:
+            day_field = date_field if date_field == 'date' else f'{date_field}__date'
+            if user:
+                queryset = queryset.filter(**{user_field: user.id})
+            if since:
+                queryset = queryset.filter(**{f'{day_field}__gte': since})
+            if until:
+                queryset = queryset.filter(**{f'{day_field}__lt': until})
+            pairs = queryset.order_by().values_list(user_field, day_field).distinct()
+            for user_id, day in pairs:
+                if day is not None:
+                    days_by_user[user_id].add(day)
+
+        total = 0
+        for user_id, days in sorted(days_by_user.items()):
+            for day in sorted(days):
+                refresh_day(user_id, day)
+            total += len(days)
+            self.stdout.write(f'  ... user {user_id}: {len(days)} day(s)')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Rebuilt {total} daily rollup(s) for {len(days_by_user)} user(s)'
+        ))
@@ -0,0 +1,29 @@
+"""
+Management command to (re)build the daily platform metrics snapshots read by
+the admin dashboard. Without options it continues incrementally like the
+periodic task; --since/--until rebuild a range (e.g. the first backfill).
+Usage: python manage.py refresh_platform_snapshots --since 2026-01-01
+"""
+from datetime import datetime
+from django.core.management.base import BaseCommand, CommandError
+from api.admin_metrics import refresh_snapshots
+
+
+class Command(BaseCommand):
+    help = 'Recompute daily PlatformMetricsSnapshot rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', default=None, help='First day to rebuild (YYYY-MM-DD)')
+        parser.add_argument('--until', default=None, help='Last day to rebuild, inclusive (default: yesterday)')
+
+    def _parse_date(self, value, name):
+        try:
+            return datetime.strptime(value, '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError(f'--{name} must be in YYYY-MM-DD format')
+
+    def handle(self, *args, **options):
+        since = self._parse_date(options['since'], 'since') if options['since'] else None
+        until = self._parse_date(options['until'], 'until') if options['until'] else None
+        written = refresh_snapshots(since, until)
+        self.stdout.write(self.style.SUCCESS(f'✓ Refreshed {written} daily snapshot(s)'))
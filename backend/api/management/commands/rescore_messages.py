@@ -0,0 +1,137 @@
+"""
+Management command to recompute sentiment and risk for stored user messages.
+Streams rows in id order, scores them in batches (optionally in a process pool)
+and writes back with bulk_update. Resumable from the last checkpointed id.
+Scores match live turns, including the risk raise of distressed assessment
+answers. bulk_update sends no signals, so each batch refreshes the rollups of
+the (user, day) pairs it changed and drops those users' cached responses.
+Archived messages are not rescored.
+Usage: python manage.py rescore_messages --processes 4 --since 2026-01-01
+"""
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, time
+from pathlib import Path
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.contrib.auth.models import User
+from django.utils import timezone
+from api.conversation_utils import apply_assessment_risk
+from api.engines import get_sentiment_analyzer
+from api.models import Message
+from api.response_cache import bump_version
+from api.rollups import refresh_day
+from api.services import init_pool_worker
+
+
+SCORE_FIELDS = ['sentiment_score', 'sentiment_label', 'risk_level']
+
+
+class Command(BaseCommand):
+    help = 'Re-run sentiment and risk analysis over historical user messages'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000,
+                            help='Messages scored and written per batch (default: 2000)')
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help='Rows fetched per database round trip and per pool task (default: 500)')
+        parser.add_argument('--processes', type=int, default=1,
+                            help='Worker processes for scoring (default: 1, in-process)')
+        parser.add_argument('--start-id', type=int, default=None,
+                            help='Resume after this message id (overrides the checkpoint file)')
+        parser.add_argument('--checkpoint-file', default=None,
+                            help='File storing the last processed id; read on start, updated per batch')
+        parser.add_argument('--since', default=None, help='Only messages created on/after YYYY-MM-DD')
+        parser.add_argument('--until', default=None, help='Only messages created before YYYY-MM-DD')
+        parser.add_argument('--user', default=None, help='Only messages of this user (id or username)')
+        parser.add_argument('--dry-run', action='store_true', help='Score but do not write changes')
+
+    def _parse_date(self, value, name):
+        try:
+            date = datetime.strptime(value, '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError(f'--{name} must be in YYYY-MM-DD format')
+        return timezone.make_aware(datetime.combine(date, time.min))
+
+    def _resolve_user(self, value):
+        lookup = {'id': int(value)} if value.isdigit() else {'username': value}
+        try:
+            return User.objects.get(**lookup)
+        except User.DoesNotExist:
+            raise CommandError(f'User not found: {value}')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        chunk_size = options['chunk_size']
+        processes = options['processes']
+        dry_run = options['dry_run']
+        checkpoint = Path(options['checkpoint_file']) if options['checkpoint_file'] else None
+
+        start_id = options['start_id']
+        if start_id is None and checkpoint and checkpoint.exists():
+            start_id = int(checkpoint.read_text().strip() or 0)
+            self.stdout.write(f'Resuming after message id {start_id} (from {checkpoint})')
+
+        queryset = Message.objects.filter(sender='user')
+        if start_id:
+            queryset = queryset.filter(id__gt=start_id)
+        if options['since']:
+            queryset = queryset.filter(created_at__gte=self._parse_date(options['since'], 'since'))
+        if options['until']:
+            queryset = queryset.filter(created_at__lt=self._parse_date(options['until'], 'until'))
+        if options['user']:
+            queryset = queryset.filter(user=self._resolve_user(options['user']))
+
+        # Only the columns needed for scoring and the rollup day; id order makes the checkpoint a resume point
+        rows = queryset.order_by('id').only(
+            'id', 'user_id', 'created_at', 'content', *SCORE_FIELDS
+        ).iterator(chunk_size=chunk_size)
+
+        analyzer = get_sentiment_analyzer()
+        pool = ProcessPoolExecutor(max_workers=processes, initializer=init_pool_worker) if processes > 1 else None
+        totals = {'scanned': 0, 'changed': 0}
+        try:
+            batch = []
+            for message in rows:
+                batch.append(message)
+                if len(batch) >= batch_size:
+                    self._process_batch(batch, analyzer, pool, chunk_size, dry_run, checkpoint, totals)
+                    batch = []
+            if batch:
+                self._process_batch(batch, analyzer, pool, chunk_size, dry_run, checkpoint, totals)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+        verb = 'would be updated' if dry_run else 'updated'
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Scanned {totals["scanned"]} message(s), {totals["changed"]} {verb}'
+        ))
+
+    def _process_batch(self, batch, analyzer, pool, chunk_size, dry_run, checkpoint, totals):
+        results = analyzer.analyze_many([m.content for m in batch], chunk_size=chunk_size, pool=pool)
+
+        changed = []
+        for message, analysis in zip(batch, results):
+            apply_assessment_risk(message.content, analysis)
+            new_values = (analysis['sentiment_score'], analysis['sentiment_label'], analysis['risk_level'])
+            if new_values != tuple(getattr(message, field) for field in SCORE_FIELDS):
+                message.sentiment_score, message.sentiment_label, message.risk_level = new_values
+                changed.append(message)
+
+        if changed and not dry_run:
+            touched = sorted({(m.user_id, timezone.localdate(m.created_at)) for m in changed if m.user_id})
+            with transaction.atomic():
+                Message.objects.bulk_update(changed, SCORE_FIELDS, batch_size=chunk_size)
+                # bulk_update sends no signals, so do what they would have done
+                for user_id, day in touched:
+                    # Texts are unchanged, so the stored theme counts stay
+                    refresh_day(user_id, day, new_message_ids=())
+                for user_id in {user_id for user_id, _ in touched}:
+                    bump_version(user_id)
+
+        totals['scanned'] += len(batch)
+        totals['changed'] += len(changed)
+        last_id = batch[-1].id
+        if checkpoint and not dry_run:
+            checkpoint.write_text(str(last_id))
+        self.stdout.write(f'  ... {totals["scanned"]} scanned, {totals["changed"]} changed (last id {last_id})')
@@ -0,0 +1,77 @@
+"""
+Index migration operations that do not block writes on PostgreSQL
+
+CREATE/DROP INDEX CONCURRENTLY lets inserts and updates continue while the
+index is built or dropped, but cannot run inside a transaction, so
+migrations using these operations set atomic = False. Other databases, and
+partitioned tables (which PostgreSQL cannot index concurrently), get the
+plain operation.
+"""
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db.migrations.operations import AddIndex, AlterField
+
+
+def _concurrent(schema_editor, table: str) -> bool:
+    if schema_editor.connection.vendor != 'postgresql':
+        return False
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('SELECT NOT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s))',
+                       [table])
+        return cursor.fetchone()[0]
+
+
+class AddIndexOnline(AddIndexConcurrently):
+    """AddIndex built with CREATE INDEX CONCURRENTLY where possible"""
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if _concurrent(schema_editor, model._meta.db_table):
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+        else:
+            AddIndex.database_forwards(self, app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        model = from_state.apps.get_model(app_label, self.model_name)
+        if _concurrent(schema_editor, model._meta.db_table):
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+        else:
+            AddIndex.database_backwards(self, app_label, schema_editor, from_state, to_state)
+
+
+class DropFieldIndexOnline(AlterField):
+    """
+    AlterField to db_index=False whose index is dropped with DROP INDEX CONCURRENTLY where possible
+
+    For foreign keys already covered by a composite index that starts with
+    the same column.
+    """
+
+    def _index(self, schema_editor, model):
+        column = model._meta.get_field(self.name).column
+        return schema_editor._create_index_name(model._meta.db_table, [column]), column
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        model = from_state.apps.get_model(app_label, self.model_name)
+        if not self.allow_migrate_model(schema_editor.connection.alias, model):
+            return
+        if _concurrent(schema_editor, model._meta.db_table):
+            name, _ = self._index(schema_editor, model)
+            schema_editor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {schema_editor.quote_name(name)}')
+        else:
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if not self.allow_migrate_model(schema_editor.connection.alias, model):
+            return
+        if _concurrent(schema_editor, model._meta.db_table):
+            name, column = self._index(schema_editor, model)
+            schema_editor.execute(
+                f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {schema_editor.quote_name(name)} '
+                f'ON {schema_editor.quote_name(model._meta.db_table)} ({schema_editor.quote_name(column)})'
+            )
+        else:
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+    def describe(self):
+        return f'Drop the index of field {self.name} on {self.model_name}'
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-17 01:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_alter_emotionalstate_user'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversationsession',
+            name='state',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
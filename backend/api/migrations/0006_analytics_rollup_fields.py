@@ -0,0 +1,63 @@
+# Generated by Django 4.2.30 on 2026-10-17 01:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_conversationsession_state'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='analytics',
+            name='cbt_completed',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='analytics',
+            name='intensity_sum',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='analytics',
+            name='mood_counts',
+            field=models.JSONField(default=dict),
+        ),
+        migrations.AddField(
+            model_name='analytics',
+            name='mood_entries',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='analytics',
+            name='mood_intensity_sums',
+            field=models.JSONField(default=dict),
+        ),
+        migrations.AddField(
+            model_name='analytics',
+            name='sentiment_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='analytics',
+            name='sentiment_sum',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='analytics',
+            name='theme_counts',
+            field=models.JSONField(default=dict),
+        ),
+        migrations.AddField(
+            model_name='analytics',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='analytics',
+            name='user_messages',
+            field=models.IntegerField(default=0),
+        ),
+    ]
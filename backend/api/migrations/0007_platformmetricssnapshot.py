@@ -0,0 +1,37 @@
+# Generated by Django 4.2.30 on 2026-10-17 02:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_analytics_rollup_fields'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlatformMetricsSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('sessions_started', models.IntegerField(default=0)),
+                ('sessions_completed', models.IntegerField(default=0)),
+                ('session_duration_sum', models.FloatField(default=0)),
+                ('active_user_ids', models.JSONField(default=list)),
+                ('new_users', models.IntegerField(default=0)),
+                ('messages', models.IntegerField(default=0)),
+                ('sentiment_sum', models.FloatField(default=0)),
+                ('sentiment_count', models.IntegerField(default=0)),
+                ('high_risk_messages', models.IntegerField(default=0)),
+                ('crisis_user_ids', models.JSONField(default=list)),
+                ('mood_entries', models.IntegerField(default=0)),
+                ('intensity_sum', models.IntegerField(default=0)),
+                ('mood_counts', models.JSONField(default=dict)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['-date'],
+            },
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 4.2.30 on 2026-10-17 05:20
+
+from django.db import migrations, models
+
+
+def ids_to_sketches(apps, schema_editor):
+    from api.hyperloglog import HyperLogLog
+
+    PlatformMetricsSnapshot = apps.get_model('api', 'PlatformMetricsSnapshot')
+    for snapshot in PlatformMetricsSnapshot.objects.iterator():
+        snapshot.active_users = len(set(snapshot.active_user_ids))
+        snapshot.active_users_sketch = HyperLogLog.of(snapshot.active_user_ids).to_bytes()
+        snapshot.crisis_users = len(set(snapshot.crisis_user_ids))
+        snapshot.crisis_users_sketch = HyperLogLog.of(snapshot.crisis_user_ids).to_bytes()
+        snapshot.save(update_fields=['active_users', 'active_users_sketch', 'crisis_users', 'crisis_users_sketch'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_platformmetricssnapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='platformmetricssnapshot',
+            name='active_users',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='platformmetricssnapshot',
+            name='active_users_sketch',
+            field=models.BinaryField(default=b''),
+        ),
+        migrations.AddField(
+            model_name='platformmetricssnapshot',
+            name='crisis_users',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='platformmetricssnapshot',
+            name='crisis_users_sketch',
+            field=models.BinaryField(default=b''),
+        ),
+        migrations.RunPython(ids_to_sketches, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='platformmetricssnapshot',
+            name='active_user_ids',
+        ),
+        migrations.RemoveField(
+            model_name='platformmetricssnapshot',
+            name='crisis_user_ids',
+        ),
+    ]
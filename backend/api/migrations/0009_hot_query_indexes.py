@@ -0,0 +1,64 @@
+# Generated by Django 4.2.30 on 2026-10-17 02:15
+
+from django.db import migrations, models
+from api.migration_operations import AddIndexOnline
+
+
+class Migration(migrations.Migration):
+    # Indexes are built with CREATE INDEX CONCURRENTLY on PostgreSQL
+    atomic = False
+
+    dependencies = [
+        ('api', '0008_platform_snapshot_user_sketches'),
+    ]
+
+    operations = [
+        AddIndexOnline(
+            model_name='analytics',
+            index=models.Index(fields=['date'], name='analytics_date_idx'),
+        ),
+        AddIndexOnline(
+            model_name='cbtprogress',
+            index=models.Index(fields=['user', 'last_accessed'], name='cbtprogress_user_accessed_idx'),
+        ),
+        AddIndexOnline(
+            model_name='cbtprogress',
+            index=models.Index(fields=['last_accessed'], name='cbtprogress_accessed_idx'),
+        ),
+        AddIndexOnline(
+            model_name='cbtprogress',
+            index=models.Index(condition=models.Q(('completed', True)), fields=['user', 'completed_at'], name='cbtprogress_completed_idx'),
+        ),
+        AddIndexOnline(
+            model_name='conversationsession',
+            index=models.Index(fields=['user', 'started_at'], name='session_user_started_idx'),
+        ),
+        AddIndexOnline(
+            model_name='conversationsession',
+            index=models.Index(fields=['started_at'], name='session_started_idx'),
+        ),
+        AddIndexOnline(
+            model_name='conversationsession',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['user'], name='session_active_user_idx'),
+        ),
+        AddIndexOnline(
+            model_name='emotionalstate',
+            index=models.Index(fields=['user', 'recorded_at'], name='emotion_user_recorded_idx'),
+        ),
+        AddIndexOnline(
+            model_name='emotionalstate',
+            index=models.Index(fields=['recorded_at'], name='emotion_recorded_idx'),
+        ),
+        AddIndexOnline(
+            model_name='message',
+            index=models.Index(fields=['session', 'created_at'], name='message_session_created_idx'),
+        ),
+        AddIndexOnline(
+            model_name='message',
+            index=models.Index(fields=['created_at', 'risk_level'], name='message_created_risk_idx'),
+        ),
+        AddIndexOnline(
+            model_name='message',
+            index=models.Index(condition=models.Q(('risk_level__gte', 7)), fields=['created_at'], name='message_high_risk_idx'),
+        ),
+    ]
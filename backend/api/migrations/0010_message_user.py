@@ -0,0 +1,28 @@
+# Generated by Django 4.2.30 on 2026-10-17 02:18
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from api.migration_operations import AddIndexOnline
+
+
+class Migration(migrations.Migration):
+    # The index is built with CREATE INDEX CONCURRENTLY on PostgreSQL
+    atomic = False
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('api', '0009_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='user',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='messages', to=settings.AUTH_USER_MODEL),
+        ),
+        AddIndexOnline(
+            model_name='message',
+            index=models.Index(fields=['user', 'created_at'], name='message_user_created_idx'),
+        ),
+    ]
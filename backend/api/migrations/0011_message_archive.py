@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-17 02:24
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('api', '0010_message_user'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MessageArchive',
+            fields=[
+                ('session', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='message_archive', serialize=False, to='api.conversationsession')),
+                ('message_count', models.IntegerField(default=0)),
+                ('first_message_at', models.DateTimeField()),
+                ('last_message_at', models.DateTimeField()),
+                ('data', models.BinaryField(default=b'')),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('rehydrated_at', models.DateTimeField(blank=True, null=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='message_archives', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'last_message_at'], name='archive_user_last_idx'), models.Index(fields=['last_message_at'], name='archive_last_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.30 on 2026-10-17 02:49
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from api.migration_operations import DropFieldIndexOnline
+
+
+class Migration(migrations.Migration):
+    # Single-column foreign key indexes already covered by a composite index
+    # are dropped with DROP INDEX CONCURRENTLY on PostgreSQL
+    atomic = False
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('api', '0011_message_archive'),
+    ]
+
+    operations = [
+        DropFieldIndexOnline(
+            model_name='cbtprogress',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='cbt_progress', to=settings.AUTH_USER_MODEL),
+        ),
+        DropFieldIndexOnline(
+            model_name='conversationsession',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='sessions', to=settings.AUTH_USER_MODEL),
+        ),
+        DropFieldIndexOnline(
+            model_name='emotionalstate',
+            name='user',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='emotional_states', to=settings.AUTH_USER_MODEL),
+        ),
+        DropFieldIndexOnline(
+            model_name='message',
+            name='session',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='messages', to='api.conversationsession'),
+        ),
+    ]
@@ -0,0 +1,15 @@
+# Generated by Django 4.2.30 on 2026-10-17 03:05
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    # Intentionally empty: Message.user of older rows is filled after deploy by
+    # the resumable backfill_message_users command, not while migrate holds up
+    # the release (see deploy/README_NGINX_GUNICORN.md)
+
+    dependencies = [
+        ('api', '0012_drop_redundant_fk_indexes'),
+    ]
+
+    operations = []
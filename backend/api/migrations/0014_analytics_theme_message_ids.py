@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-17 03:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_backfill_message_users'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='analytics',
+            name='theme_message_ids',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
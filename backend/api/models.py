@@ -5,13 +5,21 @@ from django.utils import timezone
 
 class ConversationSession(models.Model):
     """Represents a therapeutic conversation session"""
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sessions')
+    # Indexed by (user, started_at) below
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sessions', db_index=False)
     started_at = models.DateTimeField(auto_now_add=True)
     ended_at = models.DateTimeField(null=True, blank=True)
     is_active = models.BooleanField(default=True)
+    state = models.JSONField(default=dict, blank=True)  # Rolling statistics, see conversation_state.py
     
     class Meta:
         ordering = ['-started_at']
+        indexes = [
+            models.Index(fields=['user', 'started_at'], name='session_user_started_idx'),
+            models.Index(fields=['started_at'], name='session_started_idx'),
+            # Few sessions are active at a time
+            models.Index(fields=['user'], condition=models.Q(is_active=True), name='session_active_user_idx'),
+        ]
     
     def __str__(self):
         return f"Session {self.id} - {self.user.username}"
@@ -24,7 +32,13 @@ class Message(models.Model):
         ('therapist', 'Therapist'),
     ]
     
-    session = models.ForeignKey(ConversationSession, on_delete=models.CASCADE, related_name='messages')
+    # Indexed by (session, created_at) below
+    session = models.ForeignKey(ConversationSession, on_delete=models.CASCADE, related_name='messages', db_index=False)
+    # Copy of session.user so user-scoped queries skip the session join
+    # (set on save; null only for rows not yet backfilled, see backfill_message_users).
+    # Indexed by (user, created_at) below
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='messages', null=True, blank=True,
+                             db_index=False)
     sender = models.CharField(max_length=10, choices=SENDER_CHOICES)
     content = models.TextField()
     sentiment_score = models.FloatField(null=True, blank=True)  # -1 to 1
@@ -34,6 +48,17 @@ class Message(models.Model):
     
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['session', 'created_at'], name='message_session_created_idx'),
+            models.Index(fields=['user', 'created_at'], name='message_user_created_idx'),
+            models.Index(fields=['created_at', 'risk_level'], name='message_created_risk_idx'),
+            models.Index(fields=['created_at'], condition=models.Q(risk_level__gte=7), name='message_high_risk_idx'),
+        ]
+    
+    def save(self, *args, **kwargs):
+        if self.user_id is None and self.session_id is not None:
+            self.user_id = self.session.user_id
+        super().save(*args, **kwargs)
     
     def __str__(self):
         return f"{self.sender}: {self.content[:50]}..."
@@ -52,7 +77,9 @@ class EmotionalState(models.Model):
         ('calm', 'Calm'),
     ]
     
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='emotional_states', null=True, blank=True)
+    # Indexed by (user, recorded_at) below
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='emotional_states', null=True, blank=True,
+                             db_index=False)
     session = models.ForeignKey(ConversationSession, on_delete=models.CASCADE, related_name='emotional_states', null=True, blank=True)
     mood = models.CharField(max_length=20, choices=MOOD_CHOICES)
     intensity = models.IntegerField(default=5)  # 1-10
@@ -61,6 +88,10 @@ class EmotionalState(models.Model):
     
     class Meta:
         ordering = ['-recorded_at']
+        indexes = [
+            models.Index(fields=['user', 'recorded_at'], name='emotion_user_recorded_idx'),
+            models.Index(fields=['recorded_at'], name='emotion_recorded_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.username} - {self.mood} ({self.intensity}/10)"
@@ -93,7 +124,8 @@ class CBTContent(models.Model):
 
 class CBTProgress(models.Model):
     """Tracks user progress through CBT content"""
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='cbt_progress')
+    # Indexed by unique (user, content) and (user, last_accessed)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='cbt_progress', db_index=False)
     content = models.ForeignKey(CBTContent, on_delete=models.CASCADE, related_name='progress_records')
     completed = models.BooleanField(default=False)
     progress_percentage = models.IntegerField(default=0)
@@ -102,13 +134,19 @@ class CBTProgress(models.Model):
     
     class Meta:
         unique_together = ['user', 'content']
+        indexes = [
+            models.Index(fields=['user', 'last_accessed'], name='cbtprogress_user_accessed_idx'),
+            models.Index(fields=['last_accessed'], name='cbtprogress_accessed_idx'),
+            models.Index(fields=['user', 'completed_at'], condition=models.Q(completed=True),
+                         name='cbtprogress_completed_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.username} - {self.content.title} ({self.progress_percentage}%)"
 
 
 class Analytics(models.Model):
-    """Stores analytics data for dashboard"""
+    """Daily per-user rollup read by the dashboard (see rollups.py)"""
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='analytics')
     date = models.DateField(default=timezone.now)
     total_sessions = models.IntegerField(default=0)
@@ -116,15 +154,79 @@ class Analytics(models.Model):
     average_sentiment = models.FloatField(null=True, blank=True)
     dominant_themes = models.JSONField(default=list)
     risk_events = models.IntegerField(default=0)
+    # Additive components, so any range of days can be combined exactly
+    user_messages = models.IntegerField(default=0)
+    sentiment_sum = models.FloatField(default=0)
+    sentiment_count = models.IntegerField(default=0)
+    mood_entries = models.IntegerField(default=0)
+    intensity_sum = models.IntegerField(default=0)
+    mood_counts = models.JSONField(default=dict)  # mood -> entries
+    mood_intensity_sums = models.JSONField(default=dict)  # mood -> summed intensity
+    theme_counts = models.JSONField(default=dict)  # theme -> user messages mentioning it
+    theme_message_ids = models.JSONField(null=True, blank=True)  # live messages counted in theme_counts
+    cbt_completed = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         unique_together = ['user', 'date']
         ordering = ['-date']
+        indexes = [
+            models.Index(fields=['date'], name='analytics_date_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.username} - {self.date}"
 
 
+class PlatformMetricsSnapshot(models.Model):
+    """Daily platform-wide rollup read by the admin dashboard (see admin_metrics.py)"""
+    date = models.DateField(unique=True)
+    sessions_started = models.IntegerField(default=0)
+    sessions_completed = models.IntegerField(default=0)
+    session_duration_sum = models.FloatField(default=0)  # seconds, completed sessions
+    active_users = models.IntegerField(default=0)  # distinct users who started a session
+    active_users_sketch = models.BinaryField(default=b'')  # HyperLogLog of those users
+    new_users = models.IntegerField(default=0)
+    messages = models.IntegerField(default=0)
+    sentiment_sum = models.FloatField(default=0)
+    sentiment_count = models.IntegerField(default=0)
+    high_risk_messages = models.IntegerField(default=0)
+    crisis_users = models.IntegerField(default=0)  # distinct users with a high-risk message
+    crisis_users_sketch = models.BinaryField(default=b'')  # HyperLogLog of those users
+    mood_entries = models.IntegerField(default=0)
+    intensity_sum = models.IntegerField(default=0)
+    mood_counts = models.JSONField(default=dict)  # mood -> entries
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['-date']
+    
+    def __str__(self):
+        return f"Platform metrics {self.date}"
+
+
+class MessageArchive(models.Model):
+    """Compressed messages of a long-ended session, moved out of Message (see archive.py)"""
+    session = models.OneToOneField(ConversationSession, on_delete=models.CASCADE, primary_key=True,
+                                   related_name='message_archive')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='message_archives')
+    message_count = models.IntegerField(default=0)
+    first_message_at = models.DateTimeField()
+    last_message_at = models.DateTimeField()
+    data = models.BinaryField(default=b'')  # zlib-compressed JSON message rows
+    archived_at = models.DateTimeField(default=timezone.now)
+    rehydrated_at = models.DateTimeField(null=True, blank=True)  # set while the rows are back in Message
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'last_message_at'], name='archive_user_last_idx'),
+            models.Index(fields=['last_message_at'], name='archive_last_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Archive of session {self.session_id} ({self.message_count} messages)"
+
+
 class CrisisResource(models.Model):
     """Emergency resources and crisis support information"""
     title = models.CharField(max_length=200)
@@ -1,12 +1,37 @@
 """
 OpenAI API integration for enhanced AI chat responses
 Falls back to rule-based responses if API is unavailable
+
+Requests go through a persistent keep-alive connection pool (requests.Session)
+with split connect/read timeouts and bounded, jittered retries. The async
+stream (astream_response) uses httpx with the same retry policy when it is
+installed.
 """
+import asyncio
+import logging
 import os
+import random
+import time
+import weakref
 import requests
-from typing import Optional, List, Dict
+from requests.adapters import HTTPAdapter
+from typing import Optional, List, Dict, Iterator, AsyncIterator
 import json
 
+try:
+    import httpx
+    HTTPX_AVAILABLE = True
+except ImportError:
+    HTTPX_AVAILABLE = False
+
+# Status codes worth retrying: rate limiting and transient server errors
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Returned by _parse_stream_line for the terminating [DONE] event
+_DONE = object()
+
+logger = logging.getLogger('api')
+
 
 class OpenAIService:
     """Service for OpenAI API integration"""
@@ -14,8 +39,163 @@ class OpenAIService:
     def __init__(self):
         # Try to get API key from environment, but it's optional
         self.api_key = os.getenv('OPENAI_API_KEY', '')
-        self.base_url = 'https://api.openai.com/v1/chat/completions'
+        # OPENAI_BASE_URL can point to a local OpenAI-compatible stub (see `manage.py openai_stub`)
+        api_base = os.getenv('OPENAI_BASE_URL', 'https://api.openai.com/v1').rstrip('/')
+        self.base_url = f'{api_base}/chat/completions'
+        self.model = os.getenv('OPENAI_MODEL', 'gpt-3.5-turbo')
         self.enabled = bool(self.api_key)
+        
+        # Split timeouts: fail fast on connect, allow the model time to answer
+        self.connect_timeout = float(os.getenv('OPENAI_CONNECT_TIMEOUT', '3'))
+        self.read_timeout = float(os.getenv('OPENAI_READ_TIMEOUT', '10'))
+        # Retries cover connect failures and 429/5xx only; read timeouts are not
+        # retried so the worst case stays bounded by a single read timeout
+        self.max_retries = int(os.getenv('OPENAI_MAX_RETRIES', '2'))
+        self.backoff_base = float(os.getenv('OPENAI_BACKOFF_BASE', '0.25'))
+        self.pool_size = int(os.getenv('OPENAI_POOL_SIZE', '10'))
+        
+        self._session = None
+        # One httpx.AsyncClient per event loop (clients cannot cross loops)
+        self._async_clients = weakref.WeakKeyDictionary()
+    
+    @property
+    def session(self) -> requests.Session:
+        """Persistent keep-alive session, created on first use"""
+        if self._session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            session.headers.update(self._headers())
+            self._session = session
+        return self._session
+    
+    def _async_client(self) -> 'httpx.AsyncClient':
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = httpx.AsyncClient(
+                headers=self._headers(),
+                timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+                limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size),
+            )
+            self._async_clients[loop] = client
+        return client
+    
+    def _backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff delay for a retry attempt"""
+        return random.uniform(0, self.backoff_base * (2 ** attempt))
+    
+    def _post(self, payload: Dict, stream: bool = False) -> requests.Response:
+        """POST with bounded retries on connect errors and retryable statuses"""
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            try:
+                response = self.session.post(
+                    self.base_url,
+                    json=payload,
+                    timeout=(self.connect_timeout, self.read_timeout),
+                    stream=stream
+                )
+            except requests.exceptions.ConnectionError:
+                if last_attempt:
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUS_CODES or last_attempt:
+                    return response
+                response.close()
+            time.sleep(self._backoff(attempt))
+    
+    def _headers(self) -> Dict:
+        return {
+            'Authorization': f'Bearer {self.api_key}',
+            'Content-Type': 'application/json'
+        }
+    
+    def _payload(self, messages: List[Dict], stream: bool = False) -> Dict:
+        payload = {
+            'model': self.model,
+            'messages': messages,
+            'temperature': 0.7,
+            'max_tokens': 200,
+        }
+        if stream:
+            payload['stream'] = True
+        return payload
+    
+    def _build_messages(
+        self,
+        user_message: str,
+        conversation_history: List[Dict],
+        sentiment: str,
+        risk_level: int,
+        context: Optional[Dict] = None
+    ) -> List[Dict]:
+        """Build chat messages: system prompt, recent history, current message with hints"""
+        # Build conversation context
+        messages = [
+            {
+                "role": "system",
+                "content": """Ты профессиональный психолог-консультант, работающий с русскоязычными клиентами. 
+Твоя задача - оказывать поддержку, задавать уточняющие вопросы, давать конструктивные советы.
+Будь эмпатичным, но профессиональным. Используй технику активного слушания.
+Отвечай кратко и по делу (максимум 2-3 предложения).
+Если видишь признаки кризисной ситуации (высокий уровень риска), проявляй больше заботы и предлагай обратиться за профессиональной помощью."""
+            }
+        ]
+        
+        # Add conversation history
+        for msg in conversation_history[-5:]:  # Last 5 messages for context
+            if msg.get('sender') == 'user':
+                messages.append({
+                    "role": "user",
+                    "content": msg.get('content', '')
+                })
+            elif msg.get('sender') == 'therapist':
+                messages.append({
+                    "role": "assistant",
+                    "content": msg.get('content', '')
+                })
+        
+        # Add current message
+        messages.append({
+            "role": "user",
+            "content": user_message
+        })
+        
+        # Add context hints
+        if context:
+            context_hint = ""
+            if risk_level >= 7:
+                context_hint += " [ВЫСОКИЙ РИСК - будь особенно внимателен]"
+            if sentiment == 'negative':
+                context_hint += " [Клиент в негативном настроении]"
+            if sentiment == 'positive':
+                context_hint += " [Клиент в позитивном настроении]"
+            
+            if context_hint:
+                messages[-1]["content"] += context_hint
+        
+        return messages
+    
+    @staticmethod
+    def _parse_completion(status_code: int, data: Optional[Dict]) -> Optional[str]:
+        if status_code == 200 and data:
+            ai_response = data.get('choices', [{}])[0].get('message', {}).get('content', '')
+            if ai_response:
+                return ai_response.strip()
+        return None
+    
+    @staticmethod
+    def _parse_stream_line(line: str):
+        """Token from one server-sent event line; _DONE on [DONE]"""
+        if not line or not line.startswith('data:'):
+            return None
+        data = line[len('data:'):].strip()
+        if data == '[DONE]':
+            return _DONE
+        delta = json.loads(data).get('choices', [{}])[0].get('delta', {})
+        return delta.get('content')
     
     def generate_response(
         self, 
@@ -33,77 +213,103 @@ class OpenAIService:
             return None
         
         try:
-            # Build conversation context
-            messages = [
-                {
-                    "role": "system",
-                    "content": """Ты профессиональный психолог-консультант, работающий с русскоязычными клиентами. 
-Твоя задача - оказывать поддержку, задавать уточняющие вопросы, давать конструктивные советы.
-Будь эмпатичным, но профессиональным. Используй технику активного слушания.
-Отвечай кратко и по делу (максимум 2-3 предложения).
-Если видишь признаки кризисной ситуации (высокий уровень риска), проявляй больше заботы и предлагай обратиться за профессиональной помощью."""
-                }
-            ]
+            messages = self._build_messages(user_message, conversation_history, sentiment, risk_level, context)
             
-            # Add conversation history
-            for msg in conversation_history[-5:]:  # Last 5 messages for context
-                if msg.get('sender') == 'user':
-                    messages.append({
-                        "role": "user",
-                        "content": msg.get('content', '')
-                    })
-                elif msg.get('sender') == 'therapist':
-                    messages.append({
-                        "role": "assistant",
-                        "content": msg.get('content', '')
-                    })
-            
-            # Add current message
-            messages.append({
-                "role": "user",
-                "content": user_message
-            })
-            
-            # Add context hints
-            if context:
-                context_hint = ""
-                if risk_level >= 7:
-                    context_hint += " [ВЫСОКИЙ РИСК - будь особенно внимателен]"
-                if sentiment == 'negative':
-                    context_hint += " [Клиент в негативном настроении]"
-                if sentiment == 'positive':
-                    context_hint += " [Клиент в позитивном настроении]"
-                
-                if context_hint:
-                    messages[-1]["content"] += context_hint
-            
-            # Make API request
-            response = requests.post(
-                self.base_url,
-                headers={
-                    'Authorization': f'Bearer {self.api_key}',
-                    'Content-Type': 'application/json'
-                },
-                json={
-                    'model': 'gpt-3.5-turbo',
-                    'messages': messages,
-                    'temperature': 0.7,
-                    'max_tokens': 200,
-                },
-                timeout=10  # 10 second timeout
-            )
-            
-            if response.status_code == 200:
-                data = response.json()
-                ai_response = data.get('choices', [{}])[0].get('message', {}).get('content', '')
-                if ai_response:
-                    return ai_response.strip()
-            
-            return None
+            # Make API request over the pooled session
+            response = self._post(self._payload(messages))
+            return self._parse_completion(response.status_code, response.json() if response.status_code == 200 else None)
             
         except Exception as e:
-            print(f"OpenAI API error: {e}")
+            logger.error(f"OpenAI API error: {e}", exc_info=True)
             return None
+    
+    def stream_response(
+        self, 
+        user_message: str, 
+        conversation_history: List[Dict],
+        sentiment: str,
+        risk_level: int,
+        context: Optional[Dict] = None
+    ) -> Iterator[str]:
+        """
+        Stream AI response tokens as they arrive (OpenAI server-sent events)
+        Yields nothing if API is unavailable or fails before the first token
+        """
+        if not self.enabled:
+            return
+        
+        try:
+            messages = self._build_messages(user_message, conversation_history, sentiment, risk_level, context)
+            with self._post(self._payload(messages, stream=True), stream=True) as response:
+                if response.status_code != 200:
+                    return
+                for line in response.iter_lines(decode_unicode=True):
+                    token = self._parse_stream_line(line)
+                    if token is _DONE:
+                        break
+                    if token:
+                        yield token
+        except Exception as e:
+            logger.error(f"OpenAI API streaming error: {e}", exc_info=True)
+            return
+    
+    async def _astream_post(self, payload: Dict) -> 'httpx.Response':
+        """Open a streamed async POST with the same retry policy as _post"""
+        client = self._async_client()
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            try:
+                request = client.build_request('POST', self.base_url, json=payload)
+                response = await client.send(request, stream=True)
+            except (httpx.ConnectError, httpx.ConnectTimeout):
+                if last_attempt:
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUS_CODES or last_attempt:
+                    return response
+                await response.aclose()
+            await asyncio.sleep(self._backoff(attempt))
+    
+    async def astream_response(
+        self, 
+        user_message: str, 
+        conversation_history: List[Dict],
+        sentiment: str,
+        risk_level: int,
+        context: Optional[Dict] = None
+    ) -> AsyncIterator[str]:
+        """
+        Async variant of stream_response for consumers
+        Uses httpx if installed, otherwise pulls the sync stream from a thread
+        """
+        if not self.enabled:
+            return
+        if not HTTPX_AVAILABLE:
+            from asgiref.sync import sync_to_async
+            tokens = self.stream_response(user_message, conversation_history, sentiment, risk_level, context)
+            while True:
+                token = await sync_to_async(next, thread_sensitive=False)(tokens, None)
+                if token is None:
+                    return
+                yield token
+        
+        try:
+            messages = self._build_messages(user_message, conversation_history, sentiment, risk_level, context)
+            response = await self._astream_post(self._payload(messages, stream=True))
+            try:
+                if response.status_code != 200:
+                    return
+                async for line in response.aiter_lines():
+                    token = self._parse_stream_line(line)
+                    if token is _DONE:
+                        break
+                    if token:
+                        yield token
+            finally:
+                await response.aclose()
+        except Exception as e:
+            logger.error(f"OpenAI API streaming error: {e}", exc_info=True)
+            return
 
 
 # Global instance
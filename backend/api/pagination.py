@@ -0,0 +1,149 @@
+"""
+Keyset (cursor) pagination for the conversation endpoints
+
+Page-number pagination runs COUNT(*) and an OFFSET that grows with every
+page. Here a page continues strictly after the (timestamp, id) key of the
+previous page's last row, so each page is one index range read of page
+size + 1 rows however deep it is. The position travels in an opaque
+`cursor` parameter of the `next` link.
+
+`after_id` is the delta mode: only rows created after the row with that id
+(in the same user-scoped queryset) are returned, so a client that already
+holds a conversation fetches just the new turns. It combines with cursor
+paging for long deltas.
+
+Responses are {next, results}: unlike PageNumberPagination there is no
+count (it would bring back the COUNT(*)), no previous link and no ?page=.
+A malformed cursor is a 404 (as in DRF's CursorPagination), an unknown
+after_id a 400.
+"""
+import base64
+import json
+from collections import OrderedDict
+from datetime import datetime
+from typing import List, Optional, Sequence, Tuple
+from django.conf import settings
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+def keyset_after(fields: Sequence[str], values: Sequence, descending: bool = False) -> Q:
+    """Rows whose (fields) key sorts strictly after values: (a > x) OR (a = x AND b > y) ..."""
+    lookup = 'lt' if descending else 'gt'
+    condition = Q()
+    for position, field in enumerate(fields):
+        step = Q(**{f'{field}__{lookup}': values[position]})
+        for previous, value in zip(fields[:position], values[:position]):
+            step &= Q(**{previous: value})
+        condition |= step
+    return condition
+
+
+class KeysetPagination(BasePagination):
+    """Forward-only cursor pagination on a unique (timestamp, id) ordering"""
+    ordering: Tuple[str, ...] = ('created_at', 'id')
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = settings.REST_FRAMEWORK.get('PAGE_SIZE_QUERY_PARAM', 'page_size')
+    max_page_size = settings.REST_FRAMEWORK.get('MAX_PAGE_SIZE', 100)
+    cursor_query_param = 'cursor'
+    after_query_param = 'after_id'
+    invalid_cursor_message = 'Invalid cursor'
+
+    @property
+    def fields(self) -> Tuple[str, ...]:
+        return tuple(field.lstrip('-') for field in self.ordering)
+
+    @property
+    def descending(self) -> bool:
+        return self.ordering[0].startswith('-')
+
+    def paginate_queryset(self, queryset, request, view=None) -> List:
+        self.request = request
+        queryset = queryset.order_by(*self.ordering)
+
+        after = self.get_after(request, queryset)
+        if after is not None:
+            queryset = queryset.filter(keyset_after(self.fields, after))
+        position = self.decode_cursor(request)
+        if position is not None:
+            queryset = queryset.filter(keyset_after(self.fields, position, self.descending))
+
+        page_size = self.get_page_size(request)
+        rows = list(queryset[:page_size + 1])
+        self.has_next = len(rows) > page_size
+        rows = rows[:page_size]
+        self.next_position = [getattr(rows[-1], field) for field in self.fields] if self.has_next else None
+        return rows
+
+    def get_page_size(self, request) -> int:
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def get_after(self, request, queryset) -> Optional[tuple]:
+        """Key of the after_id anchor row, None without the parameter"""
+        raw = request.query_params.get(self.after_query_param)
+        if raw is None:
+            return None
+        try:
+            anchor = queryset.filter(pk=int(raw)).values_list(*self.fields).first()
+        except ValueError:
+            anchor = None
+        if anchor is None:
+            raise ValidationError({self.after_query_param: 'Unknown id'})
+        return anchor
+
+    def decode_cursor(self, request) -> Optional[list]:
+        raw = request.query_params.get(self.cursor_query_param)
+        if raw is None:
+            return None
+        try:
+            moment, pk = json.loads(base64.urlsafe_b64decode(raw.encode()))
+            timestamp = parse_datetime(moment)
+            if timestamp is None:
+                raise ValueError(moment)
+            return [timestamp, int(pk)]
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, position: list) -> str:
+        payload = [value.isoformat() if isinstance(value, datetime) else value for value in position]
+        return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+    def get_next_link(self) -> Optional[str]:
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_position))
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class MessagePagination(KeysetPagination):
+    """Oldest first, so cursor pages and after_id deltas both read forward in time"""
+    ordering = ('created_at', 'id')
+
+
+class SessionPagination(KeysetPagination):
+    """Newest first; after_id returns the sessions started after the given one"""
+    ordering = ('-started_at', '-id')
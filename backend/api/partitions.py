@@ -0,0 +1,235 @@
+"""
+Monthly range partitioning of the Message table (PostgreSQL only)
+
+Message is append-only and read by recent time ranges, so it is split into
+one partition per local calendar month of created_at (api_message_p2026_10,
+...) plus a default partition for anything outside them. PostgreSQL needs
+the partition key in the primary key, so the partitioned table's key is
+(id, created_at); ids stay unique through the shared sequence and the ORM
+keeps addressing rows by id.
+
+convert() turns the existing table into a partitioned one online: it copies
+rows in id batches into a new partitioned table while writes continue, then
+copies the tail and swaps the names under a short exclusive lock. The old
+table is kept, without its foreign keys, as api_message_unpartitioned until
+it is dropped by hand.
+ensure_partitions() creates the coming months' partitions ahead of time (run
+daily by beat) and drop_empty_partitions() drops old months the archive job
+(archive.py) has emptied.
+"""
+import logging
+import re
+from datetime import date, datetime, time
+from typing import Callable, List, Optional
+from django.db import connection, transaction
+from django.utils import timezone
+from .models import Message
+
+logger = logging.getLogger('api')
+
+TABLE = Message._meta.db_table
+PARTITION_KEY = 'created_at'
+DEFAULT_PARTITION = f'{TABLE}_default'
+OLD_TABLE = f'{TABLE}_unpartitioned'
+STAGING_TABLE = f'{TABLE}_partitioned'
+PARTITION_NAME = re.compile(rf'^{TABLE}_p(\d{{4}})_(\d{{2}})$')
+SEQUENCE = f'{TABLE}_id_partitioned_seq'
+MAX_NAME_LENGTH = 63
+
+
+def _suffixed(name: str, suffix: str) -> str:
+    """name + suffix, shortened to PostgreSQL's identifier limit"""
+    return name[:MAX_NAME_LENGTH - len(suffix)] + suffix
+
+
+def supported() -> bool:
+    return connection.vendor == 'postgresql'
+
+
+def month_start(day: date, offset: int = 0) -> date:
+    """First day of the month `offset` months after the month of day"""
+    months = day.year * 12 + day.month - 1 + offset
+    return date(months // 12, months % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f'{TABLE}_p{month.year:04d}_{month.month:02d}'
+
+
+def _bound(month: date) -> str:
+    """Local midnight starting month, as a timestamptz literal"""
+    return timezone.make_aware(datetime.combine(month, time.min)).isoformat()
+
+
+def _exists(cursor, name: str) -> bool:
+    cursor.execute('SELECT to_regclass(%s) IS NOT NULL', [name])
+    return cursor.fetchone()[0]
+
+
+def is_partitioned(table: str = TABLE) -> bool:
+    if not supported():
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s))', [table]
+        )
+        return cursor.fetchone()[0]
+
+
+def _create_partitions(cursor, table: str, first_month: date, last_month: date) -> List[str]:
+    """Monthly partitions of table from first_month to last_month (inclusive) that did not exist"""
+    created = []
+    month = first_month
+    while month <= last_month:
+        name = partition_name(month).replace(TABLE, table, 1)
+        if not _exists(cursor, name):
+            cursor.execute(
+                f'CREATE TABLE {name} PARTITION OF {table} FOR VALUES FROM (%s) TO (%s)',
+                [_bound(month), _bound(month_start(month, 1))]
+            )
+            created.append(name)
+        month = month_start(month, 1)
+    return created
+
+
+def ensure_partitions(months_ahead: int = 3) -> List[str]:
+    """Create this month's and the next months' partitions if missing, returns the new names"""
+    if not is_partitioned():
+        return []
+    this_month = month_start(timezone.localdate())
+    with transaction.atomic(), connection.cursor() as cursor:
+        return _create_partitions(cursor, TABLE, this_month, month_start(this_month, months_ahead))
+
+
+def drop_empty_partitions(before: date) -> List[str]:
+    """Drop monthly partitions that end on or before `before` and hold no rows, returns their names"""
+    if not is_partitioned():
+        return []
+    dropped = []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid '
+            'WHERE i.inhparent = to_regclass(%s) ORDER BY c.relname', [TABLE]
+        )
+        for (name,) in cursor.fetchall():
+            match = PARTITION_NAME.match(name)
+            if not match or month_start(date(int(match[1]), int(match[2]), 1), 1) > before:
+                continue
+            with transaction.atomic():
+                cursor.execute(f'SELECT EXISTS (SELECT 1 FROM {name})')
+                if not cursor.fetchone()[0]:
+                    cursor.execute(f'DROP TABLE {name}')
+                    dropped.append(name)
+    return dropped
+
+
+def convert(batch_size: int = 50000, months_ahead: int = 3,
+            log: Optional[Callable[[str], None]] = None) -> int:
+    """
+    Replace the Message table with a monthly partitioned copy, returns the rows copied
+
+    Run once, with the archive job, rescore_messages and backfill_message_users
+    paused: rows they update or delete while the copy runs would keep their
+    old values. New messages keep arriving and are copied at the swap.
+    """
+    log = log or logger.info
+    if not supported():
+        raise RuntimeError('Message partitioning requires PostgreSQL')
+    if is_partitioned():
+        raise RuntimeError(f'{TABLE} is already partitioned')
+
+    with connection.cursor() as cursor:
+        for name in (STAGING_TABLE, OLD_TABLE):
+            if _exists(cursor, name):
+                raise RuntimeError(f'{name} exists, drop it before converting')
+        cursor.execute(
+            'SELECT count(*) FROM pg_constraint WHERE confrelid = to_regclass(%s) AND contype = %s', [TABLE, 'f']
+        )
+        if cursor.fetchone()[0]:
+            raise RuntimeError(f'Foreign keys reference {TABLE}; partitioning would break them')
+        cursor.execute(f'SELECT min({PARTITION_KEY}), max(id) FROM {TABLE}')
+        first_at, max_id = cursor.fetchone()
+        cursor.execute(
+            "SELECT indexname, indexdef FROM pg_indexes "
+            "WHERE schemaname = current_schema() AND tablename = %s AND indexname <> %s",
+            [TABLE, f'{TABLE}_pkey']
+        )
+        indexes = cursor.fetchall()
+        cursor.execute(
+            'SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint '
+            'WHERE conrelid = to_regclass(%s) AND contype = %s', [TABLE, 'f']
+        )
+        foreign_keys = cursor.fetchall()
+
+    # Partitioned copy with the same columns, indexes and foreign keys ("_p" names until the swap)
+    this_month = month_start(timezone.localdate())
+    first_month = month_start(timezone.localdate(first_at)) if first_at else this_month
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f'CREATE TABLE {STAGING_TABLE} (LIKE {TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) '
+            f'PARTITION BY RANGE ({PARTITION_KEY})'
+        )
+        cursor.execute(
+            f'ALTER TABLE {STAGING_TABLE} ADD CONSTRAINT {STAGING_TABLE}_pkey PRIMARY KEY (id, {PARTITION_KEY})'
+        )
+        _create_partitions(cursor, STAGING_TABLE, first_month, month_start(this_month, months_ahead))
+        cursor.execute(f'CREATE TABLE {DEFAULT_PARTITION}_p PARTITION OF {STAGING_TABLE} DEFAULT')
+        for name, definition in indexes:
+            staged = _suffixed(name, '_p')
+            cursor.execute(re.sub(
+                r'^CREATE (UNIQUE )?INDEX \S+ ON \S+ ', rf'CREATE \1INDEX {staged} ON {STAGING_TABLE} ', definition
+            ))
+        for name, definition in foreign_keys:
+            cursor.execute(f'ALTER TABLE {STAGING_TABLE} ADD CONSTRAINT {_suffixed(name, "_p")} {definition}')
+    log(f'Created {STAGING_TABLE} with partitions from {first_month:%Y-%m}')
+
+    # Bulk copy in id batches, one short transaction each
+    copied, last_id, max_id = 0, 0, max_id or 0
+    while last_id < max_id:
+        upper = min(last_id + batch_size, max_id)
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {STAGING_TABLE} SELECT * FROM {TABLE} WHERE id > %s AND id <= %s', [last_id, upper]
+            )
+            copied += cursor.rowcount
+        last_id = upper
+        log(f'  ... {copied} rows copied (through id {last_id})')
+
+    # Swap: copy rows written meanwhile, move the id sequence and names over
+    with transaction.atomic(), connection.cursor() as cursor:
+        # Django's foreign keys are deferred; checking them now keeps pending
+        # trigger events from blocking the ALTER TABLEs below
+        cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+        cursor.execute(f'LOCK TABLE {TABLE} IN ACCESS EXCLUSIVE MODE')
+        cursor.execute(f'INSERT INTO {STAGING_TABLE} SELECT * FROM {TABLE} WHERE id > %s', [max_id])
+        copied += cursor.rowcount
+
+        cursor.execute(f'CREATE SEQUENCE {SEQUENCE}')
+        cursor.execute(f"SELECT setval('{SEQUENCE}', coalesce((SELECT max(id) FROM {TABLE}), 0) + 1, false)")
+        cursor.execute(f"ALTER TABLE {STAGING_TABLE} ALTER COLUMN id SET DEFAULT nextval('{SEQUENCE}')")
+        cursor.execute(f'ALTER SEQUENCE {SEQUENCE} OWNED BY {STAGING_TABLE}.id')
+
+        cursor.execute(f'ALTER TABLE {TABLE} RENAME TO {OLD_TABLE}')
+        cursor.execute(f'ALTER TABLE {OLD_TABLE} RENAME CONSTRAINT {TABLE}_pkey TO {OLD_TABLE}_pkey')
+        for name, _ in indexes:
+            cursor.execute(f'ALTER INDEX {name} RENAME TO {_suffixed(name, "_old")}')
+        # The old copy must not block deletes of users and sessions until it is dropped
+        for name, _ in foreign_keys:
+            cursor.execute(f'ALTER TABLE {OLD_TABLE} DROP CONSTRAINT {name}')
+
+        cursor.execute(f'ALTER TABLE {STAGING_TABLE} RENAME TO {TABLE}')
+        cursor.execute(f'ALTER TABLE {TABLE} RENAME CONSTRAINT {STAGING_TABLE}_pkey TO {TABLE}_pkey')
+        cursor.execute(f'ALTER TABLE {DEFAULT_PARTITION}_p RENAME TO {DEFAULT_PARTITION}')
+        for name, _ in indexes:
+            cursor.execute(f'ALTER INDEX {_suffixed(name, "_p")} RENAME TO {name}')
+        for name, _ in foreign_keys:
+            cursor.execute(f'ALTER TABLE {TABLE} RENAME CONSTRAINT {_suffixed(name, "_p")} TO {name}')
+        cursor.execute(
+            'SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid '
+            'WHERE i.inhparent = to_regclass(%s)', [TABLE]
+        )
+        for (name,) in cursor.fetchall():
+            if name.startswith(f'{STAGING_TABLE}_p'):
+                cursor.execute(f'ALTER TABLE {name} RENAME TO {name.replace(STAGING_TABLE, TABLE, 1)}')
+    log(f'Swapped: {TABLE} is partitioned, the old table is {OLD_TABLE}')
+    return copied
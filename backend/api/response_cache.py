@@ -0,0 +1,80 @@
+"""
+Per-user response cache for the analytics dashboard and emotional timeline
+
+Cache keys embed a per-user data version. signals.py replaces the version
+after every committed write to the user's messages, moods, sessions, CBT
+progress, subscription or rollups, so entries built from older data are
+never read again and simply expire.
+"""
+import logging
+import secrets
+from typing import Callable, Sequence
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+logger = logging.getLogger('api')
+
+
+def _version_key(user_id: int) -> str:
+    return f'data-version:{user_id}'
+
+
+def data_version(user_id: int) -> str:
+    """Current data version of the user (created on first use)"""
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        version = secrets.token_hex(8)
+        if not cache.add(_version_key(user_id), version, timeout=None):
+            version = cache.get(_version_key(user_id), version)
+    return version
+
+
+def bump_version(user_id: int) -> None:
+    """
+    Invalidate the user's cached responses once the current transaction commits
+
+    A fresh random version (not an increment) keeps concurrent bumps from
+    colliding on caches without atomic incr. Bumps already pending in the
+    same transaction are not repeated.
+    """
+    if user_id is None:
+        return
+    connection = transaction.get_connection()
+    if connection.in_atomic_block and any(
+        getattr(callback, 'version_user_id', None) == user_id for _, callback, _ in connection.run_on_commit
+    ):
+        return
+
+    def bump():
+        try:
+            cache.set(_version_key(user_id), secrets.token_hex(8), timeout=None)
+        except Exception as e:
+            logger.error(f'Cache version bump failed for user {user_id}: {e}')
+
+    bump.version_user_id = user_id
+    transaction.on_commit(bump)
+
+
+def cached_response(user_id: int, name: str, params: Sequence, build: Callable[[], object]):
+    """
+    Return build() for (user, name, params), cached until the user's data changes
+
+    The version is read before building, so a response built while a write
+    commits is stored under the old version. If the cache is unreachable the
+    response is built without it.
+    """
+    try:
+        key = ':'.join([name, str(user_id), data_version(user_id), *map(str, params)])
+        data = cache.get(key)
+    except Exception as e:
+        logger.warning(f'Response cache unavailable, building {name} directly: {e}')
+        return build()
+
+    if data is None:
+        data = build()
+        try:
+            cache.set(key, data, settings.RESPONSE_CACHE_TIMEOUT)
+        except Exception as e:
+            logger.warning(f'Could not cache {name} for user {user_id}: {e}')
+    return data
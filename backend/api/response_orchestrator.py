@@ -0,0 +1,129 @@
+"""
+Deadline-budgeted hedging between the LLM and the rule-based reply
+
+The LLM call starts first in a worker thread, the rule-based reply is computed
+meanwhile in the request thread, and the LLM answer is used only if it arrives
+within the per-turn budget. Outcomes are counted in the shared cache, so the
+admin dashboard sees the totals of all web workers and the budget can be tuned.
+"""
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Callable, Dict, Optional
+from django.core.cache import cache
+
+logger = logging.getLogger('api')
+
+COUNTERS = (
+    'llm_wins',                 # LLM answered within budget
+    'budget_exceeded',          # LLM still running at the deadline, fallback served
+    'llm_failures',             # LLM returned nothing or raised, fallback served
+    'llm_saturated',            # every LLM slot busy with earlier calls, fallback served at once
+    'llm_win_latency_ms_total',
+)
+
+
+def _counter_key(name: str) -> str:
+    return f'response-hedging:{name}'
+
+
+class ResponseOrchestrator:
+    """Races an LLM call against a precomputed fallback within a latency budget"""
+
+    def __init__(self):
+        # Total time a turn may spend waiting for the LLM (seconds)
+        self.budget = float(os.getenv('RESPONSE_BUDGET_SECONDS', '4'))
+        workers = int(os.getenv('RESPONSE_LLM_WORKERS', '8'))
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='llm-hedge')
+        # One slot per executor thread: a call that outlives its turn keeps its
+        # slot until the HTTP read timeout, and new turns never queue behind it
+        self._slots = threading.BoundedSemaphore(workers)
+
+    def _record(self, outcome: str, llm_latency: Optional[float] = None):
+        """Add the outcome to the shared counters (best effort, never fails a turn)"""
+        increments = {outcome: 1}
+        if llm_latency is not None:
+            increments['llm_win_latency_ms_total'] = int(llm_latency * 1000)
+        for name, delta in increments.items():
+            key = _counter_key(name)
+            try:
+                cache.add(key, 0, timeout=None)
+                cache.incr(key, delta)
+            except Exception as e:
+                logger.warning(f'Could not record response hedging outcome {name}: {e}')
+
+    def _submit(self, llm_call: Callable[[], Optional[str]]):
+        """Start the LLM call in a free slot, None when all slots are busy"""
+        if not self._slots.acquire(blocking=False):
+            return None
+        try:
+            future = self._executor.submit(llm_call)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def generate(self, llm_call: Callable[[], Optional[str]], fallback: Callable[[], str],
+                 budget: Optional[float] = None) -> str:
+        """
+        Return the LLM reply if it arrives within budget, otherwise the fallback
+
+        The fallback is always computed, concurrently with the LLM call, so it
+        is ready the moment the deadline passes. A late LLM call cannot be
+        interrupted mid-request; it finishes in the background (bounded by its
+        read timeout) holding its slot, and is discarded.
+        """
+        budget = self.budget if budget is None else budget
+        started = time.monotonic()
+        deadline = started + budget
+        future = self._submit(llm_call)
+
+        fallback_response = fallback()
+
+        if future is None:
+            self._record('llm_saturated')
+            logger.info('All LLM slots busy, serving rule-based reply')
+            return fallback_response
+
+        try:
+            llm_response = future.result(timeout=max(0.0, deadline - time.monotonic()))
+        except FutureTimeoutError:
+            future.cancel()
+            self._record('budget_exceeded')
+            logger.info(f'LLM exceeded {budget:.1f}s response budget, serving rule-based reply')
+            return fallback_response
+        except Exception as e:
+            self._record('llm_failures')
+            logger.warning(f'LLM call failed, serving rule-based reply: {e}')
+            return fallback_response
+
+        if llm_response and llm_response.strip():
+            self._record('llm_wins', time.monotonic() - started)
+            return llm_response
+        self._record('llm_failures')
+        return fallback_response
+
+    def stats(self) -> Dict:
+        """Hedge outcome counters summed over all workers sharing the cache"""
+        try:
+            values = cache.get_many([_counter_key(name) for name in COUNTERS])
+        except Exception as e:
+            logger.warning(f'Could not read response hedging counters: {e}')
+            values = {}
+        stats = {name: int(values.get(_counter_key(name), 0)) for name in COUNTERS}
+        latency_total = stats.pop('llm_win_latency_ms_total')
+        total = stats['llm_wins'] + stats['budget_exceeded'] + stats['llm_failures'] + stats['llm_saturated']
+        stats.update({
+            'total': total,
+            'budget_seconds': self.budget,
+            'llm_win_rate': round(stats['llm_wins'] / total, 3) if total else None,
+            'avg_llm_win_latency_ms': round(latency_total / stats['llm_wins'], 1) if stats['llm_wins'] else None,
+        })
+        return stats
+
+
+# Global instance
+response_orchestrator = ResponseOrchestrator()
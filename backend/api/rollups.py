@@ -0,0 +1,161 @@
+"""
+Daily per-user analytics rollups stored in the Analytics model
+
+A day's row holds additive components (counts, sums, histograms), so any
+range of days combines exactly. Rows are recomputed per (user, day) when that
+day's messages, moods, sessions or CBT progress change (signals.py), which
+keeps the update idempotent and bounded by a single day of activity.
+
+Theme counts are the exception: they need the text of every message, so a
+refresh for new messages only matches those and adds them to the stored
+counts. All of the day's texts are rescanned only after edits and deletes
+(or when the row has no counts yet).
+"""
+from collections import Counter
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Iterable, Optional, Sequence, Tuple
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+from .archive import archived_rows
+from .keyword_matcher import match_keywords
+from .models import Analytics, CBTProgress, ConversationSession, EmotionalState, Message
+
+
+def day_bounds(first_day: date, last_day: date) -> Tuple[datetime, datetime]:
+    """
+    Aware start of first_day and of the day after last_day (local time)
+
+    Filtering on this half-open range instead of `__date` lookups keeps the
+    timestamp indexes usable (a date cast of the column cannot use them).
+    """
+    return (
+        timezone.make_aware(datetime.combine(first_day, time.min)),
+        timezone.make_aware(datetime.combine(last_day + timedelta(days=1), time.min)),
+    )
+
+
+def theme_values(theme_counts: Counter) -> Dict:
+    # Ties by name: the stored counts (jsonb) do not keep insertion order
+    ranked = sorted(theme_counts.items(), key=lambda item: (-item[1], item[0]))
+    return {
+        'theme_counts': dict(theme_counts),
+        'dominant_themes': [theme for theme, _ in ranked[:3]],
+    }
+
+
+def count_themes(contents: Iterable[str], theme_counts: Counter) -> None:
+    """Add the themes mentioned in each text to theme_counts"""
+    for content in contents:
+        theme_counts.update(match_keywords(content).get('theme', {}).keys())
+
+
+def compute_day(user_id: int, day: date, themes: bool = True) -> Dict:
+    """
+    Rollup field values for one user and local calendar day (not saved)
+
+    Without themes the message texts are not read and the theme fields are
+    left out.
+    """
+    start, end = day_bounds(day, day)
+    messages = Message.objects.filter(user_id=user_id, created_at__gte=start, created_at__lt=end)
+    user_only = Q(sender='user')
+    message_stats = messages.aggregate(
+        total_messages=Count('id'),
+        user_messages=Count('id', filter=user_only),
+        risk_events=Count('id', filter=Q(risk_level__gte=7)),
+        sentiment_sum=Sum('sentiment_score', filter=user_only),
+        sentiment_count=Count('sentiment_score', filter=user_only),
+    )
+    # Messages of archived sessions count without being moved back
+    archived = archived_rows(start, end, user_id=user_id)
+    archived_user = [row for row in archived if row['sender'] == 'user']
+    archived_scores = [row['sentiment_score'] for row in archived_user if row['sentiment_score'] is not None]
+    message_stats['total_messages'] += len(archived)
+    message_stats['user_messages'] += len(archived_user)
+    message_stats['risk_events'] += sum(1 for row in archived if row['risk_level'] >= 7)
+    message_stats['sentiment_sum'] = (message_stats['sentiment_sum'] or 0.0) + sum(archived_scores)
+    message_stats['sentiment_count'] += len(archived_scores)
+
+    mood_counts, mood_intensity_sums = {}, {}
+    for mood, count, intensity_sum in EmotionalState.objects.filter(
+        user_id=user_id, recorded_at__gte=start, recorded_at__lt=end
+    ).order_by().values('mood').annotate(
+        count=Count('id'), intensity_sum=Sum('intensity')
+    ).values_list('mood', 'count', 'intensity_sum'):
+        mood_counts[mood] = count
+        mood_intensity_sums[mood] = intensity_sum
+
+    sentiment_count = message_stats['sentiment_count']
+    sentiment_sum = message_stats['sentiment_sum']
+    values = {
+        'total_sessions': ConversationSession.objects.filter(
+            user_id=user_id, started_at__gte=start, started_at__lt=end
+        ).count(),
+        'total_messages': message_stats['total_messages'],
+        'user_messages': message_stats['user_messages'],
+        'risk_events': message_stats['risk_events'],
+        'sentiment_sum': sentiment_sum,
+        'sentiment_count': sentiment_count,
+        'average_sentiment': sentiment_sum / sentiment_count if sentiment_count else None,
+        'mood_entries': sum(mood_counts.values()),
+        'intensity_sum': sum(mood_intensity_sums.values()),
+        'mood_counts': mood_counts,
+        'mood_intensity_sums': mood_intensity_sums,
+        'cbt_completed': CBTProgress.objects.filter(
+            user_id=user_id, completed=True, completed_at__gte=start, completed_at__lt=end
+        ).count(),
+    }
+
+    if themes:
+        theme_counts, counted_ids = Counter(), []
+        if message_stats['user_messages'] > len(archived_user):
+            for message_id, content in messages.filter(user_only).order_by().values_list('id', 'content').iterator():
+                count_themes([content], theme_counts)
+                counted_ids.append(message_id)
+        count_themes((row['content'] for row in archived_user), theme_counts)
+        values.update(theme_values(theme_counts), theme_message_ids=sorted(counted_ids))
+    return values
+
+
+def has_activity(values: Dict) -> bool:
+    return bool(values['total_sessions'] or values['total_messages']
+                or values['mood_entries'] or values['cbt_completed'])
+
+
+def refresh_day(user_id: int, day: date, new_message_ids: Optional[Sequence[int]] = None) -> None:
+    """
+    Recompute and store one day's rollup (deleted when the day has no activity)
+
+    new_message_ids lists the messages added since the last refresh (may be
+    empty when no text changed): only their themes are added to the stored
+    counts. None rescans all of the day's texts. The row records which
+    messages its counts include, so redelivered tasks and messages already
+    seen by a rescan are not counted twice; the locked row serializes
+    refreshes of the same day.
+    """
+    with transaction.atomic():
+        row = Analytics.objects.select_for_update().filter(user_id=user_id, date=day).first()
+        incremental = new_message_ids is not None and row is not None and row.theme_message_ids is not None
+        values = compute_day(user_id, day, themes=not incremental)
+        if incremental:
+            theme_counts, counted_ids = Counter(row.theme_counts), set(row.theme_message_ids)
+            pending = set(new_message_ids) - counted_ids
+            if pending:
+                start, end = day_bounds(day, day)
+                for message_id, content in Message.objects.filter(
+                    pk__in=pending, user_id=user_id, sender='user', created_at__gte=start, created_at__lt=end
+                ).order_by().values_list('id', 'content'):
+                    count_themes([content], theme_counts)
+                    counted_ids.add(message_id)
+            values.update(theme_values(theme_counts), theme_message_ids=sorted(counted_ids))
+        if not has_activity(values):
+            if row is not None:
+                row.delete()
+        elif row is None:
+            # A concurrent first refresh of the day may insert the row meanwhile
+            Analytics.objects.update_or_create(user_id=user_id, date=day, defaults=values)
+        else:
+            for field, value in values.items():
+                setattr(row, field, value)
+            row.save()
@@ -0,0 +1,6 @@
+from django.urls import path
+from .consumers import ConversationConsumer
+
+websocket_urlpatterns = [
+    path('ws/conversation/', ConversationConsumer.as_asgi()),
+]
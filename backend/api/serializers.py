@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
+from .archive import decoded_messages
 from .models import (
     ConversationSession, Message, EmotionalState,
     CBTContent, CBTProgress, Analytics, CrisisResource, Subscription
@@ -64,12 +65,34 @@ class MessageSerializer(serializers.ModelSerializer):
 
 
 class ConversationSessionSerializer(serializers.ModelSerializer):
-    messages = MessageSerializer(many=True, read_only=True)
+    messages = serializers.SerializerMethodField()
     
     class Meta:
         model = ConversationSession
         fields = ['id', 'user', 'started_at', 'ended_at', 'is_active', 'messages']
         read_only_fields = ['id', 'started_at']
+    
+    def get_messages(self, obj):
+        # Sessions moved to cold storage are read from their archive (select_related
+        # by the views, so an empty session costs no extra query)
+        messages = list(obj.messages.all()) or decoded_messages(getattr(obj, 'message_archive', None))
+        return MessageSerializer(messages, many=True).data
+
+
+class ConversationSessionListSerializer(serializers.ModelSerializer):
+    """Compact session for lists; reads the annotations of conversation_utils.with_message_stats"""
+    message_count = serializers.IntegerField(read_only=True)
+    last_message_at = serializers.DateTimeField(read_only=True, allow_null=True)
+    last_message_preview = serializers.CharField(read_only=True, allow_null=True)
+    last_message_sender = serializers.CharField(read_only=True, allow_null=True)
+    avg_sentiment = serializers.FloatField(read_only=True, allow_null=True)
+    max_risk_level = serializers.IntegerField(read_only=True, allow_null=True)
+    
+    class Meta:
+        model = ConversationSession
+        fields = ['id', 'user', 'started_at', 'ended_at', 'is_active', 'message_count', 'last_message_at',
+                  'last_message_preview', 'last_message_sender', 'avg_sentiment', 'max_risk_level']
+        read_only_fields = fields
 
 
 class EmotionalStateSerializer(serializers.ModelSerializer):
@@ -177,7 +200,8 @@ class AnalyticsSerializer(serializers.ModelSerializer):
     class Meta:
         model = Analytics
         fields = ['id', 'user', 'date', 'total_sessions', 'total_messages',
-                  'average_sentiment', 'dominant_themes', 'risk_events']
+                  'average_sentiment', 'dominant_themes', 'risk_events',
+                  'user_messages', 'mood_entries', 'mood_counts', 'cbt_completed', 'updated_at']
         read_only_fields = ['id']
 
 
@@ -1,41 +1,44 @@
 """
 Service layer for sentiment analysis and risk detection
 """
-from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
+from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer, SentiText
+import logging
+import os
 import re
-from typing import Dict, Tuple, List, Optional
+from typing import Dict, Tuple, List, Optional, Iterable, Iterator, AsyncIterator
+from asgiref.sync import sync_to_async
+from concurrent.futures import Executor, ProcessPoolExecutor
 from collections import defaultdict
 import math
 import random
 from .ai_model import AIModelResponseGenerator
+from .conversation_state import ConversationState
+from .keyword_matcher import RISK_KEYWORDS, TOPIC_KEYWORDS, match_keywords
+from .response_orchestrator import response_orchestrator
 try:
     from .openai_service import openai_service
     OPENAI_AVAILABLE = True
 except ImportError:
     OPENAI_AVAILABLE = False
 
+logger = logging.getLogger('api')
+
 
 class SentimentAnalyzer:
     """Analyzes sentiment and detects risk in user input"""
     
     def __init__(self):
         self.analyzer = SentimentIntensityAnalyzer()
-        self.risk_keywords = [
-            # English
-            'suicide', 'kill myself', 'end my life', 'want to die',
-            'hurt myself', 'self harm', 'no reason to live',
-            'better off dead', 'give up', 'hopeless',
-            # Russian
-            'суицид', 'покончить', 'убить себя', 'не хочу жить',
-            'лучше умереть', 'нет смысла', 'безнадежно',
-            'навредить себе', 'все кончено', 'все безнадежно',
-            'сдаюсь', 'не выдержу', 'больше не могу'
-        ]
+        self.risk_keywords = RISK_KEYWORDS
+        # Characters VADER replaces by their description (checked per batch text)
+        self._emoji_chars = frozenset(self.analyzer.emojis)
     
     def analyze(self, text: str) -> Dict:
         """Analyze sentiment and risk level from text"""
-        # Get sentiment scores
-        scores = self.analyzer.polarity_scores(text)
+        return self._result(text, self.analyzer.polarity_scores(text))
+    
+    def _result(self, text: str, scores: Dict) -> Dict:
+        """Label and risk level for VADER scores of text"""
         compound = scores['compound']
         
         # Determine sentiment label
@@ -56,15 +59,63 @@ class SentimentAnalyzer:
             'scores': scores
         }
     
+    def analyze_many(self, texts: Iterable[str], processes: Optional[int] = None,
+                     chunk_size: int = 1000, pool: Optional[Executor] = None) -> List[Dict]:
+        """
+        Analyze a batch of texts; returns the same dicts as analyze(), in order
+        
+        The batch shares its work: identical texts are scored once, and token
+        stripping and lexicon lookups are memoized across all texts (see
+        _batch_scores). With processes > 1 (or an existing executor passed as
+        pool, created with initializer=init_pool_worker), batches larger than
+        chunk_size are split into chunks scored in a process pool.
+        """
+        texts = list(texts)
+        if (pool is not None or (processes and processes > 1)) and len(texts) > chunk_size:
+            chunks = [texts[i:i + chunk_size] for i in range(0, len(texts), chunk_size)]
+            if pool is None:
+                with ProcessPoolExecutor(max_workers=processes, initializer=init_pool_worker) as own_pool:
+                    return [r for part in own_pool.map(_analyze_chunk, chunks) for r in part]
+            return [r for part in pool.map(_analyze_chunk, chunks) for r in part]
+        
+        lexicon_hits = {}
+        cache = {}
+        results = []
+        for text in texts:
+            analysis = cache.get(text)
+            if analysis is None:
+                analysis = cache[text] = self._result(text, self._batch_scores(text, lexicon_hits))
+            # Callers may adjust results in place, so each entry gets its own copy
+            results.append({**analysis, 'scores': dict(analysis['scores'])})
+        return results
+    
+    def _batch_scores(self, text: str, lexicon_hits: Dict[str, bool]) -> Dict:
+        """
+        VADER polarity_scores(text), skipping the per-word rules when they cannot apply
+        
+        VADER gives a word a non-zero valence only if it is in the lexicon, so
+        a text without emojis and without lexicon words (most Russian text)
+        scores exactly like all-zero valences. lexicon_hits memoizes, per raw
+        token, whether its punctuation-stripped form is in the lexicon.
+        """
+        if not self._emoji_chars.isdisjoint(text):
+            return self.analyzer.polarity_scores(text)
+        text = text.strip()
+        words = text.split()
+        for word in words:
+            hit = lexicon_hits.get(word)
+            if hit is None:
+                hit = lexicon_hits[word] = SentiText._strip_punc_if_word(word).lower() in self.analyzer.lexicon
+            if hit:
+                return self.analyzer.polarity_scores(text)
+        return self.analyzer.score_valence([0] * len(words), text)
+    
     def _calculate_risk(self, text: str, sentiment_score: float) -> int:
         """Calculate risk level from 0-10"""
-        risk = 0
-        text_lower = text.lower()
+        hits = match_keywords(text)
         
-        # Check for risk keywords
-        for keyword in self.risk_keywords:
-            if keyword in text_lower:
-                risk += 3
+        # Each distinct risk keyword adds 3 points
+        risk = hits.get('risk', {}).get('risk', 0) * 3
         
         # Adjust based on sentiment
         if sentiment_score < -0.5:
@@ -72,15 +123,27 @@ class SentimentAnalyzer:
         elif sentiment_score < -0.3:
             risk += 1
         
-        # Check for intensity words
-        intensity_words = ['very', 'extremely', 'completely', 'totally', 'absolutely']
-        for word in intensity_words:
-            if word in text_lower:
-                risk += 1
+        # Each distinct intensity word adds 1 point
+        risk += hits.get('intensity', {}).get('intensity', 0)
         
         return min(risk, 10)
 
 
+def init_pool_worker() -> None:
+    """Process pool initializer: set up Django in workers started with spawn (forked ones inherit it)"""
+    import django
+    from django.apps import apps
+    if not apps.ready:
+        os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+        django.setup()
+
+
+def _analyze_chunk(texts: List[str]) -> List[Dict]:
+    """Process pool worker: score one chunk with the worker's shared analyzer"""
+    from .engines import get_sentiment_analyzer
+    return get_sentiment_analyzer().analyze_many(texts)
+
+
 class TherapistResponseGenerator(AIModelResponseGenerator):
     """Generates empathetic therapist responses based on context and history"""
     
@@ -135,25 +198,11 @@ class TherapistResponseGenerator(AIModelResponseGenerator):
         }
         
         # Keywords for topic detection
-        self.topic_keywords = {
-            'work': ['работа', 'работе', 'начальник', 'коллеги', 'проект', 'задача', 'дедлайн', 'офис'],
-            'relationships': ['друг', 'друзья', 'семья', 'родители', 'партнер', 'отношения', 'любовь', 'расставание'],
-            'anxiety': ['тревож', 'беспоко', 'страх', 'паник', 'волную', 'нервнича', 'боюсь'],
-            'depression': ['груст', 'подавлен', 'плохо', 'нет сил', 'ничего не хочу', 'устал', 'апати'],
-            'health': ['здоров', 'болезн', 'боль', 'симптом', 'врач', 'лечени'],
-            'sleep': ['сон', 'сплю', 'бессонниц', 'не могу уснуть', 'усталость'],
-            'self_esteem': ['неуверен', 'не нравлюсь', 'недостоин', 'ничего не получается', 'неудач'],
-        }
+        self.topic_keywords = TOPIC_KEYWORDS
     
     def _analyze_topic(self, text: str) -> Optional[str]:
         """Detect main topic in the text"""
-        text_lower = text.lower()
-        topic_scores = defaultdict(int)
-        
-        for topic, keywords in self.topic_keywords.items():
-            for keyword in keywords:
-                if keyword in text_lower:
-                    topic_scores[topic] += 1
+        topic_scores = match_keywords(text).get('topic')
         
         if topic_scores:
             return max(topic_scores.items(), key=lambda x: x[1])[0]
@@ -315,92 +364,113 @@ class TherapistResponseGenerator(AIModelResponseGenerator):
             
             return random.choice(self.responses['neutral'])
     
+    def _analyze_history_window(self, conversation_history: List[Dict], history_context: Dict) -> None:
+        """Trend, risk patterns and topic relevance from raw messages (no session state)"""
+        sentiment_scores = [m.get('sentiment_score', 0) for m in conversation_history 
+                          if m.get('sender') == 'user' and m.get('sentiment_score') is not None]
+        mood_history = []  # Will be populated from EmotionalState if needed
+        
+        # Analyze sentiment trend using AI model
+        if sentiment_scores:
+            history_context['sentiment_trend'] = self.analyze_sentiment_trend(sentiment_scores)
+        
+        # Detect risk patterns using AI model
+        history_context['risk_analysis'] = self.detect_risk_patterns(conversation_history, mood_history)
+        
+        # Calculate topic relevance
+        topics = ['work', 'relationships', 'health', 'anxiety', 'depression', 'sleep']
+        history_context['topic_relevance'] = self.calculate_topic_relevance(conversation_history, topics)
+    
+    def _history_context(self, conversation_history: Optional[List[Dict]],
+                         conversation_state: Optional[ConversationState] = None) -> Dict:
+        """Context from the session state when available, else from the history window"""
+        if conversation_state is not None:
+            return conversation_state.history_context()
+        return self._analyze_conversation_history(conversation_history or [])
+    
+    def _generate_rule_based_response(self, user_message: str, sentiment: str, risk_level: int,
+                                      conversation_history: Optional[List[Dict]],
+                                      history_context: Dict, is_assessment: bool = False) -> str:
+        """Rule-based reply using the AI model analysis (no network calls)"""
+        # Try to use AI model for enhanced analysis
+        try:
+            # Context built from ConversationState already carries trend, risk and topics
+            if 'risk_analysis' not in history_context:
+                self._analyze_history_window(conversation_history or [], history_context)
+            risk_analysis = history_context['risk_analysis']
+            
+            # Calculate priority
+            sentiment_trend_dict = history_context.get('sentiment_trend', {}) if isinstance(history_context.get('sentiment_trend'), dict) else {'trend': 'stable'}
+            priority = self.generate_response_priority(
+                float(history_context.get('avg_sentiment', 0)),
+                sentiment_trend_dict,
+                risk_analysis,
+                history_context.get('conversation_length', 0)
+            )
+            history_context['priority'] = priority
+            
+            # Use AI model for response generation if conversation is long enough
+            if len(conversation_history or []) > 3:
+                try:
+                    response = self.generate_contextual_response(user_message, history_context)
+                    if response and len(response.strip()) > 0:
+                        return response
+                except Exception as e:
+                    logger.warning(f'Error in AI contextual response: {e}')  # Fallback to original method
+        except Exception as e:
+            logger.warning(f'Error in AI model analysis: {e}')
+            # Continue with fallback method
+        
+        # Generate contextual response (fallback - always works)
+        response = self._generate_contextual_response(
+            user_message, sentiment, risk_level, history_context, is_assessment
+        )
+        
+        # Ensure response is not empty and has proper length
+        if not response or len(response.strip()) < 10:
+            # Very short fallback
+            if sentiment == 'positive':
+                response = "Отлично! Расскажи мне больше об этом."
+            elif sentiment == 'negative':
+                response = "Понимаю. Расскажи подробнее, что тебя беспокоит?"
+            else:
+                response = "Понял тебя. Что еще ты хотел бы обсудить?"
+        
+        return response
+    
     def generate_response(self, user_message: str, sentiment: str, risk_level: int, 
                          conversation_history: Optional[List[Dict]] = None, 
-                         is_assessment: bool = False) -> str:
+                         is_assessment: bool = False, use_llm: bool = True,
+                         conversation_state: Optional[ConversationState] = None) -> str:
         """Generate appropriate therapist response based on context"""
         try:
-            # Analyze conversation history
-            history_context = self._analyze_conversation_history(conversation_history or [])
+            # Analyze conversation history (O(1) from the session state when given)
+            history_context = self._history_context(conversation_history, conversation_state)
             
-            # Try OpenAI API first if available
-            if OPENAI_AVAILABLE and openai_service.enabled:
-                try:
-                    ai_response = openai_service.generate_response(
+            # Race OpenAI against the rule-based reply within the turn budget
+            if use_llm and OPENAI_AVAILABLE and openai_service.enabled:
+                llm_context = dict(history_context)
+                return response_orchestrator.generate(
+                    lambda: openai_service.generate_response(
                         user_message,
                         conversation_history or [],
                         sentiment,
                         risk_level,
-                        history_context
+                        llm_context
+                    ),
+                    lambda: self._generate_rule_based_response(
+                        user_message, sentiment, risk_level,
+                        conversation_history, history_context, is_assessment
                     )
-                    if ai_response:
-                        return ai_response
-                except Exception as e:
-                    print(f"OpenAI API error, falling back to rule-based: {e}")
-            
-            # Use AI model for enhanced analysis
-            sentiment_scores = [m.get('sentiment_score', 0) for m in conversation_history or [] 
-                              if m.get('sender') == 'user' and m.get('sentiment_score') is not None]
-            mood_history = []  # Will be populated from EmotionalState if needed
-            
-            # Try to use AI model for enhanced analysis
-            try:
-                # Analyze sentiment trend using AI model
-                if sentiment_scores:
-                    trend = self.analyze_sentiment_trend(sentiment_scores)
-                    history_context['sentiment_trend'] = trend
-                
-                # Detect risk patterns using AI model
-                risk_analysis = self.detect_risk_patterns(conversation_history or [], mood_history)
-                history_context['risk_analysis'] = risk_analysis
-                
-                # Calculate priority
-                sentiment_trend_dict = history_context.get('sentiment_trend', {}) if isinstance(history_context.get('sentiment_trend'), dict) else {'trend': 'stable'}
-                priority = self.generate_response_priority(
-                    float(history_context.get('avg_sentiment', 0)),
-                    sentiment_trend_dict,
-                    risk_analysis,
-                    history_context.get('conversation_length', 0)
                 )
-                history_context['priority'] = priority
-                
-                # Calculate topic relevance
-                topics = ['work', 'relationships', 'health', 'anxiety', 'depression', 'sleep']
-                topic_relevance = self.calculate_topic_relevance(conversation_history or [], topics)
-                history_context['topic_relevance'] = topic_relevance
-                
-                # Use AI model for response generation if conversation is long enough
-                if len(conversation_history or []) > 3:
-                    try:
-                        response = self.generate_contextual_response(user_message, history_context)
-                        if response and len(response.strip()) > 0:
-                            return response
-                    except Exception as e:
-                        print(f"Error in AI contextual response: {e}")
-                        pass  # Fallback to original method
-            except Exception as e:
-                print(f"Error in AI model analysis: {e}")
-                # Continue with fallback method
             
-            # Generate contextual response (fallback - always works)
-            response = self._generate_contextual_response(
-                user_message, sentiment, risk_level, history_context, is_assessment
+            return self._generate_rule_based_response(
+                user_message, sentiment, risk_level,
+                conversation_history, history_context, is_assessment
             )
             
-            # Ensure response is not empty and has proper length
-            if not response or len(response.strip()) < 10:
-                # Very short fallback
-                if sentiment == 'positive':
-                    response = "Отлично! Расскажи мне больше об этом."
-                elif sentiment == 'negative':
-                    response = "Понимаю. Расскажи подробнее, что тебя беспокоит?"
-                else:
-                    response = "Понял тебя. Что еще ты хотел бы обсудить?"
-            
-            return response
-            
         except Exception as e:
-            print(f"Error in generate_response: {e}")
+            logger.error(f'Error in generate_response: {e}', exc_info=True)
             # Ultimate fallback - simple response based on sentiment
             if risk_level >= 7:
                 return self.responses.get('crisis', ['Я понимаю, что тебе сейчас трудно. Я здесь, чтобы помочь.'])[0]
@@ -411,6 +481,67 @@ class TherapistResponseGenerator(AIModelResponseGenerator):
             else:
                 return self.responses.get('neutral', ['Расскажи мне больше о том, что происходит.'])[0]
     
+    def stream_response(self, user_message: str, sentiment: str, risk_level: int,
+                        conversation_history: Optional[List[Dict]] = None,
+                        is_assessment: bool = False,
+                        conversation_state: Optional[ConversationState] = None) -> Iterator[str]:
+        """
+        Yield the therapist response in chunks as it is produced
+        
+        OpenAI tokens are passed through as they arrive; if the API is disabled
+        or fails before the first token, the rule-based reply is yielded whole.
+        """
+        if OPENAI_AVAILABLE and openai_service.enabled:
+            history_context = self._history_context(conversation_history, conversation_state)
+            streamed = False
+            for token in openai_service.stream_response(
+                user_message,
+                conversation_history or [],
+                sentiment,
+                risk_level,
+                history_context
+            ):
+                streamed = True
+                yield token
+            if streamed:
+                return
+        
+        yield self.generate_response(
+            user_message, sentiment, risk_level,
+            conversation_history=conversation_history,
+            is_assessment=is_assessment,
+            use_llm=False,
+            conversation_state=conversation_state
+        )
+    
+    async def astream_response(self, user_message: str, sentiment: str, risk_level: int,
+                               conversation_history: Optional[List[Dict]] = None,
+                               is_assessment: bool = False,
+                               conversation_state: Optional[ConversationState] = None) -> AsyncIterator[str]:
+        """Async variant of stream_response for consumers (no thread per token)"""
+        if OPENAI_AVAILABLE and openai_service.enabled:
+            history_context = self._history_context(conversation_history, conversation_state)
+            streamed = False
+            async for token in openai_service.astream_response(
+                user_message,
+                conversation_history or [],
+                sentiment,
+                risk_level,
+                history_context
+            ):
+                streamed = True
+                yield token
+            if streamed:
+                return
+        
+        yield await sync_to_async(self.generate_response, thread_sensitive=False)(
+            user_message, sentiment, risk_level,
+            conversation_history=conversation_history,
+            is_assessment=is_assessment,
+            use_llm=False,
+            conversation_state=conversation_state
+        )
+    
     def generate_session_summary(self, conversation_history: List[Dict]) -> str:
         """Generate a summary of the conversation session"""
         if not conversation_history:
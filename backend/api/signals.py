@@ -0,0 +1,113 @@
+"""
+Keep derived analytics in step with the rows they are built from
+
+Any write to a message, mood entry, session or CBT completion queues a
+recompute of the affected (user, day) rollup after commit and invalidates
+the user's cached dashboard and timeline responses (as do rollup and
+subscription writes). Cascades from deleting a user are skipped, their
+rollups are deleted with them.
+"""
+from datetime import datetime
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from .archive import archiving_in_progress
+from .models import Analytics, CBTProgress, ConversationSession, EmotionalState, Message, Subscription
+from .response_cache import bump_version
+
+
+def schedule_rollup(user_id, when, new_message_ids=()) -> None:
+    """
+    Queue a recompute of the user's rollup for the local day of `when`
+
+    new_message_ids are the messages whose themes are still to be counted;
+    None when message texts changed or went away, which rescans the day.
+    """
+    if user_id is None or when is None:
+        return
+    # Imported here so connecting the signals does not load the task graph (engines, metrics)
+    from .tasks import enqueue, refresh_daily_analytics
+    day = timezone.localdate(when) if isinstance(when, datetime) else when
+    enqueue(refresh_daily_analytics, user_id, day.isoformat(),
+            None if new_message_ids is None else list(new_message_ids))
+
+
+def data_changed(user_id, when, new_message_ids=()) -> None:
+    """Refresh the rollup of the day and drop the user's cached responses"""
+    schedule_rollup(user_id, when, new_message_ids)
+    bump_version(user_id)
+
+
+def _from_user_delete(origin) -> bool:
+    return isinstance(origin, User) or getattr(origin, 'model', None) is User
+
+
+@receiver(post_save, sender=Message)
+def message_saved(sender, instance, created, **kwargs):
+    # An edited text may have changed its themes
+    data_changed(instance.user_id, instance.created_at, [instance.id] if created else None)
+
+
+@receiver(post_delete, sender=Message)
+def message_deleted(sender, instance, origin=None, **kwargs):
+    # Archived messages still count in their day's rollup
+    if not _from_user_delete(origin) and not archiving_in_progress():
+        data_changed(instance.user_id, instance.created_at, None)
+
+
+@receiver(post_save, sender=EmotionalState)
+def emotional_state_saved(sender, instance, **kwargs):
+    data_changed(instance.user_id, instance.recorded_at)
+
+
+@receiver(post_delete, sender=EmotionalState)
+def emotional_state_deleted(sender, instance, origin=None, **kwargs):
+    if not _from_user_delete(origin):
+        data_changed(instance.user_id, instance.recorded_at)
+
+
+@receiver(post_save, sender=ConversationSession)
+def session_saved(sender, instance, created, **kwargs):
+    # Ending a session changes nothing the analytics count
+    if created:
+        data_changed(instance.user_id, instance.started_at)
+
+
+@receiver(post_delete, sender=ConversationSession)
+def session_deleted(sender, instance, origin=None, **kwargs):
+    if not _from_user_delete(origin):
+        data_changed(instance.user_id, instance.started_at)
+
+
+@receiver(post_init, sender=CBTProgress)
+def cbt_progress_loaded(sender, instance, **kwargs):
+    # Remember the stored completion day so un-completing updates that day too
+    instance._rollup_completed_at = instance.completed_at
+
+
+@receiver(post_save, sender=CBTProgress)
+def cbt_progress_saved(sender, instance, created, **kwargs):
+    # A new row may be created already completed
+    previous = None if created else instance._rollup_completed_at
+    if previous != instance.completed_at:
+        schedule_rollup(instance.user_id, previous)
+        schedule_rollup(instance.user_id, instance.completed_at)
+        instance._rollup_completed_at = instance.completed_at
+    bump_version(instance.user_id)
+
+
+@receiver(post_delete, sender=CBTProgress)
+def cbt_progress_deleted(sender, instance, origin=None, **kwargs):
+    if not _from_user_delete(origin):
+        data_changed(instance.user_id, instance.completed_at)
+
+
+@receiver(post_save, sender=Analytics)
+@receiver(post_delete, sender=Analytics)
+@receiver(post_save, sender=Subscription)
+@receiver(post_delete, sender=Subscription)
+def cached_inputs_changed(sender, instance, origin=None, **kwargs):
+    # Rollups land after the write that queued them; the tier changes what is shown
+    if not _from_user_delete(origin):
+        bump_version(instance.user_id)
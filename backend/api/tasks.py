@@ -0,0 +1,121 @@
+"""
+Background tasks run by the Celery worker (celery -A config worker)
+
+Every task is idempotent: it recomputes or conditionally updates from the
+database instead of incrementing, so redelivery (acks_late) and duplicate
+enqueues are harmless.
+"""
+import logging
+from datetime import date, datetime, timedelta
+from typing import List, Optional
+from celery import shared_task
+from django.db import transaction
+from django.db.models import Subquery
+from config.celery import ensure_broker_dirs
+from .engines import get_response_generator
+from .models import ConversationSession, EmotionalState, Message
+from .response_cache import bump_version
+from .admin_metrics import refresh_snapshots
+from .archive import archive_sessions
+from .partitions import ensure_partitions
+from .rollups import refresh_day
+
+logger = logging.getLogger('api')
+
+
+def enqueue(task, *args):
+    """
+    Send a task once the current transaction commits
+
+    Identical calls pending in the same transaction are sent once. If the
+    broker cannot be reached the task runs inline, so a broker outage
+    degrades latency instead of losing work.
+    """
+    key = (task.name, args)
+    connection = transaction.get_connection()
+    if connection.in_atomic_block and any(
+        getattr(callback, 'task_key', None) == key for _, callback, _ in connection.run_on_commit
+    ):
+        return
+
+    def send():
+        try:
+            ensure_broker_dirs()
+            task.apply_async(args=args)
+        except Exception as e:
+            logger.warning(f'Broker unavailable, running {task.name} inline: {e}')
+            try:
+                task.apply(args=args)
+            except Exception as e:
+                logger.error(f'Inline run of {task.name} failed: {e}', exc_info=True)
+
+    send.task_key = key
+    transaction.on_commit(send)
+
+
+@shared_task
+def link_emotional_state(user_id: int, session_id: int, turn_at: str) -> int:
+    """Attach the user's latest mood from the hour before turn_at to the session (if unlinked)"""
+    turn_time = datetime.fromisoformat(turn_at)
+    latest_state = EmotionalState.objects.filter(
+        user_id=user_id,
+        recorded_at__gte=turn_time - timedelta(hours=1),
+        recorded_at__lte=turn_time
+    ).order_by('-recorded_at').values('pk')[:1]
+    linked = EmotionalState.objects.filter(
+        pk__in=Subquery(latest_state),
+        session__isnull=True
+    ).update(session_id=session_id)
+    if linked:
+        bump_version(user_id)
+    return linked
+
+
+@shared_task
+def review_session_risk(session_id: int) -> dict:
+    """Full-session risk pattern analysis including the user's recent moods"""
+    session = ConversationSession.objects.filter(pk=session_id).only('id', 'user_id').first()
+    if session is None:
+        return {}
+
+    messages = list(Message.objects.filter(
+        session_id=session_id, sender='user'
+    ).values('content', 'sentiment_score', 'risk_level'))
+    mood_history = list(EmotionalState.objects.filter(
+        user_id=session.user_id
+    ).order_by('-recorded_at').values('mood')[:3])
+
+    risk_analysis = get_response_generator().detect_risk_patterns(messages, mood_history)
+    if risk_analysis['requires_attention']:
+        logger.warning(
+            f'⚠ Session {session_id} (user {session.user_id}) needs attention: '
+            f'risk {risk_analysis["risk_level"]:.1f}, factors {", ".join(risk_analysis["risk_factors"])}'
+        )
+    return risk_analysis
+
+
+@shared_task
+def refresh_daily_analytics(user_id: int, day: str, new_message_ids: Optional[List[int]] = None) -> None:
+    """Recompute the user's Analytics rollup for one day (YYYY-MM-DD), see rollups.refresh_day"""
+    refresh_day(user_id, date.fromisoformat(day), new_message_ids)
+
+
+@shared_task
+def refresh_platform_snapshots() -> int:
+    """Recompute platform snapshots from the last settling days up to yesterday (run by beat)"""
+    return refresh_snapshots()
+
+
+@shared_task
+def archive_ended_sessions() -> int:
+    """Move messages of sessions ended over MESSAGE_ARCHIVE_MONTHS ago to cold storage (run by beat)"""
+    sessions, messages = archive_sessions()
+    if sessions:
+        logger.info(f'Archived {messages} message(s) of {sessions} session(s)')
+    return messages
+
+
+@shared_task
+def create_message_partitions() -> list:
+    """Create the coming months' Message partitions on PostgreSQL (run by beat, no-op elsewhere)"""
+    return ensure_partitions()
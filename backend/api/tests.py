@@ -0,0 +1,951 @@
+import math
+import multiprocessing
+import os
+import tempfile
+import threading
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, time, timedelta
+from http.server import ThreadingHTTPServer
+from io import StringIO
+from operator import itemgetter
+from unittest import mock, skipUnless
+import numpy as np
+from channels.db import database_sync_to_async
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import Avg, Count, F, Q
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.test import APIClient
+from config.celery import app as celery_app
+from . import partitions
+from .admin_metrics import LEADERBOARD_SORTS
+from .analytics_frame import AnalyticsFrame
+from .archive import archive_sessions
+from .consumers import ConversationConsumer
+from .conversation_state import ConversationState
+from .conversation_utils import persist_turn, prepare_turn
+from .downsampling import bucket_start, choose_bucket, downsample, lttb
+from .engines import get_response_generator, get_sentiment_analyzer
+from .hyperloglog import RELATIVE_ERROR as HYPERLOGLOG_ERROR, HyperLogLog
+from .keyword_matcher import match_keywords
+from .management.commands.openai_stub import make_handler
+from .models import Analytics, CBTContent, CBTProgress, ConversationSession, EmotionalState, Message, MessageArchive
+from .openai_service import openai_service
+from .response_cache import bump_version, cached_response
+from .response_orchestrator import ResponseOrchestrator
+from .rollups import compute_day, day_bounds, has_activity, refresh_day
+from .services import init_pool_worker
+from .tasks import refresh_daily_analytics
+from .timeline import dashboard_timeline
+
+
+class VoiceTurnMixin:
+    """A user with a session that already has history (steady state)"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('turn', 'turn@example.com', 'pw123456!')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.session = ConversationSession.objects.create(user=self.user)
+        # Warm up: the first turns build the session state and today's rollup
+        for text in ('Привет', 'Мне сегодня немного тревожно'):
+            self.turn(text)
+
+    def turn(self, text):
+        response = self.client.post(
+            '/api/voice/process/', {'text': text, 'session_id': self.session.id}, format='json'
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        return response
+
+
+class VoiceTurnQueryBudgetTests(VoiceTurnMixin, TestCase):
+    """Queries of a turn on the request path (follow-up tasks are only queued)"""
+
+    def test_steady_state_turn(self):
+        # Session lookup, history tail, then in one transaction (savepoint here):
+        # session row lock, bulk insert of both messages and the session state update
+        with self.assertNumQueries(7):
+            self.turn('Я плохо сплю последние дни')
+        self.assertEqual(Message.objects.filter(session=self.session).count(), 6)
+
+
+class VoiceTurnFollowUpQueryBudgetTests(VoiceTurnMixin, TransactionTestCase):
+    """Queries of a turn with its follow-up tasks run inline at commit (docker-compose default)"""
+
+    def setUp(self):
+        eager = celery_app.conf.task_always_eager
+        celery_app.conf.update(CELERY_TASK_ALWAYS_EAGER=True)
+        self.addCleanup(celery_app.conf.update, CELERY_TASK_ALWAYS_EAGER=eager)
+        super().setUp()
+
+    def test_steady_state_turn(self):
+        # Request path (7 with BEGIN/COMMIT), mood link (1), today's rollup in a
+        # transaction: locked row, archive lookup + 4 aggregates, the new
+        # message's text for its themes, update (10 with BEGIN/COMMIT)
+        with self.assertNumQueries(18):
+            self.turn('Я плохо сплю последние дни')
+
+
+class ConcurrentTurnStateTests(TestCase):
+    """Turns prepared from the same stored state both end up in the session statistics"""
+
+    def test_overlapping_turns(self):
+        user = User.objects.create_user('tabs', 'tabs@example.com', 'pw123456!')
+        session = ConversationSession.objects.create(user=user)
+        turn = prepare_turn(session, 'Привет')
+        persist_turn(user, session, turn['user_message'], 'Здравствуй', turn['state'])
+
+        tabs = [ConversationSession.objects.get(pk=session.pk) for _ in range(2)]
+        turns = [prepare_turn(tab, text) for tab, text in zip(tabs, ('Мне тревожно', 'Я плохо сплю'))]
+        for tab, turn in zip(tabs, turns):
+            persist_turn(user, tab, turn['user_message'], 'Понимаю', turn['state'])
+
+        session.refresh_from_db()
+        self.assertEqual(ConversationState(session.state).turns, 3)
+        self.assertEqual(session.state, tabs[1].state)
+
+
+class ConversationConsumerTests(TransactionTestCase):
+    """WebSocket turns stream the stub's tokens and persist the turn once, after the stream"""
+
+    REPLY = 'Я слышу тебя. Что беспокоит тебя больше всего?'
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.stub = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(cls.REPLY, 0, 0.01))
+        threading.Thread(target=cls.stub.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.stub.shutdown()
+        cls.stub.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        eager = celery_app.conf.task_always_eager
+        celery_app.conf.update(CELERY_TASK_ALWAYS_EAGER=True)
+        self.addCleanup(celery_app.conf.update, CELERY_TASK_ALWAYS_EAGER=eager)
+        patcher = mock.patch.multiple(
+            openai_service, api_key='stub', enabled=True, max_retries=0,
+            base_url=f'http://127.0.0.1:{self.stub.server_port}/v1/chat/completions'
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = User.objects.create_user('socket', 'socket@example.com', 'pw123456!')
+        self.persist = mock.patch('api.consumers.persist_turn', side_effect=persist_turn)
+        self.addCleanup(self.persist.stop)
+        self.persisted = self.persist.start()
+
+    async def connect(self, user=None):
+        communicator = WebsocketCommunicator(ConversationConsumer.as_asgi(), '/ws/conversation/')
+        communicator.scope['user'] = user or self.user
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def test_streams_tokens_then_persists_once(self):
+        communicator = await self.connect()
+        await communicator.send_json_to({'text': 'Мне тревожно перед работой'})
+        start = await communicator.receive_json_from()
+        self.assertEqual(start['type'], 'start')
+
+        tokens = []
+        frame = await communicator.receive_json_from()
+        while frame['type'] == 'token':
+            tokens.append(frame['token'])
+            # Nothing is written while the reply is still streaming
+            self.persisted.assert_not_called()
+            frame = await communicator.receive_json_from()
+        await communicator.disconnect()
+
+        self.assertGreater(len(tokens), 1)
+        self.assertEqual(''.join(tokens), self.REPLY)
+        self.assertEqual(frame['type'], 'done')
+        self.assertEqual(frame['therapist_message']['content'], self.REPLY)
+        self.persisted.assert_called_once()
+        count = await database_sync_to_async(Message.objects.filter(session_id=start['session_id']).count)()
+        self.assertEqual(count, 2)
+
+    async def test_stream_error_persists_the_partial_reply(self):
+        async def broken(*args, **kwargs):
+            yield 'Я слышу тебя. '
+            raise ConnectionError('stream reset')
+
+        communicator = await self.connect()
+        with mock.patch.object(get_response_generator(), 'astream_response', broken), \
+                self.assertLogs('api', 'ERROR'):
+            await communicator.send_json_to({'text': 'Привет'})
+            frames = [await communicator.receive_json_from() for _ in range(3)]
+        await communicator.disconnect()
+
+        self.assertEqual([frame['type'] for frame in frames], ['start', 'token', 'done'])
+        self.assertEqual(frames[2]['therapist_message']['content'], 'Я слышу тебя.')
+        self.persisted.assert_called_once()
+
+    async def test_invalid_input(self):
+        communicator = await self.connect()
+        await communicator.send_json_to({'text': ''})
+        frame = await communicator.receive_json_from()
+        await communicator.disconnect()
+        self.assertEqual(frame['type'], 'error')
+        self.assertIn('text', frame['errors'])
+        self.persisted.assert_not_called()
+
+    async def test_disconnect_mid_stream_still_persists_the_turn(self):
+        communicator = await self.connect()
+        await communicator.send_json_to({'text': 'Мне грустно'})
+        self.assertEqual((await communicator.receive_json_from())['type'], 'start')
+        await communicator.disconnect()
+
+        self.persisted.assert_called_once()
+        contents = await database_sync_to_async(list)(
+            Message.objects.filter(sender='therapist').values_list('content', flat=True)
+        )
+        self.assertEqual(contents, [self.REPLY])
+
+    async def test_anonymous_connection_is_rejected(self):
+        communicator = WebsocketCommunicator(ConversationConsumer.as_asgi(), '/ws/conversation/')
+        communicator.scope['user'] = AnonymousUser()
+        connected, code = await communicator.connect()
+        self.assertFalse(connected)
+        self.assertEqual(code, 4401)
+
+
+class AnalyzeManyTests(SimpleTestCase):
+    """analyze_many returns exactly what analyze returns for each text"""
+
+    TEXTS = [
+        'Мне сегодня очень плохо и тревожно',
+        'Всё хорошо, спасибо!!!',
+        'I feel great today :)',
+        'I am NOT happy, but it could be worse',
+        'не хочу жить',
+        'Отличный день 😊 правда',
+        'ужасно... просто ужасно',
+        'kind of sad',
+        '',
+        '   ',
+        'no good, no hope',
+        'Мне сегодня очень плохо и тревожно',
+        'VERY bad day',
+    ]
+
+    def test_matches_single_analysis(self):
+        analyzer = get_sentiment_analyzer()
+        self.assertEqual(analyzer.analyze_many(self.TEXTS), [analyzer.analyze(text) for text in self.TEXTS])
+
+    def test_results_are_independent_copies(self):
+        first, _, duplicate = get_sentiment_analyzer().analyze_many(self.TEXTS[:1] * 3)
+        first['scores']['compound'] = 99
+        self.assertNotEqual(duplicate['scores']['compound'], 99)
+
+    def test_spawned_process_pool(self):
+        analyzer = get_sentiment_analyzer()
+        with ProcessPoolExecutor(max_workers=2, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=init_pool_worker) as pool:
+            results = analyzer.analyze_many(self.TEXTS, chunk_size=4, pool=pool)
+        self.assertEqual(results, [analyzer.analyze(text) for text in self.TEXTS])
+
+
+class ResponseOrchestratorTests(SimpleTestCase):
+    """The LLM reply is used only within budget and a free slot; every outcome is counted"""
+
+    def setUp(self):
+        cache.clear()
+        with mock.patch.dict(os.environ, {'RESPONSE_LLM_WORKERS': '1'}):
+            self.orchestrator = ResponseOrchestrator()
+        self.release = threading.Event()
+        self.addCleanup(self.orchestrator._executor.shutdown)
+        self.addCleanup(self.release.set)
+
+    def slow_llm(self):
+        self.release.wait(5)
+        return 'late'
+
+    def test_llm_wins_within_budget(self):
+        fallback = mock.Mock(return_value='fallback')
+        self.assertEqual(self.orchestrator.generate(lambda: 'llm', fallback, budget=5), 'llm')
+        fallback.assert_called_once()
+        stats = self.orchestrator.stats()
+        self.assertEqual((stats['llm_wins'], stats['total'], stats['llm_win_rate']), (1, 1, 1.0))
+        self.assertIsNotNone(stats['avg_llm_win_latency_ms'])
+
+    def test_budget_exceeded(self):
+        self.assertEqual(self.orchestrator.generate(self.slow_llm, lambda: 'fallback', budget=0.05), 'fallback')
+        self.assertEqual(self.orchestrator.stats()['budget_exceeded'], 1)
+
+    def test_failures(self):
+        def broken():
+            raise ConnectionError('down')
+        self.assertEqual(self.orchestrator.generate(broken, lambda: 'fallback', budget=5), 'fallback')
+        self.assertEqual(self.orchestrator.generate(lambda: '  ', lambda: 'fallback', budget=5), 'fallback')
+        self.assertEqual(self.orchestrator.stats()['llm_failures'], 2)
+
+    def test_saturated_until_the_late_call_finishes(self):
+        self.orchestrator.generate(self.slow_llm, lambda: 'fallback', budget=0.05)
+        llm = mock.Mock(return_value='llm')
+        self.assertEqual(self.orchestrator.generate(llm, lambda: 'fallback', budget=5), 'fallback')
+        llm.assert_not_called()
+        self.assertEqual(self.orchestrator.stats()['llm_saturated'], 1)
+
+        self.release.set()
+        self.orchestrator._executor.submit(lambda: None).result()
+        self.assertEqual(self.orchestrator.generate(llm, lambda: 'fallback', budget=5), 'llm')
+        self.assertEqual(self.orchestrator.stats()['total'], 3)
+
+
+class AnalyticsFrameTests(TestCase):
+    """Frame metrics over stored rollups equal the same aggregates computed by the ORM on raw rows"""
+
+    DAYS = 14
+
+    def setUp(self):
+        self.today = timezone.localdate()
+        self.first_day = self.today - timedelta(days=self.DAYS - 1)
+        self.users = [User.objects.create_user(f'frame{i}', f'frame{i}@example.com', 'pw123456!') for i in range(2)]
+        moods = ['happy', 'sad', 'anxious', 'calm', 'sad']
+        texts = ['Мне тревожно', 'Я плохо сплю', 'Всё хорошо', 'Снова тревожно перед работой']
+        for u, user in enumerate(self.users):
+            for offset in range(0, self.DAYS, 2 + u):
+                day = self.first_day + timedelta(days=offset)
+                noon = timezone.make_aware(datetime.combine(day, time(12)))
+                session = ConversationSession.objects.create(user=user)
+                ConversationSession.objects.filter(pk=session.pk).update(started_at=noon)
+                for n in range(1 + offset % 3):
+                    message = Message.objects.create(
+                        session=session, sender='user', content=texts[(offset + n) % len(texts)],
+                        sentiment_score=round(((offset * 7 + n * 3 + u) % 11) / 5 - 1, 2),
+                        risk_level=(offset + n) % 9,
+                    )
+                    reply = Message.objects.create(session=session, sender='therapist', content='Понимаю')
+                    Message.objects.filter(pk__in=[message.pk, reply.pk]).update(created_at=noon)
+                for n in range(offset % 4):
+                    state = EmotionalState.objects.create(user=user, mood=moods[(offset + n + u) % len(moods)],
+                                                          intensity=1 + (offset * 3 + n) % 10)
+                    EmotionalState.objects.filter(pk=state.pk).update(recorded_at=noon)
+            content = CBTContent.objects.create(title=f'Урок {u}', category='exercises', content='...')
+            CBTProgress.objects.create(user=user, content=content, completed=True,
+                                       completed_at=timezone.now() - timedelta(days=3))
+            for offset in range(self.DAYS):
+                refresh_day(user.id, self.first_day + timedelta(days=offset))
+
+    def test_metrics_match_orm_aggregates(self):
+        start, end = day_bounds(self.first_day, self.today)
+        frame = AnalyticsFrame.load(self.first_day, self.today, [user.id for user in self.users])
+        for user, metrics in zip(frame.user_ids, frame.metrics(self.DAYS, self.today)):
+            messages = Message.objects.filter(user_id=user, created_at__gte=start, created_at__lt=end)
+            moods = EmotionalState.objects.filter(user_id=user, recorded_at__gte=start, recorded_at__lt=end)
+            raw = messages.aggregate(
+                total=Count('id'), user_messages=Count('id', filter=Q(sender='user')),
+                risk_events=Count('id', filter=Q(risk_level__gte=7)),
+                sentiment=Avg('sentiment_score', filter=Q(sender='user')),
+            )
+            mood_raw = moods.aggregate(count=Count('id'), intensity=Avg('intensity'))
+            self.assertEqual(metrics['total_messages'], raw['total'])
+            self.assertEqual(metrics['user_messages'], raw['user_messages'])
+            self.assertEqual(metrics['risk_events'], raw['risk_events'])
+            self.assertAlmostEqual(metrics['avg_sentiment'], raw['sentiment'])
+            self.assertEqual(metrics['total_mood_entries'], mood_raw['count'])
+            self.assertAlmostEqual(metrics['avg_mood_intensity'], mood_raw['intensity'])
+            self.assertEqual(metrics['total_sessions'], ConversationSession.objects.filter(
+                user_id=user, started_at__gte=start, started_at__lt=end).count())
+            self.assertEqual(metrics['total_cbt_completed'], 1)
+
+            per_mood = moods.values('mood').annotate(count=Count('id'), intensity=Avg('intensity'))
+            self.assertEqual(metrics['mood_counts'], {row['mood']: row['count'] for row in per_mood})
+            for row in per_mood:
+                self.assertAlmostEqual(metrics['mood_avg_intensity'][row['mood']], row['intensity'])
+
+            # Pearson correlation of the daily averages, on days with both moods and messages
+            daily_mood, daily_sentiment = defaultdict(list), defaultdict(list)
+            for recorded_at, intensity in moods.values_list('recorded_at', 'intensity'):
+                daily_mood[timezone.localdate(recorded_at)].append(intensity)
+            for created_at, score in messages.filter(sender='user').values_list('created_at', 'sentiment_score'):
+                daily_sentiment[timezone.localdate(created_at)].append(score)
+            days = sorted(set(daily_mood) & set(daily_sentiment))
+            x = [sum(daily_mood[day]) / len(daily_mood[day]) for day in days]
+            y = [sum(daily_sentiment[day]) / len(daily_sentiment[day]) for day in days]
+            self.assertGreaterEqual(len(days), 3)
+            self.assertAlmostEqual(metrics['mood_sentiment_correlation'], float(np.corrcoef(x, y)[0, 1]))
+            self.assertEqual(len(metrics['correlation_data']), len(days))
+            for point, day, intensity, sentiment in zip(metrics['correlation_data'], days, x, y):
+                self.assertEqual(point['date'], day.isoformat())
+                self.assertAlmostEqual(point['mood_intensity'], intensity)
+                self.assertAlmostEqual(point['sentiment'], sentiment)
+
+            themes = Counter()
+            for content in messages.filter(sender='user').values_list('content', flat=True):
+                themes.update(match_keywords(content).get('theme', {}).keys())
+            self.assertEqual({row['theme']: row['count'] for row in metrics['dominant_themes']}, dict(themes))
+
+
+class DownsamplingTests(SimpleTestCase):
+    """Downsampled series keep their endpoints and extremes and never exceed the point budget"""
+
+    def series(self, n, start=None):
+        start = start or timezone.make_aware(datetime(2026, 1, 5))
+        points = [{'at': start + timedelta(minutes=37 * i), 'value': math.sin(i / 9)} for i in range(n)]
+        points[n // 3]['value'] = 5.0
+        return points
+
+    def test_lttb_keeps_endpoints_and_bound(self):
+        points = self.series(1000)
+        for budget in (2, 3, 10, 57, 999, 1000, 5000):
+            kept = lttb(points, budget, itemgetter('at'), itemgetter('value'))
+            self.assertEqual(len(kept), min(budget, len(points)), budget)
+            self.assertIs(kept[0], points[0])
+            self.assertIs(kept[-1], points[-1])
+            self.assertEqual(kept, sorted(kept, key=itemgetter('at')))
+            self.assertEqual(len({id(point) for point in kept}), len(kept))
+            if budget >= 3:
+                self.assertIn(points[len(points) // 3], kept)
+
+    def test_downsample_respects_budget(self):
+        def combine(start, group):
+            return {'at': start if isinstance(start, datetime) else timezone.make_aware(datetime.combine(start, time())),
+                    'value': sum(point['value'] for point in group) / len(group)}
+
+        points = self.series(3000)
+        self.assertEqual(downsample(points[:40], 40, itemgetter('at'), itemgetter('value'), combine),
+                         (points[:40], 'raw'))
+        for budget in (20, 100, 500):
+            kept, resolution = downsample(points, budget, itemgetter('at'), itemgetter('value'), combine)
+            self.assertLessEqual(len(kept), budget)
+            self.assertEqual(resolution, choose_bucket(points[0]['at'], points[-1]['at'], budget))
+            self.assertEqual(bucket_start(kept[0]['at'], resolution), bucket_start(points[0]['at'], resolution))
+            self.assertEqual(bucket_start(kept[-1]['at'], resolution), bucket_start(points[-1]['at'], resolution))
+
+
+class HyperLogLogTests(SimpleTestCase):
+    """Distinct-count sketches stay within the documented error and merge like set unions"""
+
+    def test_relative_error(self):
+        # Ten sketches at each of small, linear-counting-switch and large cardinalities
+        errors = []
+        for n in (1000, 10000, 50000):
+            for k in range(10):
+                errors.append(HyperLogLog.of(f'{n}-{k}-{i}' for i in range(n)).count() / n - 1)
+        rms = math.sqrt(sum(error ** 2 for error in errors) / len(errors))
+        # Standard error of 1.6%, with room for the sampling error of 30 estimates
+        self.assertLess(rms, HYPERLOGLOG_ERROR * 1.25)
+        self.assertLess(max(map(abs, errors)), HYPERLOGLOG_ERROR * 3)
+
+    def test_small_counts_are_exact(self):
+        for n in (0, 1, 2, 10, 50):
+            self.assertEqual(HyperLogLog.of(range(n)).count(), n)
+
+    def test_merge_is_union(self):
+        first, second = HyperLogLog.of(range(0, 6000)), HyperLogLog.of(range(4000, 9000))
+        merged = HyperLogLog.union([first, second])
+        self.assertTrue(np.array_equal(merged.registers, HyperLogLog.of(range(9000)).registers))
+        restored = HyperLogLog.from_bytes(merged.to_bytes())
+        self.assertEqual(restored.count(), merged.count())
+        self.assertLess(abs(merged.count() / 9000 - 1), HYPERLOGLOG_ERROR * 3)
+
+
+class DashboardTimelineTests(TestCase):
+    """Mood entries pick up message sentiment within ±window, also across the period start"""
+
+    def test_window_reaches_before_period_start(self):
+        user = User.objects.create_user('timeline', 'timeline@example.com', 'pw123456!')
+        session = ConversationSession.objects.create(user=user)
+        start = timezone.now() - timedelta(days=1)
+        message = Message.objects.create(session=session, user=user, sender='user', content='плохо',
+                                         sentiment_score=-0.5)
+        Message.objects.filter(pk=message.pk).update(created_at=start - timedelta(minutes=30))
+        state = EmotionalState.objects.create(user=user, mood='sad', intensity=3)
+        EmotionalState.objects.filter(pk=state.pk).update(recorded_at=start + timedelta(minutes=10))
+
+        timeline, resolution = dashboard_timeline(user, start)
+        self.assertEqual(resolution, 'raw')
+        self.assertEqual([entry['related_sentiment'] for entry in timeline], [-0.5])
+
+
+class AdminPeriodParameterTests(TestCase):
+    """Malformed or out-of-range admin query parameters never reach the queries"""
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'pw123456!')
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def test_dashboard_days(self):
+        for days, expected in (('abc', 30), ('0', 1), ('100000', settings.ANALYTICS_MAX_DAYS)):
+            response = self.client.get('/api/admin/dashboard/', {'days': days})
+            self.assertEqual(response.status_code, 200, response.content)
+            self.assertEqual(response.data['period_days'], expected)
+
+    def test_leaderboard_days_and_limit(self):
+        response = self.client.get('/api/admin/leaderboard/', {'days': 'abc', 'limit': '500'})
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.data['period_days'], 30)
+        response = self.client.get('/api/admin/leaderboard/', {'limit': 'ten'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_user_analytics_days(self):
+        for days in ('abc', '-5', '100000'):
+            response = self.client.get(f'/api/admin/users/{self.admin.id}/analytics/', {'days': days})
+            self.assertEqual(response.status_code, 200, response.content)
+
+
+class LeaderboardPagingTests(TestCase):
+    """Leaderboard pages follow (sort value desc, user id desc) without gaps or repeats"""
+
+    # (messages, sessions, risk events) per user, summed over two days
+    TOTALS = [(5, 1, 0), (5, 2, 1), (5, 1, 0), (3, 2, 2), (3, 1, 0), (1, 1, 0)]
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'pw123456!')
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        today = timezone.localdate()
+        self.totals = {}
+        for index, (messages, sessions, risk_events) in enumerate(self.TOTALS):
+            user = User.objects.create_user(f'member{index}', f'member{index}@example.com', 'pw123456!')
+            # Split across days so the ranking sums rollups
+            Analytics.objects.create(user=user, date=today, total_messages=messages - 1,
+                                     total_sessions=sessions, risk_events=risk_events)
+            Analytics.objects.create(user=user, date=today - timedelta(days=1), total_messages=1)
+            self.totals[user.id] = {'messages': messages, 'sessions': sessions, 'risk_events': risk_events}
+
+    def collect(self, sort, limit):
+        rows, pages, params = [], 0, {'sort': sort, 'limit': limit}
+        while True:
+            response = self.client.get('/api/admin/leaderboard/', params)
+            self.assertEqual(response.status_code, 200, response.content)
+            self.assertTrue(response.data['results'])
+            rows += response.data['results']
+            pages += 1
+            if response.data['next_cursor'] is None:
+                return rows, pages
+            params['cursor'] = response.data['next_cursor']
+
+    def expected(self, sort):
+        return sorted(self.totals, key=lambda user_id: (self.totals[user_id][sort], user_id), reverse=True)
+
+    def test_sort_order_and_ties(self):
+        for sort in LEADERBOARD_SORTS:
+            for limit in (1, 2, 4):
+                rows, _ = self.collect(sort, limit)
+                self.assertEqual([row['user_id'] for row in rows], self.expected(sort), (sort, limit))
+                for row in rows:
+                    self.assertEqual(row[sort], self.totals[row['user_id']][sort])
+
+    def test_next_cursor_ends_on_the_last_page(self):
+        # 6 users: an exact multiple of the page size must not leave an empty page behind
+        self.assertEqual(self.collect('messages', 2)[1], 3)
+        self.assertEqual(self.collect('messages', 4)[1], 2)
+        response = self.client.get('/api/admin/leaderboard/', {'limit': 100})
+        self.assertIsNone(response.data['next_cursor'])
+
+    def test_invalid_cursor(self):
+        for cursor in ('garbage', 'WyJhIiwgMV0=', 'WzFd'):
+            response = self.client.get('/api/admin/leaderboard/', {'cursor': cursor})
+            self.assertEqual(response.status_code, 400, cursor)
+
+
+class KeysetPaginationTests(TestCase):
+    """Cursor pages and after_id deltas are contiguous even when timestamps tie"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('pages', 'pages@example.com', 'pw123456!')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        moment = timezone.now() - timedelta(hours=1)
+        self.sessions = [ConversationSession.objects.create(user=self.user) for _ in range(5)]
+        ConversationSession.objects.update(started_at=moment)
+        self.messages = [Message.objects.create(session=self.sessions[0], sender='user', content=f'{i}')
+                         for i in range(7)]
+        # Ties on the timestamp: only the id tie-breaker orders these rows
+        Message.objects.update(created_at=moment)
+
+    def collect(self, url, params):
+        ids, pages = [], 0
+        response = self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, 200, response.content)
+            self.assertEqual(list(response.data), ['next', 'results'])
+            ids += [row['id'] for row in response.data['results']]
+            pages += 1
+            if response.data['next'] is None:
+                return ids, pages
+            response = self.client.get(response.data['next'])
+
+    def test_message_pages(self):
+        ids, pages = self.collect('/api/messages/', {'session': self.sessions[0].id, 'page_size': 3})
+        self.assertEqual(ids, [message.id for message in self.messages])
+        self.assertEqual(pages, 3)
+
+    def test_session_pages_newest_first(self):
+        ids, pages = self.collect('/api/sessions/', {'page_size': 2})
+        self.assertEqual(ids, [session.id for session in reversed(self.sessions)])
+        self.assertEqual(pages, 3)
+
+    def test_after_id(self):
+        anchor = self.messages[2]
+        ids, pages = self.collect(f'/api/sessions/{self.sessions[0].id}/messages/',
+                                  {'after_id': anchor.id, 'page_size': 3})
+        self.assertEqual(ids, [message.id for message in self.messages[3:]])
+        self.assertEqual(pages, 2)
+        ids, _ = self.collect('/api/messages/', {'after_id': self.messages[-1].id})
+        self.assertEqual(ids, [])
+
+    def test_malformed_cursor(self):
+        for cursor in ('garbage', 'WzEsIDJd', 'WyJub3QgYSBkYXRlIiwgMV0='):
+            response = self.client.get('/api/messages/', {'cursor': cursor})
+            self.assertEqual(response.status_code, 404, cursor)
+
+    def test_bad_after_id(self):
+        other = User.objects.create_user('stranger', 'stranger@example.com', 'pw123456!')
+        foreign = Message.objects.create(session=ConversationSession.objects.create(user=other),
+                                         sender='user', content='чужое')
+        for after_id in ('abc', '999999', str(foreign.id)):
+            response = self.client.get('/api/messages/', {'after_id': after_id})
+            self.assertEqual(response.status_code, 400, after_id)
+            self.assertIn('after_id', response.data)
+
+
+class SessionListStatsTests(TestCase):
+    """List annotations match each session's own messages, live or archived, and details cost no archive query"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('stats', 'stats@example.com', 'pw123456!')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        old = timezone.now() - timedelta(days=30 * settings.MESSAGE_ARCHIVE_MONTHS + 10)
+        rows = {
+            'live': [('user', -0.5, 2, 'тревожно'), ('therapist', None, 0, 'Понимаю'), ('user', 0.75, 5, 'лучше')],
+            'archived': [('user', 0.1, 7, 'старое'), ('user', None, 3, 'без оценки'), ('therapist', None, 0, 'x' * 200)],
+            'empty': [],
+        }
+        self.sessions, self.expected = {}, {}
+        for name, messages in rows.items():
+            session = ConversationSession.objects.create(user=self.user, is_active=False)
+            started = old if name == 'archived' else timezone.now() - timedelta(hours=1)
+            ConversationSession.objects.filter(pk=session.pk).update(started_at=started, ended_at=started)
+            for minute, (sender, score, risk, content) in enumerate(messages):
+                message = Message.objects.create(session=session, sender=sender, content=content,
+                                                 sentiment_score=score, risk_level=risk)
+                Message.objects.filter(pk=message.pk).update(created_at=started + timedelta(minutes=minute))
+            created = list(Message.objects.filter(session=session).order_by('created_at', 'id'))
+            scores = [m.sentiment_score for m in created if m.sender == 'user' and m.sentiment_score is not None]
+            self.sessions[name] = session
+            self.expected[session.id] = {
+                'message_count': len(created),
+                'last_message_at': created[-1].created_at if created else None,
+                'last_message_preview': created[-1].content[:120] if created else None,
+                'last_message_sender': created[-1].sender if created else None,
+                'avg_sentiment': sum(scores) / len(scores) if scores else None,
+                'max_risk_level': max(m.risk_level for m in created) if created else None,
+            }
+        self.assertEqual(archive_sessions(), (1, 3))
+
+    def test_list_matches_per_session_values(self):
+        response = self.client.get('/api/sessions/')
+        self.assertEqual(response.status_code, 200)
+        rows = {row['id']: row for row in response.data['results']}
+        self.assertEqual(set(rows), set(self.expected))
+        for session_id, expected in self.expected.items():
+            row = rows[session_id]
+            for field in ('message_count', 'last_message_preview', 'last_message_sender', 'max_risk_level'):
+                self.assertEqual(row[field], expected[field], (session_id, field))
+            if expected['avg_sentiment'] is None:
+                self.assertIsNone(row['avg_sentiment'], session_id)
+            else:
+                self.assertAlmostEqual(row['avg_sentiment'], expected['avg_sentiment'])
+            if expected['last_message_at'] is None:
+                self.assertIsNone(row['last_message_at'], session_id)
+            else:
+                self.assertEqual(parse_datetime(row['last_message_at']), expected['last_message_at'])
+        self.assertFalse(Message.objects.filter(session=self.sessions['archived']).exists())
+
+    def test_detail_queries(self):
+        for name, count in (('live', 3), ('archived', 3), ('empty', 0)):
+            with self.assertNumQueries(2):
+                response = self.client.get(f'/api/sessions/{self.sessions[name].id}/')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data['messages']), count, name)
+
+
+class RedundantIndexTests(TestCase):
+    """Foreign keys led by a composite index have no single-column index of their own"""
+
+    def test_no_single_column_fk_indexes(self):
+        for model, column in ((Message, 'session_id'), (Message, 'user_id'), (ConversationSession, 'user_id'),
+                              (EmotionalState, 'user_id'), (CBTProgress, 'user_id')):
+            with connection.cursor() as cursor:
+                constraints = connection.introspection.get_constraints(cursor, model._meta.db_table)
+            single = [name for name, info in constraints.items()
+                      if info['index'] and not info['unique'] and info['columns'] == [column]
+                      and name not in {index.name for index in model._meta.indexes}]
+            self.assertEqual(single, [], model._meta.db_table)
+
+
+class ArchivedReadTests(TestCase):
+    """Range reads include archived messages without moving them back; opening a conversation restores it"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('archived', 'archived@example.com', 'pw123456!')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.started = timezone.now() - timedelta(days=30 * settings.MESSAGE_ARCHIVE_MONTHS + 10)
+        self.session = ConversationSession.objects.create(user=self.user, is_active=False)
+        ConversationSession.objects.filter(pk=self.session.pk).update(
+            started_at=self.started, ended_at=self.started + timedelta(minutes=20)
+        )
+        for minute, (sender, score, risk) in enumerate([('user', -0.5, 8), ('therapist', None, 0), ('user', 0.25, 1)]):
+            message = Message.objects.create(session=self.session, sender=sender, content='не хочу жить',
+                                             sentiment_score=score, risk_level=risk)
+            Message.objects.filter(pk=message.pk).update(created_at=self.started + timedelta(minutes=minute))
+        self.assertEqual(archive_sessions(), (1, 3))
+
+    def assertStillArchived(self):
+        self.assertFalse(Message.objects.exists())
+        self.assertIsNone(MessageArchive.objects.get(session=self.session).rehydrated_at)
+
+    def test_rollup_counts_archived_messages(self):
+        values = compute_day(self.user.id, timezone.localdate(self.started))
+        self.assertEqual((values['total_messages'], values['user_messages'], values['risk_events']), (3, 2, 1))
+        self.assertAlmostEqual(values['average_sentiment'], -0.125)
+        self.assertStillArchived()
+
+    def test_message_list_restores_only_the_requested_session(self):
+        response = self.client.get('/api/messages/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'], [])
+        self.assertStillArchived()
+
+        response = self.client.get('/api/messages/', {'session': self.session.id})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 3)
+        self.assertIsNotNone(MessageArchive.objects.get(session=self.session).rehydrated_at)
+
+    def test_other_users_archive_is_not_restored(self):
+        other = User.objects.create_user('other', 'other@example.com', 'pw123456!')
+        self.client.force_authenticate(other)
+        response = self.client.get('/api/messages/', {'session': self.session.id})
+        self.assertEqual(response.data['results'], [])
+        self.assertStillArchived()
+
+
+class RollupConsistencyTests(TransactionTestCase):
+    """After every kind of write the stored rollup equals a full recompute from raw rows"""
+
+    def setUp(self):
+        eager = celery_app.conf.task_always_eager
+        celery_app.conf.update(CELERY_TASK_ALWAYS_EAGER=True)
+        self.addCleanup(celery_app.conf.update, CELERY_TASK_ALWAYS_EAGER=eager)
+        self.user = User.objects.create_user('rollup', 'rollup@example.com', 'pw123456!')
+        self.session = ConversationSession.objects.create(user=self.user)
+        self.today = timezone.localdate()
+
+    def assertRollupMatches(self):
+        expected = compute_day(self.user.id, self.today)
+        stored = Analytics.objects.filter(user=self.user, date=self.today).values(*expected).first()
+        if not has_activity(expected):
+            self.assertIsNone(stored)
+            return
+        self.assertIsNotNone(stored)
+        for field, value in expected.items():
+            if isinstance(value, float):
+                self.assertAlmostEqual(stored[field], value, msg=field)
+            else:
+                self.assertEqual(stored[field], value, field)
+
+    def turn(self, text):
+        turn = prepare_turn(self.session, text)
+        persist_turn(self.user, self.session, turn['user_message'], 'Понимаю', turn['state'])
+        return turn['user_message']
+
+    def test_writes_and_deletes(self):
+        first = self.turn('Мне тревожно перед работой')
+        self.assertRollupMatches()
+        self.turn('Я плохо сплю')
+        self.assertRollupMatches()
+        self.assertEqual(Analytics.objects.get(user=self.user).theme_counts, {'тревога': 1, 'грусть': 1})
+
+        # A redelivered task does not count the message twice
+        refresh_daily_analytics(self.user.id, self.today.isoformat(), [first.id])
+        self.assertRollupMatches()
+
+        created = Message.objects.create(session=self.session, sender='user', content='Снова тревожно',
+                                         sentiment_score=-0.4, risk_level=8)
+        self.assertRollupMatches()
+        created.content = 'Всё хорошо'
+        created.save()
+        self.assertRollupMatches()
+        first.delete()
+        self.assertRollupMatches()
+
+        state = EmotionalState.objects.create(user=self.user, mood='anxious', intensity=7)
+        self.assertRollupMatches()
+        content = CBTContent.objects.create(title='Дыхание', category='exercises', content='...')
+        progress = CBTProgress.objects.create(user=self.user, content=content, completed=True,
+                                              completed_at=timezone.now())
+        self.assertRollupMatches()
+        progress.completed, progress.completed_at = False, None
+        progress.save()
+        self.assertRollupMatches()
+        state.delete()
+        self.assertRollupMatches()
+
+        self.session.delete()
+        progress.delete()
+        self.assertRollupMatches()
+        self.assertFalse(Analytics.objects.exists())
+
+
+class ResponseCacheTests(TransactionTestCase):
+    """Cached responses are rebuilt after a committed write to the user's data, and only then"""
+
+    def setUp(self):
+        cache.clear()
+        eager = celery_app.conf.task_always_eager
+        celery_app.conf.update(CELERY_TASK_ALWAYS_EAGER=True)
+        self.addCleanup(celery_app.conf.update, CELERY_TASK_ALWAYS_EAGER=eager)
+        self.user = User.objects.create_user('cached', 'cached@example.com', 'pw123456!')
+        self.builds = 0
+
+    def build(self):
+        self.builds += 1
+        return {'build': self.builds}
+
+    def response(self):
+        return cached_response(self.user.id, 'dashboard', [30], self.build)
+
+    def assertRebuiltAfter(self, write):
+        before = self.response()
+        self.assertEqual(self.response(), before)
+        write()
+        self.assertNotEqual(self.response(), before)
+
+    def test_bump_version(self):
+        self.assertRebuiltAfter(lambda: bump_version(self.user.id))
+        self.assertEqual(self.builds, 2)
+
+    def test_bump_waits_for_commit(self):
+        before = self.response()
+        with transaction.atomic():
+            bump_version(self.user.id)
+            bump_version(self.user.id)
+            self.assertEqual(len(connection.run_on_commit), 1)
+            self.assertEqual(self.response(), before)
+        self.assertNotEqual(self.response(), before)
+
+    def test_other_users_are_unaffected(self):
+        other = User.objects.create_user('other', 'other@example.com', 'pw123456!')
+        before = self.response()
+        bump_version(other.id)
+        self.assertEqual(self.response(), before)
+
+    def test_signal_handlers(self):
+        session = ConversationSession.objects.create(user=self.user)
+        self.assertRebuiltAfter(lambda: Message.objects.create(session=session, sender='user', content='привет'))
+        self.assertRebuiltAfter(lambda: Message.objects.get().delete())
+        self.assertRebuiltAfter(lambda: EmotionalState.objects.create(user=self.user, mood='calm', intensity=5))
+        self.assertRebuiltAfter(lambda: EmotionalState.objects.get().delete())
+        content = CBTContent.objects.create(title='Дневник мыслей', category='exercises', content='...')
+        progress = CBTProgress.objects.create(user=self.user, content=content)
+        progress.completed, progress.completed_at = True, timezone.now()
+        self.assertRebuiltAfter(progress.save)
+        self.assertRebuiltAfter(lambda: ConversationSession.objects.create(user=self.user))
+        self.assertRebuiltAfter(lambda: Analytics.objects.filter(user=self.user).delete())
+
+
+class RescoreMessagesTests(TransactionTestCase):
+    """Rescoring matches live turns and keeps the rollups and cached responses in step"""
+
+    TEXT = 'Вот мои ответы: мне плохо и тревожно'
+
+    def setUp(self):
+        cache.clear()
+        eager = celery_app.conf.task_always_eager
+        celery_app.conf.update(CELERY_TASK_ALWAYS_EAGER=True)
+        self.addCleanup(celery_app.conf.update, CELERY_TASK_ALWAYS_EAGER=eager)
+        self.user = User.objects.create_user('rescore', 'rescore@example.com', 'pw123456!')
+        session = ConversationSession.objects.create(user=self.user)
+        self.message = Message.objects.create(session=session, sender='user', content=self.TEXT,
+                                              sentiment_score=0.9, sentiment_label='positive', risk_level=0)
+
+    def test_rescore(self):
+        day = timezone.localdate(self.message.created_at)
+        self.assertEqual(Analytics.objects.get(user=self.user, date=day).average_sentiment, 0.9)
+        cached = cached_response(self.user.id, 'dashboard', [30], lambda: 'stale')
+
+        call_command('rescore_messages', stdout=StringIO())
+
+        analysis = get_sentiment_analyzer().analyze(self.TEXT)
+        self.message.refresh_from_db()
+        self.assertEqual(self.message.risk_level, min(analysis['risk_level'] + 1, 10))
+        self.assertEqual(self.message.sentiment_score, analysis['sentiment_score'])
+        self.assertEqual(Analytics.objects.get(user=self.user, date=day).average_sentiment,
+                         analysis['sentiment_score'])
+        self.assertNotEqual(cached_response(self.user.id, 'dashboard', [30], lambda: 'fresh'), cached)
+
+
+class BackfillMessageUsersTests(TestCase):
+    """The post-deploy backfill fills every message's user and resumes from its checkpoint"""
+
+    def test_backfill_resumes(self):
+        users = [User.objects.create_user(f'owner{i}', f'owner{i}@example.com', 'pw123456!') for i in range(2)]
+        for user in users:
+            session = ConversationSession.objects.create(user=user)
+            for i in range(3):
+                Message.objects.create(session=session, sender='user', content=f'{i}')
+        Message.objects.update(user=None)
+        ids = list(Message.objects.order_by('id').values_list('id', flat=True))
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        checkpoint = os.path.join(directory.name, 'checkpoint')
+        with open(checkpoint, 'w') as f:
+            f.write(str(ids[1]))
+
+        call_command('backfill_message_users', batch_size=2, checkpoint_file=checkpoint, stdout=StringIO())
+        self.assertEqual(Message.objects.filter(user__isnull=True).count(), 2)
+        with open(checkpoint) as f:
+            self.assertEqual(int(f.read()), ids[-1])
+
+        call_command('backfill_message_users', batch_size=2, start_id=0, stdout=StringIO())
+        self.assertFalse(Message.objects.exclude(user=F('session__user')).exists())
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Message partitioning requires PostgreSQL')
+class MessagePartitionTests(TestCase):
+    """Online conversion of Message to monthly partitions and partition upkeep (runs under make test)"""
+
+    def test_convert_and_maintain(self):
+        user = User.objects.create_user('partitioned', 'partitioned@example.com', 'pw123456!')
+        session = ConversationSession.objects.create(user=user)
+        old = Message.objects.create(session=session, sender='user', content='old')
+        Message.objects.filter(pk=old.pk).update(created_at=timezone.now() - timedelta(days=200))
+        Message.objects.create(session=session, sender='user', content='new')
+
+        self.assertEqual(partitions.convert(batch_size=1), 2)
+        self.assertTrue(partitions.is_partitioned())
+        self.assertEqual(Message.objects.filter(user=user).count(), 2)
+
+        # The id sequence moved to the partitioned table
+        latest = Message.objects.create(session=session, sender='user', content='after')
+        self.assertGreater(latest.id, old.id)
+        self.assertEqual(partitions.ensure_partitions(months_ahead=3), [])
+
+        old_month = partitions.month_start(timezone.localdate(timezone.now() - timedelta(days=200)))
+        self.assertEqual(partitions.drop_empty_partitions(partitions.month_start(old_month, 1)), [])
+        Message.objects.filter(pk=old.pk).delete()
+        self.assertEqual(partitions.drop_empty_partitions(partitions.month_start(old_month, 1)),
+                         [partitions.partition_name(old_month)])
+
+        # The kept unpartitioned copy does not block deleting its users and sessions
+        with connection.cursor() as cursor:
+            cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+        user.delete()
+        self.assertFalse(Message.objects.exists())
@@ -0,0 +1,172 @@
+"""
+Emotional timelines joined with nearby message sentiment
+
+Mood entries and user-message sentiments are each loaded once, time-sorted,
+and joined with a two-pointer sliding window, so a timeline costs a constant
+number of queries instead of several per mood entry. The dashboard timeline
+is downsampled to a fixed point budget.
+"""
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from operator import itemgetter
+from typing import Dict, List, Optional, Sequence, Tuple
+from django.conf import settings
+from .archive import archived_rows
+from .downsampling import downsample
+from .models import EmotionalState, Message
+
+STATE_FIELDS = ('id', 'mood', 'intensity', 'notes', 'recorded_at', 'session_id')
+
+
+def sliding_window_sentiment(times: Sequence[datetime],
+                             messages: Sequence[Tuple[datetime, Optional[float]]],
+                             window: timedelta) -> List[Tuple[Optional[float], int]]:
+    """
+    Average sentiment of messages within ±window of each time
+
+    Both inputs must be sorted by time. Returns (average or None, number of
+    messages in the window, scored or not) per time, in O(len(times) + len(messages)).
+    """
+    results = []
+    lo = hi = 0
+    score_sum = 0.0
+    scored = 0
+    for time in times:
+        # Grow the window up to time + window (inclusive)
+        while hi < len(messages) and messages[hi][0] <= time + window:
+            if messages[hi][1] is not None:
+                score_sum += messages[hi][1]
+                scored += 1
+            hi += 1
+        # Shrink it from the left below time - window
+        while lo < hi and messages[lo][0] < time - window:
+            if messages[lo][1] is not None:
+                score_sum -= messages[lo][1]
+                scored -= 1
+            lo += 1
+        results.append((score_sum / scored if scored else None, hi - lo))
+    return results
+
+
+def _merge_entries(start, entries: List[Dict]) -> Dict:
+    """One dashboard timeline point for all entries of a time bucket"""
+    sentiments = [e['related_sentiment'] for e in entries if e['related_sentiment'] is not None]
+    sessions = {e['related_session_id'] for e in entries}
+    return {
+        'date': start,
+        'mood': Counter(e['mood'] for e in entries).most_common(1)[0][0],
+        'intensity': round(sum(e['intensity'] for e in entries) / len(entries), 1),
+        'notes': '',
+        'related_session_id': sessions.pop() if len(sessions) == 1 else None,
+        'related_sentiment': sum(sentiments) / len(sentiments) if sentiments else None,
+        'entries': len(entries),
+    }
+
+
+def dashboard_timeline(user, start_date, window: timedelta = timedelta(hours=1),
+                       budget: Optional[int] = None) -> Tuple[List[Dict], str]:
+    """
+    Mood entries of the period with the sentiment of any user message within ±window
+
+    At most `budget` points (ANALYTICS_POINT_BUDGET by default): longer
+    periods are bucketed and downsampled. Returns the points and their
+    resolution ('raw', 'hour', 'day' or 'week').
+    """
+    states = list(EmotionalState.objects.filter(
+        user=user,
+        recorded_at__gte=start_date
+    ).order_by('recorded_at').values(*STATE_FIELDS))
+    if not states:
+        return [], 'raw'
+    # The first entry's window may reach back before start_date
+    first, last = states[0]['recorded_at'] - window, states[-1]['recorded_at'] + window
+
+    messages = list(Message.objects.filter(
+        user=user,
+        sender='user',
+        created_at__gte=first,
+        created_at__lte=last
+    ).order_by('created_at').values_list('created_at', 'sentiment_score'))
+    archived = [
+        (row['created_at'], row['sentiment_score'])
+        for row in archived_rows(first, last, user_id=user.id) if row['sender'] == 'user'
+    ]
+    if archived:
+        messages = sorted(messages + archived, key=itemgetter(0))
+
+    windows = sliding_window_sentiment([s['recorded_at'] for s in states], messages, window)
+    timeline = [
+        {
+            'date': state['recorded_at'],
+            'mood': state['mood'],
+            'intensity': state['intensity'],
+            'notes': state['notes'],
+            'related_session_id': state['session_id'],
+            'related_sentiment': sentiment,
+        }
+        for state, (sentiment, _) in zip(states, windows)
+    ]
+    timeline, resolution = downsample(
+        timeline, budget or settings.ANALYTICS_POINT_BUDGET,
+        itemgetter('date'), itemgetter('intensity'), _merge_entries
+    )
+    for entry in timeline:
+        entry['date'] = entry['date'].isoformat()
+    return timeline, resolution
+
+
+def session_timeline(user, start_date, window: timedelta = timedelta(hours=2)) -> List[Dict]:
+    """Mood entries of the period with the sentiment of their own session's messages within ±window"""
+    states = list(EmotionalState.objects.filter(
+        user=user,
+        recorded_at__gte=start_date
+    ).order_by('recorded_at').values(*STATE_FIELDS))
+
+    session_ids = {s['session_id'] for s in states if s['session_id'] is not None}
+    messages_by_session = defaultdict(list)
+    if session_ids:
+        first, last = states[0]['recorded_at'] - window, states[-1]['recorded_at'] + window
+        rows = list(Message.objects.filter(
+            session_id__in=session_ids,
+            sender='user',
+            created_at__gte=first,
+            created_at__lte=last
+        ).order_by('created_at').values_list('session_id', 'created_at', 'sentiment_score'))
+        archived = [
+            (row['session_id'], row['created_at'], row['sentiment_score'])
+            for row in archived_rows(first, last, session_ids=session_ids) if row['sender'] == 'user'
+        ]
+        if archived:
+            rows = sorted(rows + archived, key=itemgetter(1))
+        for session_id, created_at, score in rows:
+            messages_by_session[session_id].append((created_at, score))
+
+    # One sweep per session over that session's (already sorted) states
+    states_by_session = defaultdict(list)
+    for state in states:
+        if state['session_id'] is not None:
+            states_by_session[state['session_id']].append(state)
+    related = {}
+    for session_id, session_states in states_by_session.items():
+        windows = sliding_window_sentiment(
+            [s['recorded_at'] for s in session_states], messages_by_session[session_id], window
+        )
+        for state, result in zip(session_states, windows):
+            related[state['id']] = result
+
+    timeline = []
+    for state in states:
+        data = {
+            'id': state['id'],
+            'mood': state['mood'],
+            'intensity': state['intensity'],
+            'notes': state['notes'],
+            'recorded_at': state['recorded_at'].isoformat(),
+            'session_id': state['session_id'],
+        }
+        sentiment, count = related.get(state['id'], (None, 0))
+        if sentiment is not None:
+            data['related_sentiment'] = sentiment
+            data['related_message_count'] = count
+        timeline.append(data)
+    return timeline
@@ -9,7 +9,7 @@ from .views import (
     delete_account_view
 )
 from .admin_views import (
-    admin_dashboard, admin_user_analytics,
+    admin_dashboard, admin_leaderboard, admin_user_analytics,
     admin_cbt_content, admin_cbt_content_detail,
     admin_crisis_resources, admin_crisis_resources_detail
 )
@@ -39,6 +39,7 @@ urlpatterns = [
     path('subscription/limits/', feature_limits_view, name='feature-limits'),
     # Admin panel routes
     path('admin/dashboard/', admin_dashboard, name='admin-dashboard'),
+    path('admin/leaderboard/', admin_leaderboard, name='admin-leaderboard'),
     path('admin/users/<int:user_id>/analytics/', admin_user_analytics, name='admin-user-analytics'),
     path('admin/cbt-content/', admin_cbt_content, name='admin-cbt-content'),
     path('admin/cbt-content/<int:content_id>/', admin_cbt_content_detail, name='admin-cbt-content-detail'),
@@ -4,10 +4,10 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.models import User
+from django.db.models import Prefetch
 from django.utils import timezone
 from django.conf import settings
 from datetime import timedelta
-from collections import defaultdict, Counter
 import logging
 import os
 import html
@@ -34,25 +34,71 @@ from .models import (
     CBTContent, CBTProgress, Analytics, CrisisResource, Subscription
 )
 from .serializers import (
-    ConversationSessionSerializer, MessageSerializer, EmotionalStateSerializer,
+    ConversationSessionSerializer, ConversationSessionListSerializer, MessageSerializer, EmotionalStateSerializer,
     CBTContentSerializer, CBTProgressSerializer, AnalyticsSerializer,
     CrisisResourceSerializer, VoiceInputSerializer, UserSerializer, RegisterSerializer,
     SubscriptionSerializer
 )
-from .services import SentimentAnalyzer, TherapistResponseGenerator
+from .dashboard import dashboard_metrics
+from .timeline import dashboard_timeline, session_timeline
+from .response_cache import cached_response
+from .archive import archived_messages, rehydrate
+from .pagination import MessagePagination, SessionPagination
+from .engines import get_response_generator
+from .tasks import enqueue, review_session_risk
 from .subscription_utils import (
     get_user_subscription, is_premium_user, can_access_premium_feature,
     get_premium_feature_limits
 )
+from .conversation_utils import (
+    resolve_session, session_limit_payload, prepare_turn,
+    fallback_reply, persist_turn, turn_payload, with_message_stats, add_archived_stats
+)
+
+
+def period_days(request, default: int = 30) -> int:
+    """`days` query parameter clamped to 1..ANALYTICS_MAX_DAYS"""
+    try:
+        days = int(request.query_params.get('days', default))
+    except (TypeError, ValueError):
+        days = default
+    return max(1, min(days, settings.ANALYTICS_MAX_DAYS))
 
 
 class ConversationSessionViewSet(viewsets.ModelViewSet):
-    """ViewSet for conversation sessions"""
+    """
+    ViewSet for conversation sessions
+
+    The list returns compact sessions with message statistics; the full
+    transcript comes with a single session (detail, active) or page by page
+    from the messages sub-resource.
+    """
     serializer_class = ConversationSessionSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = SessionPagination
     
     def get_queryset(self):
-        return ConversationSession.objects.filter(user=self.request.user)
+        queryset = ConversationSession.objects.filter(user=self.request.user)
+        if self.action == 'list':
+            return with_message_stats(queryset)
+        if self.action == 'retrieve':
+            return queryset.select_related('message_archive').prefetch_related(self.transcript())
+        return queryset
+    
+    def paginate_queryset(self, queryset):
+        page = super().paginate_queryset(queryset)
+        if page is not None and self.action == 'list':
+            add_archived_stats(page)
+        return page
+    
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return ConversationSessionListSerializer
+        return super().get_serializer_class()
+    
+    @staticmethod
+    def transcript():
+        return Prefetch('messages', queryset=Message.objects.order_by('created_at', 'id'))
     
     def perform_create(self, serializer):
         # Check session limit for free users
@@ -92,14 +138,12 @@ class ConversationSessionViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['post'])
     def complete_with_summary(self, request, pk=None):
         """Complete session and generate summary/statistics"""
-        from .services import TherapistResponseGenerator
-        
         session = self.get_object()
         if session.user != request.user:
             return Response({'error': 'Permission denied'}, status=status.HTTP_403_FORBIDDEN)
         
-        # Get all messages from this session
-        messages = Message.objects.filter(session=session).order_by('created_at')
+        # Get all messages from this session (from its archive if it was moved to cold storage)
+        messages = list(Message.objects.filter(session=session).order_by('created_at')) or archived_messages(session.id)
         conversation_history = [
             {
                 'sender': msg.sender,
@@ -112,7 +156,7 @@ class ConversationSessionViewSet(viewsets.ModelViewSet):
         ]
         
         # Generate summary using AI model
-        response_generator = TherapistResponseGenerator()
+        response_generator = get_response_generator()
         summary = response_generator.generate_session_summary(conversation_history)
         
         # End session
@@ -120,12 +164,8 @@ class ConversationSessionViewSet(viewsets.ModelViewSet):
         session.ended_at = timezone.now()
         session.save()
         
-        # Update analytics
-        try:
-            analytics, _ = Analytics.objects.get_or_create(user=request.user)
-            # Analytics will be recalculated on next dashboard request
-        except:
-            pass
+        # Review the whole session in the background
+        enqueue(review_session_risk, session.id)
         
         return Response({
             'status': 'session completed',
@@ -138,26 +178,51 @@ class ConversationSessionViewSet(viewsets.ModelViewSet):
         """Get active session"""
         session = ConversationSession.objects.filter(
             user=request.user, is_active=True
-        ).first()
+        ).select_related('message_archive').prefetch_related(self.transcript()).first()
         if session:
             serializer = self.get_serializer(session)
             return Response(serializer.data)
         return Response(None)
+    
+    @action(detail=True, methods=['get'])
+    def messages(self, request, pk=None):
+        """Session transcript, oldest first with cursor pagination (after_id for new turns only)"""
+        session = self.get_object()
+        rehydrate([session.id])
+        paginator = MessagePagination()
+        page = paginator.paginate_queryset(Message.objects.filter(session=session), request, view=self)
+        return paginator.get_paginated_response(MessageSerializer(page, many=True).data)
 
 
 class MessageViewSet(viewsets.ModelViewSet):
-    """ViewSet for messages"""
+    """
+    ViewSet for messages (?session=<id> limits the list to one conversation)
+
+    Messages of archived sessions are only listed with ?session=, which
+    restores that one conversation first.
+    """
     serializer_class = MessageSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = MessagePagination
     
     def get_queryset(self):
         # SECURITY: Only return user's own messages
-        return Message.objects.filter(session__user=self.request.user)
+        queryset = Message.objects.filter(user=self.request.user)
+        session_id = self.request.query_params.get('session')
+        if session_id is not None:
+            try:
+                session_id = int(session_id)
+            except ValueError:
+                from rest_framework.exceptions import ValidationError
+                raise ValidationError({'session': 'Must be an integer'})
+            rehydrate([session_id], user_id=self.request.user.id)
+            queryset = queryset.filter(session_id=session_id)
+        return queryset
     
     def retrieve(self, request, *args, **kwargs):
         """SECURITY: Additional check to ensure user owns the message"""
         instance = self.get_object()
-        if instance.session.user != request.user:
+        if instance.user_id != request.user.id:
             logger.warning(f'⚠ Unauthorized message access attempt: user {request.user.id} tried to access message {instance.id}')
             from rest_framework.exceptions import PermissionDenied
             raise PermissionDenied('You do not have permission to access this message.')
@@ -178,180 +243,42 @@ class VoiceInputViewSet(viewsets.ViewSet):
         text = serializer.validated_data['text']
         session_id = serializer.validated_data.get('session_id')
         
-        # Get or create session
-        if session_id:
-            try:
-                session = ConversationSession.objects.get(id=session_id, user=request.user)
-            except ConversationSession.DoesNotExist:
-                # Check session limit before creating new session
-                if not request.user.is_staff:
-                    limits = get_premium_feature_limits(request.user)
-                    if limits['max_sessions_per_month'] is not None:
-                        now = timezone.now()
-                        start_of_month = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-                        sessions_this_month = ConversationSession.objects.filter(
-                            user=request.user,
-                            started_at__gte=start_of_month
-                        ).count()
-                        
-                        if sessions_this_month >= limits['max_sessions_per_month']:
-                            return Response(
-                                {
-                                    'error': 'Лимит сессий достигнут',
-                                    'message': f'Вы использовали все доступные сессии ({limits["max_sessions_per_month"]} в месяц). Обновитесь до Премиум для неограниченного количества сессий.',
-                                    'upgrade_url': '/subscription',
-                                    'limit_reached': True
-                                },
-                                status=status.HTTP_403_FORBIDDEN
-                            )
-                session = ConversationSession.objects.create(user=request.user)
-        else:
-            session = ConversationSession.objects.filter(
-                user=request.user, is_active=True
-            ).first()
-            if not session:
-                # Check session limit before creating new session
-                if not request.user.is_staff:
-                    limits = get_premium_feature_limits(request.user)
-                    if limits['max_sessions_per_month'] is not None:
-                        now = timezone.now()
-                        start_of_month = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-                        sessions_this_month = ConversationSession.objects.filter(
-                            user=request.user,
-                            started_at__gte=start_of_month
-                        ).count()
-                        
-                        if sessions_this_month >= limits['max_sessions_per_month']:
-                            return Response(
-                                {
-                                    'error': 'Лимит сессий достигнут',
-                                    'message': f'Вы использовали все доступные сессии ({limits["max_sessions_per_month"]} в месяц). Обновитесь до Премиум для неограниченного количества сессий.',
-                                    'upgrade_url': '/subscription',
-                                    'limit_reached': True
-                                },
-                                status=status.HTTP_403_FORBIDDEN
-                            )
-                session = ConversationSession.objects.create(user=request.user)
-        
-        # Check if this is an assessment (contains assessment keywords)
-        is_assessment = any(keyword in text.lower() for keyword in [
-            'тестирование', 'прохожу тест', 'мои ответы', 'вот мои ответы'
-        ])
-        
-        # Analyze sentiment and risk
-        analyzer = SentimentAnalyzer()
-        analysis = analyzer.analyze(text)
-        
-        # If this is an assessment, enhance risk analysis
-        if is_assessment:
-            # Assessments might indicate higher need for support
-            # Check for distress indicators in assessment
-            distress_keywords = ['плохо', 'трудно', 'сложно', 'беспокоит', 'тревож', 'грустн', 'плохое']
-            if any(keyword in text.lower() for keyword in distress_keywords):
-                analysis['risk_level'] = min(analysis['risk_level'] + 1, 10)
-        
-        # Save user message
-        user_message = Message.objects.create(
-            session=session,
-            sender='user',
-            content=text,
-            sentiment_score=analysis['sentiment_score'],
-            sentiment_label=analysis['sentiment_label'],
-            risk_level=analysis['risk_level']
-        )
-        
-        # Link to most recent emotional state if exists (within last hour)
-        recent_state = EmotionalState.objects.filter(
-            user=request.user,
-            recorded_at__gte=timezone.now() - timedelta(hours=1)
-        ).order_by('-recorded_at').first()
-        
-        if recent_state and not recent_state.session:
-            recent_state.session = session
-            recent_state.save()
+        # Get or create session (monthly count only when a new session is needed)
+        session = resolve_session(request.user, session_id)
+        if session is None:
+            return Response(session_limit_payload(request.user), status=status.HTTP_403_FORBIDDEN)
         
-        # Get conversation history for context (last 10 messages)
-        previous_messages = Message.objects.filter(
-            session=session
-        ).order_by('-created_at')[:10]
-        
-        # Prepare history for response generator
-        conversation_history = [
-            {
-                'sender': msg.sender,
-                'content': msg.content,
-                'sentiment_score': msg.sentiment_score,
-                'sentiment_label': msg.sentiment_label,
-                'risk_level': msg.risk_level,
-            }
-            for msg in reversed(previous_messages)  # Reverse to get chronological order
-        ]
+        # Analyze sentiment and risk, build history without re-querying the new message
+        turn = prepare_turn(session, text)
+        analysis = turn['analysis']
         
         # Generate therapist response with context
         try:
-            response_generator = TherapistResponseGenerator()
-            therapist_response = response_generator.generate_response(
+            therapist_response = get_response_generator().generate_response(
                 text, 
                 analysis['sentiment_label'], 
                 analysis['risk_level'],
-                conversation_history=conversation_history,
-                is_assessment=is_assessment
+                conversation_history=turn['conversation_history'],
+                is_assessment=turn['is_assessment'],
+                conversation_state=turn['state']
             )
             
             # Ensure we have a response
             if not therapist_response or len(therapist_response.strip()) == 0:
-                # Fallback response
-                if analysis['risk_level'] >= 7:
-                    therapist_response = "Я понимаю, что тебе сейчас трудно. Я здесь, чтобы помочь. Хочешь поговорить о том, что тебя беспокоит?"
-                elif analysis['sentiment_label'] == 'positive':
-                    therapist_response = "Это замечательно! Расскажи мне больше об этом."
-                elif analysis['sentiment_label'] == 'negative':
-                    therapist_response = "Понимаю тебя. Это важно обсудить. Расскажи мне больше."
-                else:
-                    therapist_response = "Расскажи мне больше о том, что происходит."
+                therapist_response = fallback_reply(analysis)
         except Exception as e:
             logger.error(f"Error generating therapist response: {e}", exc_info=True)
-            # Fallback response on error
-            if analysis['risk_level'] >= 7:
-                therapist_response = "Я понимаю, что тебе сейчас трудно. Я здесь, чтобы помочь."
-            elif analysis['sentiment_label'] == 'positive':
-                therapist_response = "Это замечательно! Расскажи мне больше."
-            elif analysis['sentiment_label'] == 'negative':
-                therapist_response = "Понимаю тебя. Расскажи мне больше."
-            else:
-                therapist_response = "Расскажи мне больше о том, что происходит."
+            therapist_response = fallback_reply(analysis, failed=True)
         
-        # Save therapist message
-        therapist_message = Message.objects.create(
-            session=session,
-            sender='therapist',
-            content=therapist_response
+        # Persist both messages and link the mood in one transaction
+        therapist_message = persist_turn(
+            request.user, session, turn['user_message'], therapist_response, turn['state']
         )
         
-        # Check if response contains lesson recommendation
-        recommended_category = None
-        if '/практики' in therapist_response.lower() or 'практики' in therapist_response.lower():
-            topic = response_generator._analyze_topic(text)
-            category_map = {
-                'anxiety': 'conditions',
-                'depression': 'conditions',
-                'work': 'techniques',
-                'sleep': 'conditions',
-            }
-            recommended_category = category_map.get(topic)
-        
-        response_data = {
-            'session_id': session.id,
-            'user_message': MessageSerializer(user_message).data,
-            'therapist_message': MessageSerializer(therapist_message).data,
-            'analysis': analysis,
-            'risk_detected': analysis['risk_level'] >= 7,
-        }
-        
-        if recommended_category:
-            response_data['recommended_category'] = recommended_category
-        
-        return Response(response_data, status=status.HTTP_200_OK)
+        return Response(
+            turn_payload(session, turn['user_message'], therapist_message, analysis),
+            status=status.HTTP_200_OK
+        )
 
 
 class EmotionalStateViewSet(viewsets.ModelViewSet):
@@ -409,43 +336,15 @@ class EmotionalStateViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def timeline(self, request):
         """Get emotional state timeline with enhanced data"""
-        days = int(request.query_params.get('days', 30))
+        days = period_days(request)
         start_date = timezone.now() - timedelta(days=days)
-        states = EmotionalState.objects.filter(
-            user=request.user,
-            recorded_at__gte=start_date
-        ).order_by('recorded_at')
         
-        # Enhance with related session data
-        enhanced_data = []
-        for state in states:
-            data = {
-                'id': state.id,
-                'mood': state.mood,
-                'intensity': state.intensity,
-                'notes': state.notes,
-                'recorded_at': state.recorded_at.isoformat(),
-                'session_id': state.session.id if state.session else None
-            }
-            
-            # Add related messages if session exists
-            if state.session:
-                related_messages = Message.objects.filter(
-                    session=state.session,
-                    created_at__gte=state.recorded_at - timedelta(hours=2),
-                    created_at__lte=state.recorded_at + timedelta(hours=2)
-                )
-                if related_messages.exists():
-                    user_msgs = related_messages.filter(sender='user')
-                    if user_msgs.exists():
-                        sentiments = [m.sentiment_score for m in user_msgs if m.sentiment_score is not None]
-                        if sentiments:
-                            data['related_sentiment'] = sum(sentiments) / len(sentiments)
-                            data['related_message_count'] = user_msgs.count()
-            
-            enhanced_data.append(data)
-        
-        return Response(enhanced_data)
+        # Enhance with the sentiment of the same session's messages within ±2 hours
+        # (cached until the user's data changes)
+        return Response(cached_response(
+            request.user.id, 'timeline', (days, timezone.localdate()),
+            lambda: session_timeline(request.user, start_date)
+        ))
 
 
 class CBTContentViewSet(viewsets.ReadOnlyModelViewSet):
@@ -601,7 +500,7 @@ class AnalyticsViewSet(viewsets.ReadOnlyModelViewSet):
         limits = get_premium_feature_limits(request.user)
         is_premium = can_access_premium_feature(request.user, 'advanced_analytics')
         
-        days = int(request.query_params.get('days', 30))
+        days = period_days(request)
         start_date = timezone.now() - timedelta(days=days)
         
         # Free tier: limit to 7 days only
@@ -609,238 +508,31 @@ class AnalyticsViewSet(viewsets.ReadOnlyModelViewSet):
             days = 7
             start_date = timezone.now() - timedelta(days=7)
         
-        # Get sessions
-        sessions = ConversationSession.objects.filter(
-            user=request.user,
-            started_at__gte=start_date
-        )
-        
-        # Get messages
-        messages = Message.objects.filter(
-            session__user=request.user,
-            created_at__gte=start_date
-        )
-        
-        # Get emotional states
-        emotional_states = EmotionalState.objects.filter(
-            user=request.user,
-            recorded_at__gte=start_date
-        )
-        
-        # Get CBT progress
-        cbt_progress = CBTProgress.objects.filter(
-            user=request.user,
-            last_accessed__gte=start_date
-        )
-        
-        # Calculate basic metrics
-        total_sessions = sessions.count()
-        total_messages = messages.count()
-        total_mood_entries = emotional_states.count()
-        total_cbt_completed = cbt_progress.filter(completed=True).count()
-        
-        # Calculate average sentiment from messages (weighted by recency)
-        user_messages = messages.filter(sender='user')
-        if user_messages.exists():
-            sentiment_scores = [m.sentiment_score for m in user_messages if m.sentiment_score is not None]
-            if sentiment_scores:
-                avg_sentiment = sum(sentiment_scores) / len(sentiment_scores)
-                # Calculate sentiment trend (recent vs older)
-                recent_messages = user_messages.filter(created_at__gte=timezone.now() - timedelta(days=7))
-                if recent_messages.exists():
-                    recent_scores = [m.sentiment_score for m in recent_messages if m.sentiment_score is not None]
-                    if recent_scores:
-                        recent_avg = sum(recent_scores) / len(recent_scores)
-                        sentiment_trend = recent_avg - avg_sentiment
-                    else:
-                        sentiment_trend = 0
-                else:
-                    sentiment_trend = 0
-            else:
-                avg_sentiment = None
-                sentiment_trend = None
-        else:
-            avg_sentiment = None
-            sentiment_trend = None
-        
-        # Calculate average mood intensity (weighted)
-        if emotional_states.exists():
-            mood_intensities = [state.intensity for state in emotional_states]
-            avg_mood_intensity = sum(mood_intensities) / len(mood_intensities)
-            
-            # Mood distribution
-            mood_counts = {}
-            mood_intensity_sum = {}
-            for state in emotional_states:
-                mood = state.mood
-                mood_counts[mood] = mood_counts.get(mood, 0) + 1
-                mood_intensity_sum[mood] = mood_intensity_sum.get(mood, 0) + state.intensity
-            
-            # Calculate average intensity per mood
-            mood_avg_intensity = {
-                mood: mood_intensity_sum[mood] / mood_counts[mood]
-                for mood in mood_counts.keys()
-            }
-            
-            # Most common mood
-            most_common_mood = max(mood_counts.items(), key=lambda x: x[1])[0] if mood_counts else None
-            
-            # Mood trend (comparing first half vs second half of period)
-            mid_date = start_date + timedelta(days=days/2)
-            early_states = emotional_states.filter(recorded_at__lt=mid_date)
-            late_states = emotional_states.filter(recorded_at__gte=mid_date)
-            
-            if early_states.exists() and late_states.exists():
-                early_avg = sum(s.intensity for s in early_states) / early_states.count()
-                late_avg = sum(s.intensity for s in late_states) / late_states.count()
-                mood_trend = late_avg - early_avg
-            else:
-                mood_trend = 0
-        else:
-            avg_mood_intensity = None
-            mood_counts = {}
-            mood_avg_intensity = {}
-            most_common_mood = None
-            mood_trend = None
-        
-        # Risk events
-        risk_events = messages.filter(risk_level__gte=7).count()
-        high_risk_messages = messages.filter(risk_level__gte=7)
-        
-        # Calculate comprehensive wellness score (0-100)
-        # Combines: mood intensity, sentiment, engagement, progress
-        wellness_score = None
-        if emotional_states.exists() or user_messages.exists():
-            score_components = []
-            
-            # Mood component (0-40 points): higher intensity of positive moods = higher score
-            if emotional_states.exists():
-                mood_scores_map = {
-                    'very_happy': 10, 'happy': 8, 'calm': 7,
-                    'neutral': 5, 'sad': 3, 'anxious': 2,
-                    'angry': 2, 'very_sad': 1
-                }
-                mood_component = 0
-                for state in emotional_states:
-                    base_score = mood_scores_map.get(state.mood, 5)
-                    # Weight by intensity (1-10 scale)
-                    weighted_score = base_score * (state.intensity / 10)
-                    mood_component += weighted_score
-                mood_component = (mood_component / emotional_states.count()) * 4  # Scale to 0-40
-                score_components.append(mood_component)
-            
-            # Sentiment component (0-30 points): positive sentiment = higher score
-            if avg_sentiment is not None:
-                # Convert -1 to 1 range to 0-30
-                sentiment_component = ((avg_sentiment + 1) / 2) * 30
-                score_components.append(sentiment_component)
-            
-            # Engagement component (0-20 points): more sessions and messages = higher score
-            engagement_score = min(total_sessions * 2 + total_messages * 0.5, 20)
-            score_components.append(engagement_score)
-            
-            # Progress component (0-10 points): CBT completion = higher score
-            progress_score = min(total_cbt_completed * 2, 10)
-            score_components.append(progress_score)
-            
-            # Risk penalty: subtract points for high risk events
-            risk_penalty = min(risk_events * 5, 20)
-            
-            wellness_score = max(0, min(100, sum(score_components) - risk_penalty))
-        
-        # Correlation: mood vs sentiment
-        # Find days where both mood and messages exist
-        correlation_data = []
-        if emotional_states.exists() and user_messages.exists():
-            # Group by date
-            daily_moods = defaultdict(list)
-            daily_sentiments = defaultdict(list)
-            
-            for state in emotional_states:
-                date_key = state.recorded_at.date()
-                daily_moods[date_key].append(state.intensity)
-            
-            for msg in user_messages:
-                if msg.sentiment_score is not None:
-                    date_key = msg.created_at.date()
-                    daily_sentiments[date_key].append(msg.sentiment_score)
-            
-            # Find overlapping dates
-            common_dates = set(daily_moods.keys()) & set(daily_sentiments.keys())
-            if common_dates:
-                for date in common_dates:
-                    avg_mood = sum(daily_moods[date]) / len(daily_moods[date])
-                    avg_sent = sum(daily_sentiments[date]) / len(daily_sentiments[date])
-                    correlation_data.append({
-                        'date': date.isoformat(),
-                        'mood_intensity': avg_mood,
-                        'sentiment': avg_sent
-                    })
-        
-        # Emotional timeline with enhanced data
-        emotional_timeline = []
-        for state in emotional_states.order_by('recorded_at'):
-            # Find related session if exists
-            related_session = None
-            if state.session:
-                related_session = state.session.id
-            
-            # Find messages around the same time (within 1 hour)
-            related_messages = messages.filter(
-                created_at__gte=state.recorded_at - timedelta(hours=1),
-                created_at__lte=state.recorded_at + timedelta(hours=1)
-            )
-            related_sentiment = None
-            if related_messages.exists():
-                user_related = related_messages.filter(sender='user')
-                if user_related.exists():
-                    sentiments = [m.sentiment_score for m in user_related if m.sentiment_score is not None]
-                    if sentiments:
-                        related_sentiment = sum(sentiments) / len(sentiments)
-            
-            emotional_timeline.append({
-                'date': state.recorded_at.isoformat(),
-                'mood': state.mood,
-                'intensity': state.intensity,
-                'notes': state.notes,
-                'related_session_id': related_session,
-                'related_sentiment': related_sentiment
-            })
+        # Cached per user, period and tier until the user's data changes
+        today = timezone.localdate()
+        return Response(cached_response(
+            request.user.id, 'dashboard', (days, is_premium, today),
+            lambda: self._dashboard_data(request.user, days, start_date, today, is_premium)
+        ))
+    
+    def _dashboard_data(self, user, days, start_date, today, is_premium):
+        """Dashboard response body (uncached)"""
+        # Past days come from the daily rollups, only today is aggregated from raw rows
+        metrics = dashboard_metrics(user, days, today, detailed=is_premium)
         
-        # Dominant themes from messages (simplified keyword extraction)
-        dominant_themes = []
-        if user_messages.exists():
-            theme_keywords = {
-                'тревога': ['тревож', 'беспоко', 'волную', 'страх', 'паник'],
-                'грусть': ['груст', 'печал', 'плохо', 'подавлен'],
-                'радость': ['рад', 'счастлив', 'хорошо', 'отлично', 'замечательно'],
-                'гнев': ['зло', 'злой', 'раздражен', 'злюсь'],
-                'спокойствие': ['спокоен', 'умиротворен', 'расслаблен'],
-                'работа': ['работа', 'проект', 'задача', 'дедлайн'],
-                'отношения': ['друг', 'семья', 'любов', 'отношен'],
-                'здоровье': ['здоров', 'болезн', 'боль', 'симптом']
-            }
-            
-            theme_counts = Counter()
-            for msg in user_messages:
-                content_lower = msg.content.lower()
-                for theme, keywords in theme_keywords.items():
-                    if any(keyword in content_lower for keyword in keywords):
-                        theme_counts[theme] += 1
-            
-            dominant_themes = [{'theme': theme, 'count': count} 
-                             for theme, count in theme_counts.most_common(5)]
+        # Emotional timeline with the sentiment of messages within ±1 hour (bounded point budget)
+        emotional_timeline, timeline_resolution = dashboard_timeline(user, start_date) if is_premium else ([], 'raw')
         
         response_data = {
-            'total_sessions': total_sessions,
-            'total_messages': total_messages,
-            'total_mood_entries': total_mood_entries,
-            'total_cbt_completed': total_cbt_completed,
-            'average_sentiment': avg_sentiment,
-            'average_mood_intensity': avg_mood_intensity,
-            'mood_distribution': mood_counts,
-            'most_common_mood': most_common_mood,
-            'risk_events': risk_events,
+            'total_sessions': metrics['total_sessions'],
+            'total_messages': metrics['total_messages'],
+            'total_mood_entries': metrics['total_mood_entries'],
+            'total_cbt_completed': metrics['total_cbt_completed'],
+            'average_sentiment': metrics['avg_sentiment'],
+            'average_mood_intensity': metrics['avg_mood_intensity'],
+            'mood_distribution': metrics['mood_counts'],
+            'most_common_mood': metrics['most_common_mood'],
+            'risk_events': metrics['risk_events'],
             'period_days': days,
             'is_premium': is_premium
         }
@@ -848,18 +540,24 @@ class AnalyticsViewSet(viewsets.ReadOnlyModelViewSet):
         # Premium features
         if is_premium:
             response_data.update({
-                'sentiment_trend': sentiment_trend,
-                'mood_trend': mood_trend,
-                'mood_avg_intensity': mood_avg_intensity,
-                'wellness_score': wellness_score,
-                'correlation_data': correlation_data,
-                'dominant_themes': dominant_themes,
+                'sentiment_trend': metrics['sentiment_trend'],
+                'mood_trend': metrics['mood_trend'],
+                'mood_avg_intensity': metrics['mood_avg_intensity'],
+                'wellness_score': metrics['wellness_score'],
+                'correlation_data': metrics['correlation_data'],
+                'mood_sentiment_correlation': metrics['mood_sentiment_correlation'],
+                'dominant_themes': metrics['dominant_themes'],
                 'emotional_timeline': emotional_timeline,
+                # 'raw', or the hour/day/week bucket the series were aggregated to
+                'resolution': {
+                    'emotional_timeline': timeline_resolution,
+                    'correlation_data': metrics['correlation_resolution'],
+                },
             })
         else:
             response_data['upgrade_message'] = 'Обновитесь до Премиум для доступа к расширенной аналитике'
         
-        return Response(response_data)
+        return response_data
 
 
 class CrisisResourceViewSet(viewsets.ReadOnlyModelViewSet):
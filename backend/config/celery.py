@@ -0,0 +1,34 @@
+"""
+Celery application for background work (worker: celery -A config worker)
+"""
+import os
+from functools import lru_cache
+from pathlib import Path
+
+from celery import Celery
+from celery.signals import beat_init, celeryd_init
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+
+app = Celery('config')
+
+# All CELERY_* settings from config/settings.py
+app.config_from_object('django.conf:settings', namespace='CELERY')
+
+# Picks up api/tasks.py
+app.autodiscover_tasks()
+
+
+@lru_cache(maxsize=None)
+def ensure_broker_dirs() -> None:
+    """Create the filesystem broker folders (once per process, no-op for other brokers)"""
+    options = app.conf.broker_transport_options or {}
+    for key in ('data_folder_in', 'data_folder_out', 'processed_folder', 'control_folder'):
+        if options.get(key):
+            Path(options[key]).mkdir(parents=True, exist_ok=True)
+
+
+@celeryd_init.connect
+@beat_init.connect
+def _prepare_broker(**kwargs):
+    ensure_broker_dirs()
@@ -4,6 +4,7 @@ Django settings for mental health app project.
 import os
 import sys
 import logging
+import tempfile
 from pathlib import Path
 from dotenv import load_dotenv
 from django.core.management.utils import get_random_secret_key
@@ -375,7 +376,9 @@ try:
     import redis
     r = redis.Redis(host=REDIS_HOST, port=int(REDIS_PORT), password=REDIS_PASSWORD if REDIS_PASSWORD else None)
     r.ping()
+    REDIS_AVAILABLE = True
 except:
+    REDIS_AVAILABLE = False
     CHANNEL_LAYERS = {
         'default': {
             'BACKEND': 'channels.layers.InMemoryChannelLayer',
@@ -383,6 +386,130 @@ except:
     }
 
 
+# ============================================================================
+# CELERY BROKER AND TASKS
+# ============================================================================
+
+# Broker: explicit CELERY_BROKER_URL, else Redis, else a local filesystem queue
+# (works across processes without Redis: run `celery -A config worker` next to runserver)
+CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL', REDIS_URL if REDIS_AVAILABLE else 'filesystem://localhost//')
+if CELERY_BROKER_URL.startswith('filesystem://'):
+    # Shared by the web and worker processes of this host, outside the source tree;
+    # the folders are created on first use (config.celery.ensure_broker_dirs)
+    CELERY_BROKER_DIR = Path(os.getenv('CELERY_BROKER_DIR', Path(tempfile.gettempdir()) / 'mha111-celery-broker'))
+    CELERY_BROKER_TRANSPORT_OPTIONS = {
+        'data_folder_in': str(CELERY_BROKER_DIR),
+        'data_folder_out': str(CELERY_BROKER_DIR),
+        'processed_folder': str(CELERY_BROKER_DIR / 'processed'),
+        'control_folder': str(CELERY_BROKER_DIR / 'control'),
+        'store_processed': False,
+    }
+CELERY_BROKER_CONNECTION_RETRY_ON_STARTUP = True
+
+# Run tasks inline in the calling process (tests, or no worker at all)
+CELERY_TASK_ALWAYS_EAGER = os.getenv('CELERY_TASK_ALWAYS_EAGER', 'False').lower() in ('true', '1', 'yes')
+CELERY_TASK_EAGER_PROPAGATES = True
+
+# Tasks are idempotent, so acknowledge after completion and redeliver on worker loss
+CELERY_TASK_ACKS_LATE = True
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+CELERY_TASK_IGNORE_RESULT = True
+
+# Turn follow-ups and analytics on separate queues so rollups never delay mood linking
+CELERY_TASK_DEFAULT_QUEUE = 'conversation'
+CELERY_TASK_ROUTES = {
+    'api.tasks.link_emotional_state': {'queue': 'conversation'},
+    'api.tasks.review_session_risk': {'queue': 'conversation'},
+    'api.tasks.refresh_daily_analytics': {'queue': 'analytics'},
+    'api.tasks.refresh_platform_snapshots': {'queue': 'analytics'},
+    'api.tasks.archive_ended_sessions': {'queue': 'analytics'},
+    'api.tasks.create_message_partitions': {'queue': 'analytics'},
+}
+
+# Periodic jobs (celery -A config beat)
+from celery.schedules import crontab
+
+CELERY_BEAT_SCHEDULE = {
+    # Incremental: only the days since the latest admin metrics snapshot are recomputed
+    'refresh-platform-snapshots': {
+        'task': 'api.tasks.refresh_platform_snapshots',
+        'schedule': crontab(minute=10),
+    },
+    'archive-ended-sessions': {
+        'task': 'api.tasks.archive_ended_sessions',
+        'schedule': crontab(hour=3, minute=30),
+    },
+    # Partitions are created months ahead, so a daily check is plenty
+    'create-message-partitions': {
+        'task': 'api.tasks.create_message_partitions',
+        'schedule': crontab(hour=4, minute=0),
+    },
+}
+
+
+# ============================================================================
+# CACHE
+# ============================================================================
+
+# Shared by web and Celery workers, so a write in one process invalidates
+# cached responses in all of them: Redis when reachable, else files on this
+# host. CACHE_BACKEND=locmem gives a per-process cache, the default under
+# `manage.py test` so test runs neither share nor leave behind entries.
+TESTING = len(sys.argv) > 1 and sys.argv[1] == 'test'
+CACHE_BACKEND = os.getenv(
+    'CACHE_BACKEND', 'locmem' if TESTING else 'redis' if REDIS_AVAILABLE else 'file'
+).lower()
+if CACHE_BACKEND == 'redis':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('CACHE_REDIS_URL', REDIS_URL.rsplit('/', 1)[0] + '/1'),
+        }
+    }
+elif CACHE_BACKEND == 'file':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.getenv('CACHE_DIR', str(Path(tempfile.gettempdir()) / 'mha111-cache')),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Lifetime of cached dashboard/timeline responses; entries are also
+# invalidated by a per-user data version on every relevant write
+RESPONSE_CACHE_TIMEOUT = int(os.getenv('RESPONSE_CACHE_TIMEOUT', '600'))
+
+
+# ============================================================================
+# ANALYTICS
+# ============================================================================
+
+# Longest period (days) accepted by the dashboard and timeline endpoints
+ANALYTICS_MAX_DAYS = int(os.getenv('ANALYTICS_MAX_DAYS', '365'))
+
+# Maximum points in the dashboard's emotional_timeline and correlation_data;
+# longer series are bucketed by hour/day/week and downsampled (LTTB)
+ANALYTICS_POINT_BUDGET = int(os.getenv('ANALYTICS_POINT_BUDGET', '200'))
+
+# Messages of sessions ended more than this many months (of 30 days) ago are
+# moved to compressed MessageArchive rows by the nightly archive job; keep it
+# above ANALYTICS_MAX_DAYS so dashboards never read archived ranges
+MESSAGE_ARCHIVE_MONTHS = int(os.getenv('MESSAGE_ARCHIVE_MONTHS', '13'))
+
+
+# ============================================================================
+# NLP ENGINES
+# ============================================================================
+
+# Build SentimentAnalyzer / TherapistResponseGenerator once per worker at startup
+NLP_ENGINE_PRELOAD = os.getenv('NLP_ENGINE_PRELOAD', 'True').lower() in ('true', '1', 'yes')
+
+
 # ============================================================================
 # LOGGING CONFIGURATION
 # ============================================================================
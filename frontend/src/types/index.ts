@@ -112,6 +112,7 @@ export interface DashboardData {
     mood_intensity: number
     sentiment: number
   }>
+  mood_sentiment_correlation?: number | null
   dominant_themes: Array<{
     theme: string
     count: number
@@ -123,7 +124,12 @@ export interface DashboardData {
     notes?: string
     related_session_id?: number
     related_sentiment?: number
+    entries?: number
   }>
+  resolution?: {
+    emotional_timeline: 'raw' | 'hour' | 'day' | 'week'
+    correlation_data: 'raw' | 'hour' | 'day' | 'week'
+  }
   period_days: number
   is_premium?: boolean
   upgrade_message?: string